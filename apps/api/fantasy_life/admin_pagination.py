@@ -0,0 +1,55 @@
+"""
+Admin changelists for tables too large to count.
+
+Every changelist page runs COUNT(*) over the filtered table, which on
+PostgreSQL reads every matching row. EstimatedCountPaginator takes the
+count from the statistics PostgreSQL already keeps: pg_class.reltuples
+for an unfiltered list and the planner's row estimate for a filtered one.
+Small results (up to ADMIN_EXACT_COUNT_LIMIT rows) and other databases
+are counted exactly. An estimate can be off by a few percent, so the last
+page may come up short or empty.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+import json
+
+
+def estimated_count(queryset):
+    """PostgreSQL's estimate of the rows in queryset, or None if it has none."""
+    connection = connections[queryset.db]
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # -1 or 0 until the table is first vacuumed or analyzed
+        return row[0] if row and row[0] > 0 else None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    # Django flattens the one-element list psycopg returns to its element
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class EstimatedCountAdminMixin:
+    """
+    ModelAdmin options for large tables: estimated page counts, and no
+    second COUNT(*) of the whole table next to the filtered one.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fantasy_life.settings')
@@ -19,13 +19,16 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fantasy_life.settings')
 django_asgi_app = get_asgi_application()
 
 # Import routing after django_asgi_app to avoid AppRegistryNotReady error
-# from . import routing
+from . import routing
+from users.authentication import JWTAuthMiddleware
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    # "websocket": AuthMiddlewareStack(
-    #     URLRouter(
-    #         routing.websocket_urlpatterns
-    #     )
-    # ),
+    "websocket": AllowedHostsOriginValidator(
+        JWTAuthMiddleware(
+            URLRouter(
+                routing.websocket_urlpatterns
+            )
+        )
+    ),
 })
@@ -0,0 +1,98 @@
+"""
+Helpers for async read endpoints.
+
+DRF views are synchronous, so under ASGI each request holds a thread of the
+sync_to_async pool for as long as its queries take. The views under
+/api/async/ are plain async Django views instead: they authenticate with
+SnapshotJWTAuthentication.aauthenticate, query through the async ORM and
+return the same JSON as their DRF counterparts, so a slow read only
+suspends a coroutine.
+
+Everything a serializer reads must be loaded (select_related) beforehand:
+lazy queries raise SynchronousOnlyOperation in async code.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from functools import wraps
+
+from users.authentication import SnapshotJWTAuthentication
+from .db_routers import ais_pinned, replica_reads
+
+
+def api_response(data, status=status.HTTP_200_OK, headers=None):
+    """JSON response encoded like DRF's JSONRenderer."""
+    return JsonResponse(
+        data, status=status, headers=headers, encoder=JSONEncoder, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def error_response(exc, authenticate_header=None):
+    """Response for an APIException, shaped like DRF's exception handler."""
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    headers = {}
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED and authenticate_header:
+        headers['WWW-Authenticate'] = authenticate_header
+    return api_response(data, status=exc.status_code, headers=headers)
+
+
+def async_api_view(view):
+    """
+    Wrap an async view taking an authenticated request: sets request.user and
+    request.auth, answers 401 like DRF, and lets reads use a replica unless
+    the user is pinned to the primary.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authentication = SnapshotJWTAuthentication()
+        authenticate_header = authentication.authenticate_header(request)
+        try:
+            user_auth = await authentication.aauthenticate(request)
+            if user_auth is None:
+                raise NotAuthenticated()
+            request.user, request.auth = user_auth
+            if settings.DATABASE_REPLICAS and not await ais_pinned(request.user.pk):
+                with replica_reads():
+                    return await view(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            return error_response(exc, authenticate_header)
+    return wrapper
+
+
+async def paginate(request, queryset, serializer_class):
+    """
+    One page of queryset in DRF's PageNumberPagination format
+    ({count, next, previous, results}), using PAGE_SIZE and ?page=.
+    """
+    page_size = api_settings.PAGE_SIZE
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        raise NotFound('Invalid page.')
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if page > 1 and offset >= count:
+        raise NotFound('Invalid page.')
+
+    rows = [row async for row in queryset[offset:offset + page_size]] if count else []
+    url = request.build_absolute_uri()
+    if page == 1:
+        previous = None
+    elif page == 2:
+        previous = remove_query_param(url, 'page')
+    else:
+        previous = replace_query_param(url, 'page', page - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+        'previous': previous,
+        'results': serializer_class(rows, many=True, context={'request': request}).data,
+    }
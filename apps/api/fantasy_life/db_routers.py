@@ -0,0 +1,140 @@
+"""
+Read replica routing.
+
+DB_REPLICAS lists copies of the default database (hosts for PostgreSQL,
+file paths for SQLite), configured as the replica1..N aliases. Safe-method
+requests to views using ReplicaReadMixin read from a random replica;
+everything else, and every write, uses the primary. Once a request writes,
+its remaining reads go to the primary, and ReplicaPinMiddleware keeps the
+user on the primary for DATABASE_REPLICA_PIN_SECONDS so they read their own
+writes despite replication lag. Pins live in the default cache, so set
+CACHE_URL when running several workers.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+# Whether reads of the current request may use a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+# {'wrote': bool} for the request being handled by ReplicaPinMiddleware
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def pin_cache_key(user_id):
+    return f'replica_pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Send user_id's reads to the primary for the pin window."""
+    cache.set(pin_cache_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(user_id):
+    await cache.aset(pin_cache_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return bool(cache.get(pin_cache_key(user_id)))
+
+
+async def ais_pinned(user_id):
+    return bool(await cache.aget(pin_cache_key(user_id)))
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in the enclosed block use a replica, for views outside DRF."""
+    token = _replica_reads.set(bool(settings.DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Routes flagged reads to replicas and all writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not _replica_reads.get():
+            return None
+        state = _request_state.get()
+        if state is not None and state['wrote']:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Serve GET/HEAD/OPTIONS requests of a DRF view from a replica, unless the
+    user is pinned to the primary after a recent write.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return
+        if request.user.is_authenticated and is_pinned(request.user.pk):
+            return
+        self._replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    """Pins users to the primary after requests that wrote to the database."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        # DRF stores the authenticated user on the underlying request
+        user = getattr(request, 'user', None)
+        if state['wrote'] and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
+
+    async def __acall__(self, request):
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        user = getattr(request, 'user', None)
+        if state['wrote'] and user is not None and user.is_authenticated:
+            await apin_to_primary(user.pk)
+        return response
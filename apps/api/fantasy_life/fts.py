@@ -0,0 +1,71 @@
+"""
+Helpers for SQLite FTS5 shadow tables.
+
+On SQLite, text search runs against FTS5 tables that triggers keep in sync
+with the source table, keyed by the source row id: trigram tables for
+substring search, unicode61 ones for word search. PostgreSQL uses GIN
+indexes on the source table instead.
+"""
+from django.db import connections
+
+
+def fts5_phrase(text):
+    """Quote text as a single FTS5 phrase, matching it as a substring."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts5_match_ids(table, text, limit, using='default'):
+    """Return up to limit rowids of table whose indexed columns contain text."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s LIMIT %s',
+            [fts5_phrase(text), limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_fts5_table(schema_editor, fts_table, source_table, columns, condition='1', watched=None,
+                      tokenize='trigram'):
+    """
+    Create and fill fts_table for source_table, plus the triggers keeping it
+    in sync. columns maps FTS column names to SQL expressions over a row
+    named {row}; only rows matching condition (also using {row}) are
+    indexed. The update trigger fires on changes to the watched columns.
+    tokenize is the FTS5 tokenizer spec.
+
+    SQLite drops triggers when Django rebuilds a table, so migrations that
+    remake source_table must call this again.
+    """
+    names = ', '.join(columns)
+
+    def values(row):
+        return ', '.join(expression.format(row=row) for expression in columns.values())
+
+    def where(row):
+        return condition.format(row=row)
+
+    update_of = f' OF {", ".join(watched)}' if watched else ''
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({names}, tokenize='{tokenize}')",
+        f'DELETE FROM {fts_table}',
+        f'INSERT INTO {fts_table} (rowid, {names}) '
+        f'SELECT id, {values(source_table)} FROM {source_table} WHERE {where(source_table)}',
+        f'DROP TRIGGER IF EXISTS {fts_table}_insert',
+        f'CREATE TRIGGER {fts_table}_insert AFTER INSERT ON {source_table} WHEN {where("new")} BEGIN '
+        f'INSERT INTO {fts_table} (rowid, {names}) VALUES (new.id, {values("new")}); END',
+        f'DROP TRIGGER IF EXISTS {fts_table}_delete',
+        f'CREATE TRIGGER {fts_table}_delete AFTER DELETE ON {source_table} BEGIN '
+        f'DELETE FROM {fts_table} WHERE rowid = old.id; END',
+        f'DROP TRIGGER IF EXISTS {fts_table}_update',
+        f'CREATE TRIGGER {fts_table}_update AFTER UPDATE{update_of} ON {source_table} BEGIN '
+        f'DELETE FROM {fts_table} WHERE rowid = old.id; '
+        f'INSERT INTO {fts_table} (rowid, {names}) SELECT new.id, {values("new")} WHERE {where("new")}; END',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fts5_table(schema_editor, fts_table):
+    for suffix in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {fts_table}')
@@ -0,0 +1,20 @@
+"""
+Serving of uploaded media.
+"""
+from django.conf import settings
+from django.views.static import serve
+
+from users.images import VARIANT_DIR
+
+
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT. Photo variants have content-hashed names,
+    so they are cached for a year; other uploads for MEDIA_CACHE_SECONDS.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(VARIANT_DIR + '/'):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_SECONDS}'
+    return response
@@ -0,0 +1,383 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms keep one shard per thread, so the request path only
+touches thread-owned dicts and never takes a lock; shards are summed when
+the /metrics endpoint is scraped. Gauges are set rarely and use a lock.
+Collectors registered with Registry.add_collector update metrics from other
+sources (such as connection pool statistics) right before each scrape.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bisect import bisect_left
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, callback):
+        """Register callback(), called before every full render to update metrics."""
+        with self._lock:
+            self._collectors.append(callback)
+
+    def render(self, metrics=None):
+        """Return metrics (default: all registered) in Prometheus text format 0.0.4."""
+        if metrics is None:
+            for collector in list(self._collectors):
+                collector()
+        lines = []
+        for metric in list(self._metrics if metrics is None else metrics):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ShardedMetric:
+    """Base class keeping one dict of label values -> state per thread."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self):
+        """Sum the shards; values written during the scrape may be missed."""
+        raise NotImplementedError
+
+
+class Counter(_ShardedMetric):
+    """Monotonic counter."""
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def _merged(self):
+        totals = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def samples(self):
+        for key, value in sorted(self._merged().items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(_ShardedMetric):
+    """Cumulative histogram with fixed upper bounds."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # One counter per bucket, one for +Inf, then the running sum.
+            state = shard[labelvalues] = [0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def _merged(self):
+        totals = {}
+        for shard in list(self._shards):
+            for key, state in list(shard.items()):
+                merged = totals.setdefault(key, [0] * len(state))
+                for index, value in enumerate(list(state)):
+                    merged[index] += value
+        return totals
+
+    def samples(self):
+        for key, state in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(float(state[-1]))}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Gauge:
+    """
+    Value that can go up and down.
+    A callback can be attached to compute the value at scrape time instead.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def set(self, value, *labelvalues):
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, callback):
+        """Register callback() -> {labelvalues tuple: value}, called on every scrape."""
+        self._callbacks.append(callback)
+
+    def samples(self):
+        values = dict(self._values)
+        for callback in self._callbacks:
+            values.update(callback())
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by view action.',
+    ('view', 'action', 'method', 'status'),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in database calls per request.', ('view', 'action'),
+)
+REQUEST_DB_QUERIES = Counter(
+    'http_request_db_queries_total', 'Database statements executed by requests.', ('view', 'action'),
+)
+REQUEST_SERIALIZER_SECONDS = Histogram(
+    'http_request_serializer_seconds', 'Time spent serializing response data per request.',
+    ('view', 'action'),
+)
+JWT_AUTH_SECONDS = Histogram(
+    'jwt_authentication_seconds', 'Time spent authenticating JWT bearer tokens.', ('result',),
+)
+REFRESH_TOKEN_REVOCATIONS = Counter(
+    'refresh_token_revocations_total', 'Rotated refresh tokens by outcome.', ('result',),
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    'password_hash_queue_depth', 'Password hashes waiting for a hashing worker.',
+)
+PASSWORD_HASH_ACTIVE = Gauge(
+    'password_hash_active', 'Password hashes being computed.',
+)
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    'password_hash_wait_seconds', 'Time password hashes spend waiting for a worker.',
+)
+PASSWORD_HASH_REJECTED = Counter(
+    'password_hash_rejected_total', 'Password hashes refused because the queue was full.',
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pooled database connections: open, idle and the maximum.', ('database', 'state'),
+)
+DB_POOL_SATURATION = Gauge(
+    'db_pool_saturation', 'Share of the pool maximum currently checked out.', ('database',),
+)
+DB_POOL_REQUESTS_WAITING = Gauge(
+    'db_pool_requests_waiting', 'Requests waiting for a pooled connection.', ('database',),
+)
+DB_POOL_WAIT_SECONDS = Counter(
+    'db_pool_wait_seconds_total', 'Time spent waiting for pooled connections.', ('database',),
+)
+DB_POOL_ERRORS = Counter(
+    'db_pool_errors_total', 'Requests for a pooled connection that timed out or failed.', ('database',),
+)
+SQLITE_WRITE_QUEUE_DEPTH = Gauge(
+    'sqlite_write_queue_depth', 'Writes waiting for the SQLite write queue.',
+)
+SQLITE_WRITE_WAIT_SECONDS = Histogram(
+    'sqlite_write_wait_seconds', 'Time writes waited for the SQLite write queue.',
+)
+SQLITE_WRITE_TIMEOUTS = Counter(
+    'sqlite_write_timeouts_total', 'Writes that gave up waiting for the SQLite write queue.',
+)
+CREATE_PERIOD_PHASE_SECONDS = Histogram(
+    'create_period_phase_seconds', 'Duration of create_period phases.', ('phase',),
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+
+class RequestStats:
+    """Timings accumulated while one request is being handled."""
+    __slots__ = ('db_seconds', 'db_queries', 'serializer_seconds', 'serializer_depth')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+
+# Context variables follow the request into sync_to_async threads.
+current_request_stats = ContextVar('current_request_stats', default=None)
+
+
+def _time_queries(execute, sql, params, many, context):
+    stats = current_request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - started
+        stats.db_queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Attach the query timer to every new database connection."""
+    if _time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_queries)
+
+
+def pool_stats():
+    """{alias: psycopg pool stats} for databases configured with a pool."""
+    from django.db import connections
+
+    return {
+        alias: connections[alias].pool.get_stats()
+        for alias in connections
+        if connections.settings[alias].get('OPTIONS', {}).get('pool')
+    }
+
+
+def _pool_gauge(gauge, sample):
+    """Set gauge at scrape time from sample(alias, stats) for every pool."""
+    def callback():
+        values = {}
+        for alias, stats in pool_stats().items():
+            values.update(sample(alias, stats))
+        return values
+    gauge.set_function(callback)
+
+
+_pool_gauge(DB_POOL_CONNECTIONS, lambda alias, stats: {
+    (alias, 'open'): stats.get('pool_size', 0),
+    (alias, 'idle'): stats.get('pool_available', 0),
+    (alias, 'max'): stats.get('pool_max', 0),
+})
+_pool_gauge(DB_POOL_SATURATION, lambda alias, stats: {
+    (alias,): (stats.get('pool_size', 0) - stats.get('pool_available', 0)) / max(stats.get('pool_max', 0), 1),
+})
+_pool_gauge(DB_POOL_REQUESTS_WAITING, lambda alias, stats: {(alias,): stats.get('requests_waiting', 0)})
+
+
+def _pool_counter(counter, key, scale=1, registry=REGISTRY):
+    """
+    Before every scrape, add to counter how much the cumulative pool
+    statistic key grew since the previous one, divided by scale.
+    """
+    last = {}
+    lock = threading.Lock()
+
+    def collect():
+        with lock:
+            for alias, stats in pool_stats().items():
+                value = stats.get(key, 0)
+                previous = last.get(alias, 0)
+                last[alias] = value
+                # A pool opened again starts counting from zero
+                delta = value - previous if value >= previous else value
+                counter.inc(alias, amount=delta / scale if scale != 1 else delta)
+    registry.add_collector(collect)
+
+
+_pool_counter(DB_POOL_WAIT_SECONDS, 'requests_wait_ms', scale=1000)
+_pool_counter(DB_POOL_ERRORS, 'requests_errors')
+
+
+class TimedSerializerMixin:
+    """
+    Adds representation time to the current request's serializer time.
+    Only the outermost call is timed, so nested serializers aren't counted twice.
+    """
+
+    def to_representation(self, instance):
+        stats = current_request_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_seconds += time.perf_counter() - started
+            stats.serializer_depth -= 1
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, only reachable from METRICS_ALLOWED_IPS."""
+    if not settings.METRICS_ENABLED or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
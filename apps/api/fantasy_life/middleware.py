@@ -0,0 +1,68 @@
+"""
+Project-wide middleware.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+import time
+
+from .metrics import (
+    REQUEST_SECONDS, REQUEST_DB_SECONDS, REQUEST_DB_QUERIES, REQUEST_SERIALIZER_SECONDS,
+    RequestStats, current_request_stats,
+)
+
+
+def view_labels(view_func, method):
+    """Return (view, action) labels for a resolved view function."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown'), method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method.lower(), method.lower())
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database time and serializer time per view action.
+    Should be first in MIDDLEWARE so the whole stack is timed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = view_labels(view_func, request.method)
+
+    def _record(self, request, response, stats, elapsed):
+        view, action = getattr(request, 'metrics_labels', ('unmatched', ''))
+        REQUEST_SECONDS.observe(elapsed, view, action, request.method, f'{response.status_code // 100}xx')
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, view, action)
+        REQUEST_DB_QUERIES.inc(view, action, amount=stats.db_queries)
+        if stats.serializer_seconds:
+            REQUEST_SERIALIZER_SECONDS.observe(stats.serializer_seconds, view, action)
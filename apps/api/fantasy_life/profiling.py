@@ -0,0 +1,181 @@
+"""
+On-demand profiling of requests and management commands.
+
+A capture records a cProfile call tree plus every SQL statement with its
+timing, and writes them to PROFILING_DIR as <name>.prof (readable with pstats
+or snakeviz) and <name>.json (SQL log and a cumulative-time summary). Only the
+newest PROFILING_MAX_FILES captures are kept.
+"""
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+import cProfile
+import json
+import pstats
+import random
+import re
+import time
+import uuid
+
+
+class ProfileSession:
+    """State collected while a capture is running."""
+
+    def __init__(self, label, metadata):
+        self.label = label
+        self.metadata = metadata
+        self.name = '{}-{}-{}'.format(
+            datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S'),
+            uuid.uuid4().hex[:8],
+            re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60],
+        )
+        self.profile = cProfile.Profile()
+        self.statements = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.elapsed = 0.0
+        self.path = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper recording each SQL statement."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.query_seconds += duration
+            if len(self.statements) < settings.PROFILING_MAX_QUERIES:
+                self.statements.append({
+                    'database': context['connection'].alias,
+                    'sql': sql,
+                    'many': many,
+                    'ms': round(duration * 1000, 3),
+                })
+
+    def save(self):
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f'{self.name}.prof'
+        self.profile.dump_stats(self.path)
+
+        summary = StringIO()
+        pstats.Stats(self.profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(directory / f'{self.name}.json', 'w') as handle:
+            json.dump({
+                'label': self.label,
+                'metadata': self.metadata,
+                'elapsed_ms': round(self.elapsed * 1000, 3),
+                'sql': {
+                    'count': self.query_count,
+                    'total_ms': round(self.query_seconds * 1000, 3),
+                    'statements': self.statements,
+                },
+                'summary': summary.getvalue(),
+            }, handle, indent=2, default=str)
+        prune(directory, settings.PROFILING_MAX_FILES)
+
+
+def prune(directory, keep):
+    """Delete all but the newest keep captures in directory."""
+    captures = sorted(Path(directory).glob('*.prof'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in captures[keep:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.json').unlink(missing_ok=True)
+
+
+@contextmanager
+def capture(label, **metadata):
+    """
+    Profile the enclosed block in the current thread and save the result.
+    metadata can still be updated through the yielded session.
+    """
+    session = ProfileSession(label, metadata)
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(session))
+        started = time.perf_counter()
+        session.profile.enable()
+        try:
+            yield session
+        finally:
+            session.profile.disable()
+            session.elapsed = time.perf_counter() - started
+    session.save()
+
+
+def is_staff_request(request):
+    """Authenticate request with the API authenticators and check is_staff."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    drf_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except APIException:
+            return False
+        if result is not None:
+            return bool(result[0].is_staff)
+    return False
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests that carry PROFILING_HEADER from a staff user, plus a
+    random PROFILING_SAMPLE_RATE share of all requests.
+    Must come after AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        requested = bool(request.headers.get(settings.PROFILING_HEADER))
+        if not self._should_profile(request, requested):
+            return self.get_response(request)
+        return self._profile(request, requested, self.get_response)
+
+    async def __acall__(self, request):
+        requested = bool(request.headers.get(settings.PROFILING_HEADER))
+        if requested:
+            should_profile = await sync_to_async(self._should_profile)(request, requested)
+        else:
+            should_profile = self._should_profile(request, requested)
+        if not should_profile:
+            return await self.get_response(request)
+        # Capture in a worker thread: sync views and async ORM queries of the
+        # request run in that same thread through async_to_sync
+        return await sync_to_async(self._profile)(request, requested, async_to_sync(self.get_response))
+
+    def _profile(self, request, requested, get_response):
+        with capture(f'{request.method} {request.path}', method=request.method,
+                     path=request.get_full_path(), requested=requested) as session:
+            response = get_response(request)
+            session.metadata['status'] = response.status_code
+            user = getattr(request, 'user', None)
+            session.metadata['user_id'] = getattr(user, 'pk', None)
+        if requested:
+            response['X-Profile-Id'] = session.name
+        return response
+
+    def _should_profile(self, request, requested):
+        if not settings.PROFILING_ENABLED:
+            return False
+        if requested:
+            return is_staff_request(request)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
@@ -0,0 +1,10 @@
+"""
+WebSocket URL configuration.
+"""
+from django.urls import path
+
+from wishes.consumers import UserEventsConsumer
+
+websocket_urlpatterns = [
+    path('ws/events/', UserEventsConsumer.as_asgi()),
+]
@@ -50,14 +50,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fantasy_life.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fantasy_life.db_routers.ReplicaPinMiddleware',
+    'fantasy_life.sqlite_concurrent.WriteQueueMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fantasy_life.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'fantasy_life.urls'
@@ -95,6 +99,61 @@ DATABASES = {
         'PORT': os.environ.get('DB_PORT', ''),
     }
 }
+# Decided before SQLITE_CONCURRENT swaps in its own SQLite engine
+DATABASE_IS_SQLITE = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+
+# High-concurrency SQLite (SQLITE_CONCURRENT=True): WAL journal, IMMEDIATE
+# transactions and a per-process single-writer queue where writes wait at
+# most SQLITE_WRITE_QUEUE_TIMEOUT seconds; see fantasy_life.sqlite_concurrent.
+SQLITE_CONCURRENT = DATABASE_IS_SQLITE and os.environ.get('SQLITE_CONCURRENT', 'False') == 'True'
+if SQLITE_CONCURRENT:
+    DATABASES['default']['ENGINE'] = 'fantasy_life.sqlite_concurrent'
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+            'PRAGMA synchronous=NORMAL',
+            f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        ]),
+    }
+SQLITE_WRITE_QUEUE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_QUEUE_TIMEOUT', 10))
+
+# Connection management. DB_POOL=True (PostgreSQL with psycopg 3) keeps a
+# per-process pool of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections that
+# requests borrow for their duration, waiting at most DB_POOL_TIMEOUT seconds.
+# Use it under ASGI, where every request runs in its own thread and
+# persistent connections would be opened per request. Otherwise connections
+# are kept for DB_CONN_MAX_AGE seconds per thread (WSGI, management
+# commands) and checked before reuse when DB_CONN_HEALTH_CHECKS is on.
+if os.environ.get('DB_POOL', 'False') == 'True':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Read replicas: comma-separated hosts (host or host:port, PostgreSQL) or file
+# paths (SQLite) holding copies of the default database. See
+# fantasy_life.db_routers for which reads use them.
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    if DATABASE_IS_SQLITE:
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], **location}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['fantasy_life.db_routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they write
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
 
 
 # Password validation
@@ -133,6 +192,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded media. Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a
+# temporary file instead of being held in memory. Django serves MEDIA_ROOT
+# itself (MEDIA_SERVE) only in development unless told otherwise.
+MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'media'))
+MEDIA_SERVE = os.environ.get('MEDIA_SERVE', str(DEBUG)) == 'True'
+MEDIA_CACHE_SECONDS = int(os.environ.get('MEDIA_CACHE_SECONDS', 3600))
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 256 * 1024))
+PHOTO_VARIANT_WORKERS = int(os.environ.get('PHOTO_VARIANT_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -143,16 +212,25 @@ AUTH_USER_MODEL = 'users.User'
 
 # Password Hashers (Argon2 first)
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'users.hashers.TunedArgon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
 ]
 
+# Argon2 parameters; changing them upgrades stored hashes on the next login
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 102400))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 8))
+
+# Hashing runs on this many threads; beyond the queue limit requests get a 503
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 64))
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.SnapshotJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -166,8 +244,32 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
-    'BLACKLIST_AFTER_ROTATION': True,
+    # Rotated tokens are revoked by users.revocation instead of the blacklist app
+    'BLACKLIST_AFTER_ROTATION': False,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.SnapshotTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.SnapshotTokenRefreshSerializer',
+}
+
+# How long a user's token version may be served from the cache. Bounds how
+# long a deactivated user keeps access when the cache is not shared.
+TOKEN_VERSION_CACHE_SECONDS = int(os.environ.get('TOKEN_VERSION_CACHE_SECONDS', 60))
+
+# Refresh token revocation: Redis when REVOCATION_REDIS_URL is set, otherwise
+# a local SQLite file (only shared by workers on the same host)
+REVOCATION_REDIS_URL = os.environ.get('REVOCATION_REDIS_URL', '')
+REVOCATION_SQLITE_PATH = os.environ.get('REVOCATION_SQLITE_PATH', str(BASE_DIR / 'revocation.sqlite3'))
+REVOCATION_PURGE_SECONDS = int(os.environ.get('REVOCATION_PURGE_SECONDS', 300))
+
+# Cache: Redis when CACHE_URL is set, otherwise per-process memory
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
 }
 
 # CORS Settings
@@ -181,11 +283,48 @@ if not DEBUG:
         raise ValueError('SECRET_KEY must be set in production!')
 
 # Channels Configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [(os.environ.get('REDIS_HOST', 'redis'), int(os.environ.get('REDIS_PORT', 6379)))],
+# CHANNEL_LAYER=memory keeps events inside one process (tests, single worker)
+if os.environ.get('CHANNEL_LAYER', 'redis') == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                "hosts": [(os.environ.get('REDIS_HOST', 'redis'), int(os.environ.get('REDIS_PORT', 6379)))],
+            },
+        },
+    }
+
+# archive_periods moves periods that ended more than this many months ago
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 12))
+
+# Negotiation free-date suggestions (wishes.availability): days indexed ahead
+# of today, and how long a user's calendar may be served from the cache
+AVAILABILITY_HORIZON_DAYS = int(os.environ.get('AVAILABILITY_HORIZON_DAYS', 366))
+AVAILABILITY_CACHE_SECONDS = int(os.environ.get('AVAILABILITY_CACHE_SECONDS', 3600))
+
+# Rows fetched per round trip by data exports (wishes.export)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Admin changelists estimate their row count from PostgreSQL statistics
+# instead of counting once the estimate exceeds this (fantasy_life.admin_pagination)
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+# Metrics (Prometheus text format at /metrics/)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Profiling (off unless PROFILING_ENABLED): staff requests with the
+# PROFILING_HEADER header, plus a random PROFILING_SAMPLE_RATE share of all
+# requests, are profiled to PROFILING_DIR.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_HEADER = os.environ.get('PROFILING_HEADER', 'X-Profile')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 50))
+PROFILING_MAX_QUERIES = int(os.environ.get('PROFILING_MAX_QUERIES', 2000))
@@ -0,0 +1,110 @@
+"""
+SQLite backend for concurrent requests (SQLITE_CONCURRENT=True).
+
+SQLite allows one writer at a time. Plain SQLite reports "database is
+locked" when writers collide, in particular when a transaction that has read
+tries to start writing while another one holds the write lock. This backend:
+
+- applies WAL, busy_timeout, synchronous=NORMAL and mmap_size pragmas on
+  connect (see settings), so readers never block on the writer;
+- starts transactions with BEGIN IMMEDIATE, taking the write lock up front
+  instead of failing on the upgrade;
+- funnels writes from one process through a WriteQueue: a transaction or
+  autocommit write waits for its turn for at most SQLITE_WRITE_QUEUE_TIMEOUT
+  seconds, then fails with WriteQueueTimeout (a 503 through
+  WriteQueueMiddleware) instead of piling up on SQLite's busy handler.
+  Processes sharing the file still coordinate through busy_timeout;
+- runs read_transaction() blocks with BEGIN DEFERRED outside the queue, so
+  they read a WAL snapshot alongside writers instead of waiting for them.
+
+A plain atomic() block can't know up front that it will only read, and one
+that reads before writing can't upgrade a stale snapshot, so it still takes
+the queue and BEGIN IMMEDIATE.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from contextlib import contextmanager
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+import threading
+import time
+
+from fantasy_life.metrics import SQLITE_WRITE_QUEUE_DEPTH, SQLITE_WRITE_WAIT_SECONDS, SQLITE_WRITE_TIMEOUTS
+
+
+class WriteQueueTimeout(OperationalError):
+    """A write waited longer than SQLITE_WRITE_QUEUE_TIMEOUT for its turn."""
+
+
+class WriteQueue:
+    """Lets one thread at a time write to a database file."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        SQLITE_WRITE_QUEUE_DEPTH.inc()
+        started = time.perf_counter()
+        try:
+            acquired = self._lock.acquire(timeout=self.timeout)
+        finally:
+            SQLITE_WRITE_QUEUE_DEPTH.dec()
+        SQLITE_WRITE_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not acquired:
+            SQLITE_WRITE_TIMEOUTS.inc()
+            raise WriteQueueTimeout(f'Waited more than {self.timeout}s to write to the database')
+
+    def release(self):
+        self._lock.release()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(name):
+    """Shared WriteQueue of the database file name."""
+    queue = _queues.get(name)
+    if queue is None:
+        with _queues_lock:
+            queue = _queues.setdefault(name, WriteQueue(settings.SQLITE_WRITE_QUEUE_TIMEOUT))
+    return queue
+
+
+@contextmanager
+def read_transaction(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic() for a block that only reads. On SQLITE_CONCURRENT
+    connections it skips the write queue and starts with BEGIN DEFERRED;
+    writing inside it raises TransactionManagementError. Nested in another
+    atomic block, or on other databases, it is a plain atomic block.
+    """
+    connection = connections[using]
+    if not hasattr(connection, 'write_queue') or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.read_only_transaction = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.read_only_transaction = False
+
+
+class WriteQueueMiddleware(MiddlewareMixin):
+    """Answers requests whose write timed out in the queue with 503."""
+
+    def __init__(self, get_response):
+        if not settings.SQLITE_CONCURRENT:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, WriteQueueTimeout):
+            response = JsonResponse({'detail': 'The server is busy, try again shortly.'}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        return None
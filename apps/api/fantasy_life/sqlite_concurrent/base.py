@@ -0,0 +1,67 @@
+from django.db.backends.sqlite3 import base
+from django.db.transaction import TransactionManagementError
+
+from . import get_write_queue
+
+# Statements allowed in a read_transaction() block
+READ_STATEMENTS = ('BEGIN', 'SELECT', 'WITH', 'EXPLAIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+def _queue_autocommit_writes(execute, sql, params, many, context):
+    """Run writes outside a transaction through the write queue too."""
+    connection = context['connection']
+    if connection.read_only_transaction:
+        if not sql.lstrip().upper().startswith(READ_STATEMENTS):
+            raise TransactionManagementError('Write in a read_transaction() block')
+        return execute(sql, params, many, context)
+    if connection.in_atomic_block or connection._holds_write_queue or sql.lstrip()[:6].upper() == 'SELECT':
+        return execute(sql, params, many, context)
+    connection.write_queue.acquire()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        connection.write_queue.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_queue = get_write_queue(self.settings_dict['NAME'])
+        self._holds_write_queue = False
+        self.read_only_transaction = False
+        self.execute_wrappers.append(_queue_autocommit_writes)
+
+    def _start_transaction_under_autocommit(self):
+        if self.read_only_transaction:
+            self.cursor().execute('BEGIN DEFERRED')
+            return
+        self.write_queue.acquire()
+        self._holds_write_queue = True
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_write_queue()
+            raise
+
+    def _release_write_queue(self):
+        if self._holds_write_queue:
+            self._holds_write_queue = False
+            self.write_queue.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_queue()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_queue()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_queue()
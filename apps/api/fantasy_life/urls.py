@@ -15,16 +15,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from fantasy_life.media import serve_media
+from fantasy_life.metrics import metrics_view
+from users import async_views as users_async
 from users.views import UserViewSet
+from wishes import async_views as wishes_async
 from wishes.views import (
     CategoryViewSet, WishViewSet, MatchViewSet, AssignmentViewSet,
-    NegotiationViewSet, ExecutionViewSet, RankingsViewSet
+    NegotiationViewSet, ExecutionViewSet, RankingsViewSet, ExportViewSet
 )
 
 
@@ -47,11 +52,18 @@ def api_root(request):
             'assignments': '/api/assignments/',
             'negotiations': '/api/negotiations/',
             'executions': '/api/executions/',
+            'export': '/api/export/',
             'rankings': {
                 'most_completed': '/api/rankings/most_completed/',
                 'best_rated': '/api/rankings/best_rated/',
                 'fastest_completion': '/api/rankings/fastest_completion/',
-            }
+            },
+            'async': {
+                'me': '/api/async/users/me/',
+                'assignments': '/api/async/assignments/',
+                'negotiations': '/api/async/negotiations/',
+                'rankings': '/api/async/rankings/{most_completed,best_rated,fastest_completion}/',
+            },
         }
     })
 
@@ -66,11 +78,20 @@ router.register(r'assignments', AssignmentViewSet, basename='assignment')
 router.register(r'negotiations', NegotiationViewSet, basename='negotiation')
 router.register(r'executions', ExecutionViewSet, basename='execution')
 router.register(r'rankings', RankingsViewSet, basename='ranking')
+router.register(r'export', ExportViewSet, basename='export')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api-root'),
     path('api/', include(router.urls)),
+    path('api/async/users/me/', users_async.me, name='async-user-me'),
+    path('api/async/assignments/', wishes_async.assignment_list, name='async-assignment-list'),
+    path('api/async/negotiations/', wishes_async.negotiation_list, name='async-negotiation-list'),
+    path('api/async/rankings/<str:name>/', wishes_async.ranking, name='async-ranking'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
+
+if settings.MEDIA_SERVE:
+    urlpatterns.append(re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'))
@@ -1,16 +1,23 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User
+from django.db import transaction
+from django.db.models import F, Q
+
+from fantasy_life.admin_pagination import EstimatedCountAdminMixin
+from .models import User, invalidate_token_versions
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(EstimatedCountAdminMixin, BaseUserAdmin):
     """Admin configuration for custom User model."""
     
     list_display = ('email', 'nickname', 'is_active', 'is_staff', 'date_joined')
     list_filter = ('is_active', 'is_staff', 'is_superuser', 'is_public_mode_active')
-    search_fields = ('email', 'nickname', 'full_name')
+    # Only shows the search box; get_search_results matches whole values
+    search_fields = ('email', 'nickname')
+    search_help_text = 'Exact email or nickname (no partial or full name matches)'
     ordering = ('-date_joined',)
+    actions = ['activate', 'deactivate', 'revoke_tokens']
     
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -28,3 +35,33 @@ class UserAdmin(BaseUserAdmin):
     )
     
     readonly_fields = ('date_joined', 'last_login')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Unique indexes instead of LIKE '%...%' over every user
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(Q(email=search_term) | Q(nickname=search_term)), False
+
+    @admin.action(description='Activate selected users')
+    def activate(self, request, queryset):
+        self._update_users(request, queryset, is_active=True)
+
+    @admin.action(description='Deactivate selected users')
+    def deactivate(self, request, queryset):
+        self._update_users(request, queryset, is_active=False)
+
+    @admin.action(description='Log selected users out everywhere')
+    def revoke_tokens(self, request, queryset):
+        self._update_users(request, queryset)
+
+    def _update_users(self, request, queryset, **changes):
+        """
+        One UPDATE that also bumps token_version, as User.save() does when
+        is_active changes, so the users' current tokens stop working.
+        """
+        with transaction.atomic():
+            user_ids = list(queryset.values_list('pk', flat=True).order_by())
+            updated = queryset.update(token_version=F('token_version') + 1, **changes)
+            invalidate_token_versions(user_ids)
+        self.message_user(request, f'{updated} users updated.', messages.SUCCESS)
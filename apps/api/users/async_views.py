@@ -0,0 +1,16 @@
+"""
+Async versions of hot user endpoints (see fantasy_life.async_api).
+"""
+from django.views.decorators.http import require_safe
+
+from fantasy_life.async_api import api_response, async_api_view
+from .models import User
+from .serializers import UserSerializer
+
+
+@require_safe
+@async_api_view
+async def me(request):
+    """Get the current user's profile."""
+    user = await User.objects.aget(pk=request.user.pk)
+    return api_response(UserSerializer(user, context={'request': request}).data)
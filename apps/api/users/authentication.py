@@ -0,0 +1,137 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from urllib.parse import parse_qs
+import time
+
+from fantasy_life.metrics import JWT_AUTH_SECONDS
+from .models import User, SnapshotUser, token_version_cache_key
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that records how long each authentication takes."""
+
+    def authenticate(self, request):
+        started = time.perf_counter()
+        result = 'anonymous'
+        try:
+            user_auth = super().authenticate(request)
+            if user_auth is not None:
+                result = 'success'
+            return user_auth
+        except AuthenticationFailed:
+            result = 'failure'
+            raise
+        finally:
+            JWT_AUTH_SECONDS.observe(time.perf_counter() - started, result)
+
+
+def current_token_version(user_id):
+    """
+    Return the user's token_version, or None if the user is missing or
+    inactive. Cached for TOKEN_VERSION_CACHE_SECONDS.
+    """
+    key = token_version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(pk=user_id, is_active=True).values_list('token_version', flat=True).first()
+        # -1 caches "no active user" as well
+        version = -1 if version is None else version
+        cache.set(key, version, settings.TOKEN_VERSION_CACHE_SECONDS)
+    return None if version == -1 else version
+
+
+async def acurrent_token_version(user_id):
+    """current_token_version() for async code."""
+    key = token_version_cache_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = await User.objects.filter(pk=user_id, is_active=True).values_list('token_version', flat=True).afirst()
+        version = -1 if version is None else version
+        await cache.aset(key, version, settings.TOKEN_VERSION_CACHE_SECONDS)
+    return None if version == -1 else version
+
+
+class SnapshotJWTAuthentication(TimedJWTAuthentication):
+    """
+    Builds request.user from the snapshot claims of the access token.
+    Only the token version is checked, through the cache, so deactivating a
+    user or changing their password still revokes access. Tokens without a
+    snapshot fall back to the database lookup.
+    aauthenticate() does the same for async views without blocking the
+    event loop.
+    """
+
+    def get_user(self, validated_token):
+        if 'ver' not in validated_token:
+            return super().get_user(validated_token)
+        if current_token_version(validated_token[api_settings.USER_ID_CLAIM]) != validated_token['ver']:
+            raise AuthenticationFailed('Token is no longer valid.', code='token_not_valid')
+        return self._snapshot_user(validated_token)
+
+    async def aget_user(self, validated_token):
+        if 'ver' not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token)
+        if await acurrent_token_version(validated_token[api_settings.USER_ID_CLAIM]) != validated_token['ver']:
+            raise AuthenticationFailed('Token is no longer valid.', code='token_not_valid')
+        return self._snapshot_user(validated_token)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; takes a plain Django request."""
+        started = time.perf_counter()
+        result = 'anonymous'
+        try:
+            header = self.get_header(request)
+            raw_token = self.get_raw_token(header) if header is not None else None
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            user = await self.aget_user(validated_token)
+            result = 'success'
+            return user, validated_token
+        except AuthenticationFailed:
+            result = 'failure'
+            raise
+        finally:
+            JWT_AUTH_SECONDS.observe(time.perf_counter() - started, result)
+
+    @staticmethod
+    def _snapshot_user(validated_token):
+        adult_on = validated_token.get('adult_on')
+        return SnapshotUser.from_claims(
+            validated_token[api_settings.USER_ID_CLAIM],
+            validated_token['nick'],
+            validated_token['staff'],
+            validated_token['ver'],
+            parse_date(adult_on) if adult_on else None,
+        )
+
+
+class JWTAuthMiddleware:
+    """
+    Channels middleware setting scope['user'] from an access token passed as
+    the ?token= query parameter, since browsers can't set headers on
+    WebSocket requests. Uses the same checks as SnapshotJWTAuthentication.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        scope = dict(scope, user=AnonymousUser())
+        if token:
+            authentication = SnapshotJWTAuthentication()
+            try:
+                validated_token = authentication.get_validated_token(token.encode())
+                user = await authentication.aget_user(validated_token)
+                scope.update(user=user, token_expires_at=validated_token['exp'])
+            except (InvalidToken, AuthenticationFailed):
+                pass
+        return await self.app(scope, receive, send)
@@ -0,0 +1,96 @@
+"""
+Password hashing on a bounded thread pool.
+
+Argon2 keeps a CPU busy for tens of milliseconds per hash. Running every
+hash on a pool of PASSWORD_HASH_WORKERS threads caps how much CPU logins and
+registrations can take from other requests. Once PASSWORD_HASH_QUEUE_LIMIT
+hashes are waiting, new ones are refused with a 503 instead of queueing
+without bound. argon2-cffi releases the GIL while hashing, so the workers run
+in parallel.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import APIException
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from fantasy_life.metrics import (
+    PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_ACTIVE, PASSWORD_HASH_WAIT_SECONDS, PASSWORD_HASH_REJECTED,
+)
+
+
+class HashingOverloaded(APIException):
+    status_code = 503
+    default_detail = 'Too many sign-ins in progress, try again shortly.'
+    default_code = 'hashing_overloaded'
+
+
+class BoundedHashExecutor:
+    """Thread pool that refuses work once queue_limit tasks are waiting."""
+
+    def __init__(self, workers, queue_limit):
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for its result."""
+        with self._lock:
+            if self._queued >= self.queue_limit:
+                PASSWORD_HASH_REJECTED.inc()
+                raise HashingOverloaded()
+            self._queued += 1
+            PASSWORD_HASH_QUEUE_DEPTH.set(self._queued)
+        return self._executor.submit(self._call, time.perf_counter(), fn, args).result()
+
+    def _call(self, submitted, fn, args):
+        PASSWORD_HASH_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            PASSWORD_HASH_QUEUE_DEPTH.set(self._queued)
+            PASSWORD_HASH_ACTIVE.set(self._active)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                PASSWORD_HASH_ACTIVE.set(self._active)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = BoundedHashExecutor(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_LIMIT)
+    return _executor
+
+
+def make_password(password):
+    """Hash password on the executor."""
+    if password is None:
+        # Unusable password, nothing to compute
+        return hashers.make_password(None)
+    return get_executor().run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    is_correct, must_update = hashers.verify_password(password, encoded)
+    return is_correct, hashers.make_password(password) if is_correct and must_update else None
+
+
+def verify_password(password, encoded):
+    """
+    Check password against encoded on the executor.
+    Returns (is_correct, upgraded) where upgraded is a new hash when encoded
+    uses outdated parameters or hasher, otherwise None.
+    """
+    return get_executor().run(_verify, password, encoded)
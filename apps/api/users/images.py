@@ -0,0 +1,103 @@
+"""
+Profile photo variants.
+
+After a photo is saved, fixed-size square WebP and JPEG copies are generated
+on a small background thread pool and recorded in User.photo_variants as
+{size: {format: storage path}}. Variant names include a hash of the source
+image, so their URLs never change content and can be cached forever.
+"""
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from io import BytesIO
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Square edge length in pixels per variant
+VARIANT_SIZES = {
+    'small': 64,
+    'medium': 256,
+    'large': 640,
+}
+
+# Pillow format name and save options per file extension
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'profile_photos/variants'
+
+
+def render_variants(source_name):
+    """Generate all variants of source_name; return {size: {format: path}}."""
+    with default_storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = blake2b(data, digest_size=6).hexdigest()
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        variants = {}
+        for size_name, edge in VARIANT_SIZES.items():
+            resized = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+            variants[size_name] = {}
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                name = f'{VARIANT_DIR}/{stem}-{digest}-{size_name}.{extension}'
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                variants[size_name][extension] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def delete_variants(variants):
+    for formats in (variants or {}).values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def generate_variants(user_id, source_name, stale_variants=None):
+    """
+    Render variants for user_id's photo and store them, unless the photo
+    changed in the meantime. Runs on the worker pool.
+    """
+    from .models import User
+
+    try:
+        variants = render_variants(source_name)
+        updated = User.objects.filter(pk=user_id, photo=source_name).update(photo_variants=variants)
+        if not updated:
+            # Photo replaced or removed while rendering
+            delete_variants(variants)
+        delete_variants(stale_variants)
+    except Exception:
+        logger.exception('Could not generate photo variants for user %s', user_id)
+    finally:
+        connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PHOTO_VARIANT_WORKERS, thread_name_prefix='photo-variants')
+    return _executor
+
+
+def schedule_variants(user_id, source_name, stale_variants=None):
+    """Generate variants in the background once the current transaction commits."""
+    transaction.on_commit(lambda: get_executor().submit(generate_variants, user_id, source_name, stale_variants))
@@ -0,0 +1,39 @@
+"""
+Management command to generate missing profile photo variants.
+"""
+from django.core.management.base import BaseCommand
+from users.images import render_variants, delete_variants
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Generate photo variants for users whose photo has none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Regenerate variants for every user with a photo'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(photo='').exclude(photo__isnull=True)
+        if not options['all']:
+            users = users.filter(photo_variants={})
+
+        generated = failed = 0
+        for user_id, photo, old_variants in users.values_list('id', 'photo', 'photo_variants').iterator():
+            try:
+                variants = render_variants(photo)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'User {user_id}: {exc}')
+                continue
+            User.objects.filter(pk=user_id, photo=photo).update(photo_variants=variants)
+            delete_variants({
+                size: {ext: name for ext, name in formats.items() if name != variants.get(size, {}).get(ext)}
+                for size, formats in old_variants.items()
+            })
+            generated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} users ({failed} failed)'))
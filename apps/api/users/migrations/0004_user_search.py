@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-19 03:44
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from fantasy_life.fts import create_fts5_table, drop_fts5_table
+
+
+USERS_SEARCH_COLUMNS = {
+    'nickname': '{row}.nickname',
+    'full_name': "CASE WHEN {row}.show_full_name THEN {row}.full_name ELSE '' END",
+}
+USERS_SEARCH_CONDITION = '{row}.is_public_mode_active AND {row}.is_active'
+USERS_SEARCH_WATCHED = ('nickname', 'full_name', 'show_full_name', 'is_public_mode_active', 'is_active')
+
+POSTGRES_INDEXES = (
+    # Prefix search on LOWER(nickname) with LIKE 'abc%'
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_nickname_prefix_idx '
+    'ON users (LOWER(nickname) text_pattern_ops) WHERE is_public_mode_active AND is_active',
+    # Substring search with ILIKE / icontains
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_nickname_trgm_idx '
+    'ON users USING gin (UPPER(nickname) gin_trgm_ops) WHERE is_public_mode_active AND is_active',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_full_name_trgm_idx '
+    'ON users USING gin (UPPER(full_name) gin_trgm_ops) WHERE is_public_mode_active AND is_active AND show_full_name',
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for statement in POSTGRES_INDEXES:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        create_fts5_table(
+            schema_editor, 'users_search', 'users',
+            USERS_SEARCH_COLUMNS, USERS_SEARCH_CONDITION, USERS_SEARCH_WATCHED,
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for name in ('users_nickname_prefix_idx', 'users_nickname_trgm_idx', 'users_full_name_trgm_idx'):
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    elif vendor == 'sqlite':
+        drop_fts5_table(schema_editor, 'users_search')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('nickname'), name='users_nickname_lower_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
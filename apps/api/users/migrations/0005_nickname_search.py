@@ -0,0 +1,73 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+from fantasy_life.fts import create_fts5_table
+
+user_search = import_module('users.migrations.0004_user_search')
+
+
+def populate_nickname_search(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    users = list(User.objects.only('id', 'nickname'))
+    for user in users:
+        user.nickname_search = user.nickname.casefold()
+    User.objects.bulk_update(users, ['nickname_search'], batch_size=1000)
+
+
+def restore_search_triggers(apps, schema_editor):
+    # Adding or removing nickname_search remakes the users table on SQLite,
+    # which drops the users_search triggers
+    if schema_editor.connection.vendor == 'sqlite':
+        create_fts5_table(
+            schema_editor, 'users_search', 'users', user_search.USERS_SEARCH_COLUMNS,
+            user_search.USERS_SEARCH_CONDITION, user_search.USERS_SEARCH_WATCHED,
+        )
+
+
+def create_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS users_nickname_prefix_idx')
+        # Prefix search on nickname_search with LIKE 'abc%'
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_nickname_search_prefix_idx '
+            'ON users (nickname_search text_pattern_ops) WHERE is_public_mode_active AND is_active'
+        )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS users_nickname_search_prefix_idx')
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_nickname_prefix_idx '
+            'ON users (LOWER(nickname) text_pattern_ops) WHERE is_public_mode_active AND is_active'
+        )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_user_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='user',
+            name='nickname_search',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(populate_nickname_search, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_nickname_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['nickname_search'], name='users_nickname_search_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -1,6 +1,30 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.base import DEFERRED
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.cache import cache
 from django.utils import timezone
+from datetime import date
+
+from . import hashing, images
+
+
+def adult_on(date_of_birth):
+    """Return the date a user born on date_of_birth turns 18."""
+    try:
+        return date_of_birth.replace(year=date_of_birth.year + 18)
+    except ValueError:
+        # Born on 29 February: adult from 1 March in non-leap years.
+        return date(date_of_birth.year + 18, 3, 1)
+
+
+def token_version_cache_key(user_id):
+    return f'user_token_version:{user_id}'
+
+
+def invalidate_token_versions(user_ids):
+    """Drop cached token versions once the current transaction commits."""
+    keys = [token_version_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
 
 
 class UserManager(BaseUserManager):
@@ -35,12 +59,17 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     email = models.EmailField(unique=True, max_length=255)
     nickname = models.CharField(max_length=50, unique=True)
+    # nickname.casefold(), kept up to date by save(); indexed for prefix search
+    # (users.search). Case folding can triple the length, hence max_length.
+    nickname_search = models.CharField(max_length=150, default='', editable=False)
     date_of_birth = models.DateField(null=True, blank=True)
     
     # Optional profile fields
     full_name = models.CharField(max_length=255, blank=True)
     bio = models.TextField(blank=True)
     photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
+    # Resized copies of photo, {size: {format: path}}; see users.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     # Privacy settings
     show_full_name = models.BooleanField(default=False)
@@ -56,8 +85,15 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(default=timezone.now)
     last_login = models.DateTimeField(null=True, blank=True)
 
+    # Incremented whenever issued tokens must stop working
+    token_version = models.PositiveIntegerField(default=0)
+
     objects = UserManager()
 
+    # Changing any of these invalidates the user's tokens; nickname, is_staff
+    # and date_of_birth are part of the token snapshot (SnapshotUser)
+    TOKEN_VERSION_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser', 'date_of_birth', 'nickname')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['nickname']
 
@@ -65,19 +101,135 @@ class User(AbstractBaseUser, PermissionsMixin):
         db_table = 'users'
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        indexes = [
+            # Nickname prefix search (users.search)
+            models.Index(fields=['nickname_search'], name='users_nickname_search_idx'),
+        ]
+        # Substring search uses the users_search FTS5 table on SQLite, created
+        # by migration 0004. Migrations that remake this table on SQLite drop
+        # its triggers and must call create_fts5_table again.
 
     def __str__(self):
         return self.email
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if fields is None or field.attname in fields:
+                loaded[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded
+
+    def _changed_since_load(self, field):
+        """Whether field differs from the value loaded from the database."""
+        loaded = getattr(self, '_loaded_values', {})
+        if self._state.adding or loaded.get(field, DEFERRED) is DEFERRED:
+            return False
+        return loaded[field] != getattr(self, field)
+
+    def save(self, *args, **kwargs):
+        """
+        Bump token_version when a field in TOKEN_VERSION_FIELDS changed,
+        refold nickname_search, and regenerate photo variants when the photo
+        changed.
+        """
+        update_fields = kwargs.get('update_fields')
+        self.nickname_search = self.nickname.casefold()
+        if update_fields is not None and 'nickname' in update_fields:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'nickname_search'}
+        changed = any(self._changed_since_load(field) for field in self.TOKEN_VERSION_FIELDS)
+        if changed:
+            self.token_version += 1
+            if update_fields is not None:
+                update_fields = kwargs['update_fields'] = {*update_fields, 'token_version'}
+
+        if self._state.adding:
+            photo_changed = bool(self.photo)
+        else:
+            loaded_photo = getattr(self, '_loaded_values', {}).get('photo', DEFERRED)
+            photo_changed = loaded_photo is not DEFERRED and (loaded_photo or '') != (self.photo.name or '')
+        stale_variants = self.photo_variants if photo_changed else None
+        if photo_changed:
+            self.photo_variants = {}
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'photo_variants'}
+
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in self.get_deferred_fields()
+        }
+        self._loaded_values['photo'] = self.photo.name
+        if changed:
+            invalidate_token_versions([self.pk])
+        if photo_changed:
+            if self.photo:
+                images.schedule_variants(self.pk, self.photo.name, stale_variants)
+            elif stale_variants:
+                transaction.on_commit(lambda: images.get_executor().submit(images.delete_variants, stale_variants))
+
+    def set_password(self, raw_password):
+        """Hash raw_password on the bounded hashing executor."""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Verify raw_password on the hashing executor. An outdated hash is
+        replaced directly in the database, which doesn't change token_version.
+        """
+        is_correct, upgraded = hashing.verify_password(raw_password, self.password)
+        if upgraded:
+            type(self)._default_manager.filter(pk=self.pk, password=self.password).update(password=upgraded)
+            self.password = upgraded
+            if hasattr(self, '_loaded_values'):
+                self._loaded_values['password'] = upgraded
+        return is_correct
+
+    @property
+    def adult_on(self):
+        """Date the user turns 18, or None without a date of birth."""
+        if not self.date_of_birth:
+            return None
+        return adult_on(self.date_of_birth)
+
     @property
     def is_adult(self):
         """Check if user is 18 years or older."""
-        if not self.date_of_birth:
-            return False
-        today = timezone.now().date()
-        age = today.year - self.date_of_birth.year
-        if today.month < self.date_of_birth.month or \
-           (today.month == self.date_of_birth.month and today.day < self.date_of_birth.day):
-            age -= 1
-        return age >= 18
+        cutoff = self.adult_on
+        return cutoff is not None and timezone.now().date() >= cutoff
+
+
+class SnapshotUser(User):
+    """
+    User rebuilt from the claims of an access token without a query.
+    The first access to any other field loads all remaining fields at once.
+    """
+    snapshot_fields = ('id', 'nickname', 'is_active', 'is_staff', 'token_version')
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, nickname, is_staff, token_version, adult_on):
+        user = cls.from_db(None, cls.snapshot_fields, (user_id, nickname, True, is_staff, token_version))
+        user._adult_on = adult_on
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred:
+            fields = [*fields, *deferred]
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+    @property
+    def adult_on(self):
+        return self._adult_on
 
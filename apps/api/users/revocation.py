@@ -0,0 +1,117 @@
+"""
+Revocation store for rotated refresh tokens.
+
+Each refresh revokes the presented token's JTI until the token expires
+with one atomic insert-if-absent, whose result tells a replayed token
+(already present) from a fresh one, so a refresh costs one write and no read.
+
+Backends: a Redis sorted set scored by expiry when REVOCATION_REDIS_URL is
+set, otherwise a local SQLite file at REVOCATION_SQLITE_PATH. Expired JTIs
+are purged every REVOCATION_PURGE_SECONDS.
+"""
+from django.conf import settings
+import redis
+import sqlite3
+import threading
+import time
+
+from fantasy_life.metrics import REFRESH_TOKEN_REVOCATIONS
+
+
+class SQLiteBackend:
+    """Revoked JTIs in a local SQLite file, one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, expires_at INTEGER NOT NULL) WITHOUT ROWID'
+        )
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at ON revoked_tokens (expires_at)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def add(self, jti, expires_at):
+        """Store jti; False if it was already there."""
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)', (jti, expires_at)
+        )
+        return cursor.rowcount == 1
+
+    def purge(self, now):
+        self._connection().execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (now,))
+
+
+class RedisBackend:
+    """Revoked JTIs in a Redis sorted set scored by expiry."""
+    key = 'revoked_refresh_tokens'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def add(self, jti, expires_at):
+        """Store jti; False if it was already there."""
+        return self.client.zadd(self.key, {jti: expires_at}, nx=True) == 1
+
+    def purge(self, now):
+        self.client.zremrangebyscore(self.key, '-inf', now)
+
+
+class RevocationStore:
+    """A revocation backend plus periodic purging of expired JTIs."""
+
+    def __init__(self, backend, purge_seconds):
+        self.backend = backend
+        self.purge_seconds = purge_seconds
+        self._purge_lock = threading.Lock()
+        self._next_purge = int(time.time()) + purge_seconds
+
+    def revoke(self, jti, expires_at):
+        """
+        Revoke jti until expires_at (a Unix timestamp).
+        Returns False if it was already revoked, i.e. the token is a replay.
+        """
+        self._maybe_purge()
+        added = self.backend.add(jti, int(expires_at))
+        REFRESH_TOKEN_REVOCATIONS.inc('revoked' if added else 'replay')
+        return added
+
+    def _maybe_purge(self):
+        now = int(time.time())
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        self._next_purge = now + self.purge_seconds
+        threading.Thread(target=self._purge, args=(now,), name='revocation-purge', daemon=True).start()
+
+    def _purge(self, now):
+        try:
+            self.backend.purge(now)
+        finally:
+            self._purge_lock.release()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_revocation_store():
+    """Return the process-wide RevocationStore, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.REVOCATION_REDIS_URL:
+                    backend = RedisBackend(settings.REVOCATION_REDIS_URL)
+                else:
+                    backend = SQLiteBackend(settings.REVOCATION_SQLITE_PATH)
+                _store = RevocationStore(backend, settings.REVOCATION_PURGE_SECONDS)
+    return _store
@@ -0,0 +1,67 @@
+"""
+Nickname search for public-mode partner discovery.
+
+Queries match nickname prefixes through the indexed nickname_search column,
+which User.save() fills with nickname.casefold(), so "ñ" matches "Ñandú" on
+SQLite too, whose LOWER() and LIKE only fold ASCII letters.
+Queries of at least three characters also match substrings of nickname, and
+of full_name where show_full_name is on. That uses trigram GIN indexes on
+PostgreSQL and the users_search FTS5 table on SQLite (see migration 0004).
+"""
+from django.db import connection
+from django.db.models import Q
+
+from fantasy_life.fts import fts5_match_ids
+from .models import User
+
+MIN_TRIGRAM_LENGTH = 3
+
+PUBLIC_FIELDS = (
+    'id', 'nickname', 'full_name', 'show_full_name', 'bio', 'show_bio', 'photo', 'photo_variants', 'show_photo',
+)
+
+
+def public_users():
+    return User.objects.filter(is_public_mode_active=True, is_active=True)
+
+
+def _prefix_ids(query, limit):
+    prefix = query.casefold()
+    users = public_users()
+    if connection.vendor == 'postgresql':
+        # LIKE 'abc%' uses the text_pattern_ops index whatever the collation
+        users = users.filter(nickname_search__startswith=prefix)
+    else:
+        users = users.filter(nickname_search__gte=prefix, nickname_search__lt=prefix + '\U0010ffff')
+    return list(users.order_by('nickname_search').values_list('id', flat=True)[:limit])
+
+
+def _trigram_ids(query, limit):
+    if connection.vendor == 'sqlite':
+        # The FTS table only holds active public-mode users
+        return fts5_match_ids('users_search', query, limit)
+    return list(
+        public_users()
+        .filter(Q(nickname__icontains=query) | Q(show_full_name=True, full_name__icontains=query))
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def search_public_users(query, limit, exclude_id=None):
+    """
+    Return up to limit public-mode users matching query: prefix matches in
+    nickname order first, then substring matches.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    ids = [user_id for user_id in _prefix_ids(query, limit + 1) if user_id != exclude_id]
+    if len(ids) < limit and len(query) >= MIN_TRIGRAM_LENGTH:
+        seen = set(ids)
+        for user_id in _trigram_ids(query, limit + len(ids) + 1):
+            if user_id not in seen and user_id != exclude_id:
+                ids.append(user_id)
+                seen.add(user_id)
+    ids = ids[:limit]
+    users = public_users().only(*PUBLIC_FIELDS).in_bulk(ids)
+    return [users[user_id] for user_id in ids if user_id in users]
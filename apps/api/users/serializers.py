@@ -1,19 +1,60 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import current_token_version
 from .models import User
+from .revocation import get_revocation_store
+from fantasy_life.metrics import TimedSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class PhotoVariantsField(serializers.ReadOnlyField):
+    """URLs of the photo variants, {size: {format: url}}."""
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for size, formats in variants.items():
+            urls[size] = {}
+            for extension, name in formats.items():
+                url = default_storage.url(name)
+                urls[size][extension] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the User model."""
+    photo_variants = PhotoVariantsField()
     
     class Meta:
         model = User
         fields = ('id', 'email', 'nickname', 'date_of_birth', 'full_name', 
-                  'bio', 'photo', 'show_full_name', 'show_bio', 'show_photo',
+                  'bio', 'photo', 'photo_variants', 'show_full_name', 'show_bio', 'show_photo',
                   'is_active', 'is_public_mode_active', 'date_joined')
         read_only_fields = ('id', 'date_joined')
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class PublicUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Profile fields visible to other users, following the privacy settings."""
+    photo_variants = PhotoVariantsField()
+
+    class Meta:
+        model = User
+        fields = ('id', 'nickname', 'full_name', 'bio', 'photo_variants')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not instance.show_full_name:
+            data['full_name'] = ''
+        if not instance.show_bio:
+            data['bio'] = ''
+        if not instance.show_photo:
+            data['photo_variants'] = {}
+        return data
+
+
+class UserRegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for user registration."""
     password = serializers.CharField(write_only=True, min_length=8, style={'input_type': 'password'})
     password_confirm = serializers.CharField(write_only=True, min_length=8, style={'input_type': 'password'})
@@ -31,8 +72,57 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Create a new user with hashed password."""
         validated_data.pop('password_confirm')
-        password = validated_data.pop('password')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
-        return user
+        return User.objects.create_user(**validated_data)
+
+
+def add_snapshot_claims(token, user):
+    """Embed the user fields needed to authenticate without a query."""
+    token['nick'] = user.nickname
+    token['staff'] = user.is_staff
+    token['ver'] = user.token_version
+    # The cutoff date rather than a flag, so the claim stays correct on the 18th birthday
+    adult_on = user.adult_on
+    token['adult_on'] = adult_on.isoformat() if adult_on else None
+    return token
+
+
+class SnapshotTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Login serializer issuing tokens with a user snapshot."""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_snapshot_claims(super().get_token(user), user)
+
+
+class SnapshotTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that rejects tokens of inactive users or an old
+    token_version, and revokes the presented token when rotating so it can't
+    be used again. Every snapshot field is in User.TOKEN_VERSION_FIELDS, so
+    a token whose version is current carries a current snapshot, and the
+    check only needs the cached version.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh[api_settings.USER_ID_CLAIM]
+        if 'ver' in refresh:
+            valid = current_token_version(user_id) == refresh['ver']
+        else:
+            # Tokens issued before snapshots existed get one from the database
+            user = User.objects.filter(pk=user_id, is_active=True).first()
+            valid = user is not None
+            if valid:
+                add_snapshot_claims(refresh, user)
+        if not valid:
+            raise AuthenticationFailed('Token is no longer valid.', code='token_not_valid')
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if not get_revocation_store().revoke(refresh[api_settings.JTI_CLAIM], refresh['exp']):
+                raise AuthenticationFailed('Token has already been used.', code='token_not_valid')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
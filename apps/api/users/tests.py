@@ -1,3 +1,352 @@
-from django.test import TestCase
+from django.contrib.auth import hashers
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from PIL import Image
+from datetime import date
+from io import BytesIO
+from unittest import mock
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from . import hashing, images, revocation
+from fantasy_life.metrics import PASSWORD_HASH_REJECTED
+from .models import User
+from .serializers import PublicUserSerializer
+from .revocation import RevocationStore, SQLiteBackend
+
+
+def use_temporary_revocation_store(test):
+    """Revoke refresh tokens in a file removed after test, not REVOCATION_SQLITE_PATH."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    test.addCleanup(setattr, revocation, '_store', revocation._store)
+    revocation._store = RevocationStore(SQLiteBackend(os.path.join(directory.name, 'revocation.sqlite3')), 3600)
+
+
+class SnapshotAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temporary_revocation_store(self)
+        self.user = User.objects.create_user('alice@example.com', 'alice-pass', nickname='alice')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/token/', {'email': 'alice@example.com', 'password': 'alice-pass'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def me(self, access):
+        return self.client.get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_me_serves_the_stored_profile(self):
+        access = self.login()['access']
+        # A change that leaves the token version alone
+        User.objects.filter(pk=self.user.pk).update(nickname='alice2', bio='Hi')
+        response = self.me(access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['nickname'], response.data['bio']), ('alice2', 'Hi'))
+
+    def test_nickname_change_revokes_tokens(self):
+        tokens = self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/users/{self.user.pk}/', {'nickname': 'alice2'},
+                HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me(tokens['access']).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+        self.assertEqual(self.me(self.login()['access']).data['nickname'], 'alice2')
+
+    def test_profile_edit_keeps_tokens(self):
+        access = self.login()['access']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/users/{self.user.pk}/', {'bio': 'Hi'}, HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.me(access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bio'], 'Hi')
+
+    def test_deactivation_revokes_access(self):
+        tokens = self.login()
+        self.assertEqual(self.me(tokens['access']).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.me(tokens['access']).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    def test_tokens_issued_before_snapshots_use_the_database(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertNotIn('ver', refresh)
+        response = self.me(str(refresh.access_token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['nickname'], 'alice')
+
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['nick'], access['ver']), ('alice', self.user.token_version))
+
+        self.user.is_active = False
+        self.user.save()
+        legacy = RefreshToken.for_user(User.objects.get(pk=self.user.pk))
+        self.assertEqual(self.me(str(legacy.access_token)).status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': str(legacy)}).status_code, 401)
+
+
+class PasswordHashingTests(TestCase):
+    def use_executor(self, executor):
+        original = hashing._executor
+        hashing._executor = executor
+        self.addCleanup(setattr, hashing, '_executor', original)
+
+    def test_full_queue_refuses_work(self):
+        executor = hashing.BoundedHashExecutor(workers=1, queue_limit=1)
+        release = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(executor.run(release.wait))),
+            threading.Thread(target=lambda: results.append(executor.run(lambda: 'queued'))),
+        ]
+        threads[0].start()
+        while not executor._active:
+            time.sleep(0.001)
+        threads[1].start()
+        while not executor._queued:
+            time.sleep(0.001)
+        rejected = sum(PASSWORD_HASH_REJECTED._merged().values())
+        with self.assertRaises(hashing.HashingOverloaded):
+            executor.run(lambda: 'refused')
+        self.assertEqual(sum(PASSWORD_HASH_REJECTED._merged().values()), rejected + 1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertCountEqual(results, [True, 'queued'])
+        self.assertEqual((executor._queued, executor._active), (0, 0))
+
+    def test_overloaded_registration_gets_503(self):
+        self.use_executor(hashing.BoundedHashExecutor(workers=1, queue_limit=0))
+        response = APIClient().post('/api/users/', {
+            'email': 'alice@example.com', 'nickname': 'alice', 'password': 'alice-pass', 'password_confirm': 'alice-pass',
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['detail'].code, 'hashing_overloaded')
+        self.assertFalse(User.objects.exists())
+
+    def test_registration_hashes_once(self):
+        with mock.patch.object(hashers, 'make_password', wraps=hashers.make_password) as make_password:
+            response = APIClient().post('/api/users/', {
+                'email': 'alice@example.com', 'nickname': 'alice',
+                'password': 'alice-pass', 'password_confirm': 'alice-pass',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(make_password.call_count, 1)
+        self.assertTrue(User.objects.get().password.startswith('argon2'))
+
+    def test_outdated_hash_is_upgraded_unless_it_changed(self):
+        user = User.objects.create_user('alice@example.com', nickname='alice')
+        outdated = hashers.make_password('alice-pass', hasher='pbkdf2_sha256')
+        User.objects.filter(pk=user.pk).update(password=outdated)
+        user = User.objects.get(pk=user.pk)
+        self.assertTrue(user.check_password('alice-pass'))
+        stored = User.objects.get(pk=user.pk)
+        self.assertTrue(stored.password.startswith('argon2'))
+        self.assertEqual(stored.password, user.password)
+        self.assertEqual(stored.token_version, user.token_version)
+
+        # A password changed since the hash was read is left alone
+        User.objects.filter(pk=user.pk).update(password=outdated)
+        stale = User.objects.get(pk=user.pk)
+        User.objects.filter(pk=user.pk).update(password=hashers.make_password('new-pass'))
+        self.assertTrue(stale.check_password('alice-pass'))
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('new-pass'))
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.me = self.public('ñu@example.com', 'Ñu')
+        for nickname in ('Ñandú', 'ñame', 'Nando', 'Élodie'):
+            self.public(f'{nickname}@example.com', nickname)
+        self.public('hidden@example.com', 'Ñoño', is_public_mode_active=False)
+        self.public('ana@example.com', 'Ana', full_name='María Ñandú', show_full_name=False)
+        self.public('bea@example.com', 'Bea', full_name='Beatriz Ñandú Paz', show_full_name=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def public(self, email, nickname, **fields):
+        return User.objects.create_user(email, nickname=nickname, is_public_mode_active=fields.pop(
+            'is_public_mode_active', True), **fields)
+
+    def search(self, q, **params):
+        response = self.client.get('/api/users/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [user['nickname'] for user in response.data]
+
+    def test_prefixes_match_whatever_the_case(self):
+        self.assertEqual(self.search('ñ'), ['ñame', 'Ñandú'])
+        self.assertEqual(self.search('ÑA'), ['ñame', 'Ñandú'])
+        self.assertEqual(self.search('él'), ['Élodie'])
+        self.assertEqual(self.search('n'), ['Nando'])
+
+    def test_longer_queries_match_substrings_of_visible_names(self):
+        # Only Bea shows her full name
+        self.assertEqual(self.search('NDÚ'), ['Ñandú', 'Bea'])
+        # Nickname prefixes come first
+        self.assertEqual(self.search('ñan'), ['Ñandú', 'Bea'])
+
+    def test_results_are_limited_and_exclude_the_searcher(self):
+        self.assertEqual(self.search('ñ', limit=1), ['ñame'])
+        self.assertEqual(self.search('  '), [])
+        self.assertEqual(self.search('ñu'), [])
+        self.assertEqual(self.client.get('/api/users/search/', {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+    def test_renames_refold_nickname_search(self):
+        user = User.objects.get(nickname='Nando')
+        user.nickname = 'Ñandito'
+        user.save(update_fields=['nickname'])
+        self.assertEqual(User.objects.get(pk=user.pk).nickname_search, 'ñandito')
+        self.assertEqual(self.search('ÑAN'), ['Ñandito', 'Ñandú', 'Bea'])
+
+    def test_builtin_lower_is_left_alone(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT LOWER('ÑA')")
+            expected = 'ña' if connection.vendor == 'postgresql' else 'Ña'
+            self.assertEqual(cursor.fetchone()[0], expected)
+
+
+class RefreshTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temporary_revocation_store(self)
+        self.user = User.objects.create_user('alice@example.com', 'alice-pass', nickname='alice')
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'email': 'alice@example.com', 'password': 'alice-pass'})
+        self.refresh = response.data['refresh']
+
+    def test_refresh_keeps_the_snapshot_without_reading_the_user(self):
+        first = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(first.status_code, 200)
+        # The token version is cached now
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/token/refresh/', {'refresh': first.data['refresh']})
+        self.assertEqual(response.status_code, 200)
+        for token in (AccessToken(response.data['access']), RefreshToken(response.data['refresh'])):
+            self.assertEqual((token['nick'], token['ver']), ('alice', self.user.token_version))
+
+    def test_snapshot_changes_reject_refresh(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.date_of_birth = date(2000, 5, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': self.refresh}).status_code, 401)
+        response = self.client.post('/api/token/', {'email': 'alice@example.com', 'password': 'alice-pass'})
+        self.assertEqual(AccessToken(response.data['access'])['adult_on'], '2018-05-01')
+
+    def test_replayed_refresh_token_is_rejected(self):
+        first = self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': self.refresh}).status_code, 401)
+        # The rotated token still works once
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': first.data['refresh']}).status_code, 200)
+
+
+class RevocationStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'revocation.sqlite3')
+
+    def store(self):
+        return RevocationStore(SQLiteBackend(self.path), 3600)
+
+    def test_replays_are_rejected_by_every_process(self):
+        now = int(time.time())
+        store, other = self.store(), self.store()
+        self.assertTrue(store.revoke('jti-1', now + 60))
+        self.assertFalse(store.revoke('jti-1', now + 60))
+        self.assertFalse(other.revoke('jti-1', now + 60))
+        self.assertTrue(other.revoke('jti-2', now + 60))
+
+    def test_purge_drops_expired_jtis(self):
+        now = int(time.time())
+        store = self.store()
+        store.revoke('expired', now - 1)
+        store.revoke('current', now + 60)
+
+        store._next_purge = 0
+        store._maybe_purge()
+        for thread in threading.enumerate():
+            if thread.name == 'revocation-purge':
+                thread.join()
+        self.assertFalse(store.revoke('current', now + 60))
+        # An expired JTI may be revoked again by a new token that reuses it
+        self.assertTrue(store.revoke('expired', now + 60))
+
+
+class PhotoVariantTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(self.wait_for_variants)
+        self.user = User.objects.create_user('alice@example.com', nickname='alice')
+
+    def wait_for_variants(self):
+        if images._executor is not None:
+            images._executor.shutdown(wait=True)
+            images._executor = None
+
+    def photo(self, name, size=(800, 400), color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_square_webp_and_jpeg(self):
+        source = default_storage.save('profile_photos/alice.png', self.photo('alice.png'))
+        variants = images.render_variants(source)
+        self.assertEqual(set(variants), set(images.VARIANT_SIZES))
+        for size, formats in variants.items():
+            self.assertEqual(set(formats), {'webp', 'jpg'})
+            for extension, name in formats.items():
+                with default_storage.open(name) as file, Image.open(file) as image:
+                    edge = images.VARIANT_SIZES[size]
+                    self.assertEqual((image.format, image.size), (images.VARIANT_FORMATS[extension][0], (edge, edge)))
+        # Names change with the content of the source only
+        self.assertEqual(images.render_variants(source), variants)
+
+    def test_saving_a_photo_renders_variants_in_the_background(self):
+        self.user.photo = self.photo('alice.png')
+        self.user.save()
+        self.wait_for_variants()
+        self.user.refresh_from_db()
+        first = self.user.photo_variants
+        self.assertEqual(set(first), set(images.VARIANT_SIZES))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        urls = client.get('/api/users/me/').data['photo_variants']
+        self.assertEqual(urls['small']['webp'], f'http://testserver/media/{first["small"]["webp"]}')
+        self.assertEqual(PublicUserSerializer(self.user).data['photo_variants']['large']['jpg'],
+                         f'/media/{first["large"]["jpg"]}')
+        self.user.show_photo = False
+        self.assertEqual(PublicUserSerializer(self.user).data['photo_variants'], {})
+
+        # A new photo replaces the variants and deletes the old files
+        self.user.photo = self.photo('alice2.png', color='blue')
+        self.user.save()
+        self.assertEqual(self.user.photo_variants, {})
+        self.wait_for_variants()
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.photo_variants, first)
+        self.assertFalse(default_storage.exists(first['small']['webp']))
+        self.assertTrue(default_storage.exists(self.user.photo_variants['small']['webp']))
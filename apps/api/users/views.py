@@ -3,7 +3,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .models import User
-from .serializers import UserSerializer, UserRegistrationSerializer
+from .search import search_public_users
+from .serializers import UserSerializer, UserRegistrationSerializer, PublicUserSerializer
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -26,5 +27,20 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         """Get the current user's profile."""
-        serializer = self.get_serializer(request.user)
+        # request.user only holds the token snapshot; serve the stored row
+        serializer = self.get_serializer(User.objects.get(pk=request.user.pk))
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """
+        Find public-mode users by nickname (or visible full name) for public
+        matches. ?q= is the search text, ?limit= at most 50. Not paginated.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        users = search_public_users(request.query_params.get('q', ''), limit, exclude_id=request.user.pk)
+        serializer = PublicUserSerializer(users, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
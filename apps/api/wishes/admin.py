@@ -1,5 +1,41 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from fantasy_life.admin_pagination import EstimatedCountAdminMixin
+from .eligibility import refresh_wish_counts
 from .models import Category, Wish, Match, Period, Assignment, Negotiation, Execution
+from .search import filter_wishes
+
+
+class IndexedSearchMixin:
+    """
+    Searches the full-text index of wishes (wishes.search) and exact
+    nicknames, instead of LIKE '%...%' over every joined row.
+    search_fields only shows the search box.
+    """
+    # Path from the model to its Wish, or None to search nicknames only
+    wish_lookup = None
+    nickname_lookups = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q()
+        for lookup in self.nickname_lookups:
+            condition |= Q(**{lookup: search_term})
+        if self.wish_lookup:
+            condition |= Q(**{f'{self.wish_lookup}__in': filter_wishes(Wish.objects.all(), search_term)})
+        return queryset.filter(condition), False
+
+
+def update_selected(modeladmin, request, queryset, **changes):
+    """Apply changes to the selected rows with one UPDATE and report how many."""
+    updated = queryset.update(**changes)
+    modeladmin.message_user(request, f'{updated} {queryset.model._meta.verbose_name_plural} updated.', messages.SUCCESS)
+    return updated
 
 
 @admin.register(Category)
@@ -8,57 +44,107 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ('is_adult', 'is_active')
     search_fields = ('name', 'description')
     ordering = ('name',)
+    actions = ['activate', 'deactivate']
+
+    @admin.action(description='Activate selected categories')
+    def activate(self, request, queryset):
+        update_selected(self, request, queryset, is_active=True)
+
+    @admin.action(description='Deactivate selected categories')
+    def deactivate(self, request, queryset):
+        update_selected(self, request, queryset, is_active=False)
 
 
 @admin.register(Wish)
-class WishAdmin(admin.ModelAdmin):
+class WishAdmin(IndexedSearchMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'user', 'category', 'is_active', 'created_at')
     list_filter = ('category', 'is_active', 'created_at')
-    search_fields = ('title', 'description', 'user__nickname')
-    ordering = ('-created_at',)
+    list_select_related = ('user', 'category')
+    search_fields = ('title', 'description')
+    search_help_text = 'Words of the title or description, or an exact nickname'
+    wish_lookup = 'pk'
+    nickname_lookups = ('user__nickname',)
+    # Ids grow with created_at, and the primary key serves the sort
+    ordering = ('-pk',)
     raw_id_fields = ('user',)
+    actions = ['activate', 'deactivate']
+
+    @admin.action(description='Activate selected wishes')
+    def activate(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description='Deactivate selected wishes')
+    def deactivate(self, request, queryset):
+        self._set_active(request, queryset, False)
+
+    def _set_active(self, request, queryset, is_active):
+        # QuerySet.update() skips the signals that keep wish counts current
+        with transaction.atomic():
+            user_ids = set(queryset.values_list('user_id', flat=True).order_by())
+            update_selected(self, request, queryset, is_active=is_active, updated_at=timezone.now())
+            refresh_wish_counts(user_ids)
 
 
 @admin.register(Match)
-class MatchAdmin(admin.ModelAdmin):
+class MatchAdmin(IndexedSearchMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('user1', 'user2', 'mode', 'status', 'created_at')
     list_filter = ('mode', 'status', 'created_at')
+    list_select_related = ('user1', 'user2')
     search_fields = ('user1__nickname', 'user2__nickname')
-    ordering = ('-created_at',)
+    search_help_text = 'Exact nickname of either user'
+    nickname_lookups = ('user1__nickname', 'user2__nickname')
+    ordering = ('-pk',)
     raw_id_fields = ('user1', 'user2')
     filter_horizontal = ('private_categories',)
 
 
 @admin.register(Period)
-class PeriodAdmin(admin.ModelAdmin):
+class PeriodAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('start_date', 'end_date', 'match', 'is_active', 'created_at')
     list_filter = ('is_active', 'start_date')
+    list_select_related = ('match__user1', 'match__user2')
     ordering = ('-start_date',)
     raw_id_fields = ('match',)
+    actions = ['deactivate']
+
+    @admin.action(description='Deactivate selected periods')
+    def deactivate(self, request, queryset):
+        update_selected(self, request, queryset, is_active=False)
 
 
 @admin.register(Assignment)
-class AssignmentAdmin(admin.ModelAdmin):
+class AssignmentAdmin(IndexedSearchMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('wish', 'assigned_to', 'period', 'due_date', 'is_completed', 'is_rejected')
     list_filter = ('is_completed', 'is_rejected', 'assigned_at')
+    list_select_related = ('wish__user', 'assigned_to', 'period__match__user1', 'period__match__user2')
     search_fields = ('wish__title', 'assigned_to__nickname')
-    ordering = ('-assigned_at',)
+    search_help_text = 'Words of the wish, or the exact nickname of the executor or wish owner'
+    wish_lookup = 'wish'
+    nickname_lookups = ('assigned_to__nickname', 'wish__user__nickname')
+    ordering = ('-pk',)
     raw_id_fields = ('period', 'wish', 'assigned_to')
 
 
 @admin.register(Negotiation)
-class NegotiationAdmin(admin.ModelAdmin):
+class NegotiationAdmin(IndexedSearchMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('assignment', 'proposed_by', 'proposed_date', 'status', 'created_at')
     list_filter = ('status', 'proposed_date')
+    list_select_related = ('assignment__wish', 'assignment__assigned_to', 'proposed_by')
     search_fields = ('assignment__wish__title', 'proposed_by__nickname')
-    ordering = ('-created_at',)
+    search_help_text = 'Words of the wish, or the exact nickname of the proposer'
+    wish_lookup = 'assignment__wish'
+    nickname_lookups = ('proposed_by__nickname',)
+    ordering = ('-pk',)
     raw_id_fields = ('assignment', 'proposed_by')
 
 
 @admin.register(Execution)
-class ExecutionAdmin(admin.ModelAdmin):
+class ExecutionAdmin(IndexedSearchMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('assignment', 'completed_date', 'rating', 'created_at')
     list_filter = ('rating', 'completed_date')
+    list_select_related = ('assignment__wish', 'assignment__assigned_to')
     search_fields = ('assignment__wish__title',)
+    search_help_text = 'Words of the wish'
+    wish_lookup = 'assignment__wish'
     ordering = ('-completed_date',)
     raw_id_fields = ('assignment',)
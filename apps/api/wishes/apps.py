@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WishesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wishes'
+
+    def ready(self):
+        from . import availability, eligibility, events, rankings  # noqa: F401
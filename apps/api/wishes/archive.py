@@ -0,0 +1,89 @@
+"""
+Archival of closed periods.
+
+Assignments of periods that ended before a cutoff, with their negotiations
+and executions, are copied to the archived_* tables and deleted from the
+live ones in small transactions, keeping the live tables (and every
+user-scoped query over them) proportional to recent activity. Ranking
+rollups already include archived rows (see wishes.rankings).
+"""
+from django.db import transaction
+
+from . import rankings
+from .models import (
+    Period, Assignment, Negotiation, Execution,
+    ArchivedAssignment, ArchivedNegotiation, ArchivedExecution,
+)
+
+
+def archivable_assignments(cutoff):
+    """Live assignments of periods that ended before cutoff."""
+    return Assignment.objects.filter(period__end_date__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move up to batch_size assignments of periods ended before cutoff, with
+    their negotiations and executions, in one transaction.
+    Returns {model name: rows moved}; empty when nothing is left.
+    """
+    with transaction.atomic(), rankings.refresh_suspended():
+        ids = list(
+            archivable_assignments(cutoff).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return {}
+        assignments = Assignment.objects.filter(id__in=ids).select_related('period')
+        ArchivedAssignment.objects.bulk_create([
+            ArchivedAssignment(
+                id=assignment.id,
+                period_id=assignment.period_id,
+                period_start=assignment.period.start_date,
+                period_end=assignment.period.end_date,
+                wish_id=assignment.wish_id,
+                assigned_to_id=assignment.assigned_to_id,
+                assigned_at=assignment.assigned_at,
+                due_date=assignment.due_date,
+                is_completed=assignment.is_completed,
+                is_rejected=assignment.is_rejected,
+            )
+            for assignment in assignments
+        ])
+        negotiations = ArchivedNegotiation.objects.bulk_create([
+            ArchivedNegotiation(
+                id=negotiation.id,
+                assignment_id=negotiation.assignment_id,
+                proposed_by_id=negotiation.proposed_by_id,
+                proposed_date=negotiation.proposed_date,
+                proposed_time=negotiation.proposed_time,
+                message=negotiation.message,
+                status=negotiation.status,
+                response_message=negotiation.response_message,
+                created_at=negotiation.created_at,
+                updated_at=negotiation.updated_at,
+            )
+            for negotiation in Negotiation.objects.filter(assignment_id__in=ids)
+        ])
+        executions = ArchivedExecution.objects.bulk_create([
+            ArchivedExecution(
+                id=execution.id,
+                assignment_id=execution.assignment_id,
+                completed_date=execution.completed_date,
+                completed_time=execution.completed_time,
+                rating=execution.rating,
+                comment_by_creator=execution.comment_by_creator,
+                comment_by_executor=execution.comment_by_executor,
+                created_at=execution.created_at,
+            )
+            for execution in Execution.objects.filter(assignment_id__in=ids)
+        ])
+        Negotiation.objects.filter(assignment_id__in=ids).delete()
+        Execution.objects.filter(assignment_id__in=ids).delete()
+        Assignment.objects.filter(id__in=ids).delete()
+    return {'assignments': len(ids), 'negotiations': len(negotiations), 'executions': len(executions)}
+
+
+def delete_empty_periods(cutoff):
+    """Delete periods ended before cutoff that have no live assignments left."""
+    deleted, _ = Period.objects.filter(end_date__lt=cutoff, assignments__isnull=True).delete()
+    return deleted
@@ -0,0 +1,34 @@
+"""
+Async versions of hot wish endpoints (see fantasy_life.async_api).
+They share their querysets with the DRF viewsets in wishes.views.
+"""
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import NotFound
+
+from fantasy_life.async_api import api_response, async_api_view, paginate
+from .serializers import AssignmentSerializer, NegotiationSerializer, RankingSerializer
+from .views import RANKINGS, user_assignments, user_negotiations, ranking_queryset
+
+
+@require_safe
+@async_api_view
+async def assignment_list(request):
+    """Assignments to or from the current user, paginated."""
+    return api_response(await paginate(request, user_assignments(request.user), AssignmentSerializer))
+
+
+@require_safe
+@async_api_view
+async def negotiation_list(request):
+    """Negotiations of the current user's assignments, paginated."""
+    return api_response(await paginate(request, user_negotiations(request.user), NegotiationSerializer))
+
+
+@require_safe
+@async_api_view
+async def ranking(request, name):
+    """Top 100 users of a ranking (most_completed, best_rated, fastest_completion)."""
+    if name not in RANKINGS:
+        raise NotFound()
+    rankings = [row async for row in ranking_queryset(name)]
+    return api_response(RankingSerializer(rankings, many=True).data)
@@ -0,0 +1,136 @@
+"""
+Per-user availability for date negotiations.
+
+A user's commitments over the next AVAILABILITY_HORIZON_DAYS days are the
+dates of accepted negotiations on their assignments (either side) and the
+due dates of open assignments they must fulfil. They are indexed as day
+bitmasks, bit n standing for today + n days, and cached per user and day
+for AVAILABILITY_CACHE_SECONDS. Once both calendars are cached, the dates
+two users have free are a few integer operations, however many
+commitments they hold.
+
+Saving or deleting an assignment, or a negotiation that is or was
+accepted, drops the cached calendars of the users involved once the
+transaction commits. Calendars are read from the primary: one built from
+a lagging replica after that would stay cached, stale, for the full
+AVAILABILITY_CACHE_SECONDS.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from .models import Assignment, Negotiation
+
+# Bitmasks of days with accepted negotiations and with open assignments due,
+# plus {day: open assignments due} for the days set in due
+Calendar = namedtuple('Calendar', ('accepted', 'due', 'due_counts'))
+
+
+def calendar_cache_key(user_id, today):
+    return f'availability:{user_id}:{today.isoformat()}'
+
+
+def build_calendar(user_id, today):
+    """Read user_id's commitments from today on into a Calendar."""
+    end = today + timedelta(days=settings.AVAILABILITY_HORIZON_DAYS)
+    accepted = 0
+    negotiated = Negotiation.objects.using(DEFAULT_DB_ALIAS).filter(
+        Q(assignment__assigned_to_id=user_id) | Q(assignment__wish__user_id=user_id),
+        status=Negotiation.STATUS_ACCEPTED,
+        proposed_date__gte=today,
+        proposed_date__lt=end,
+    ).values_list('proposed_date', flat=True).distinct().order_by()
+    for day in negotiated:
+        accepted |= 1 << (day - today).days
+
+    due = 0
+    due_counts = Counter()
+    due_dates = Assignment.objects.using(DEFAULT_DB_ALIAS).filter(
+        assigned_to_id=user_id,
+        is_completed=False,
+        is_rejected=False,
+        due_date__gte=today,
+        due_date__lt=end,
+    ).values_list('due_date', flat=True).order_by()
+    for day in due_dates:
+        offset = (day - today).days
+        due |= 1 << offset
+        due_counts[offset] += 1
+    return Calendar(accepted, due, dict(due_counts))
+
+
+def get_calendars(user_ids, today):
+    """{user id: Calendar}, building and caching the missing ones."""
+    keys = {calendar_cache_key(user_id, today): user_id for user_id in set(user_ids)}
+    cached = cache.get_many(keys)
+    calendars = {keys[key]: Calendar(*value) for key, value in cached.items()}
+    missing = {}
+    for key, user_id in keys.items():
+        if user_id not in calendars:
+            calendars[user_id] = build_calendar(user_id, today)
+            missing[key] = tuple(calendars[user_id])
+    if missing:
+        cache.set_many(missing, settings.AVAILABILITY_CACHE_SECONDS)
+    return calendars
+
+
+def invalidate_calendars(user_ids, today=None):
+    today = today or timezone.localdate()
+    cache.delete_many([calendar_cache_key(user_id, today) for user_id in set(user_ids)])
+
+
+def free_dates(assignment, limit, today=None):
+    """
+    The first limit dates from today up to the assignment's due date on
+    which neither its executor nor the wish owner has a commitment. The
+    assignment's own due date does not count as a commitment.
+    """
+    today = today or timezone.localdate()
+    days = min((assignment.due_date - today).days + 1, settings.AVAILABILITY_HORIZON_DAYS)
+    if days <= 0 or limit <= 0:
+        return []
+
+    executor_id, owner_id = assignment.assigned_to_id, assignment.wish.user_id
+    calendars = get_calendars([executor_id, owner_id], today)
+    executor, owner = calendars[executor_id], calendars[owner_id]
+    executor_due = executor.due
+    own_due = (assignment.due_date - today).days
+    if executor.due_counts.get(own_due) == 1 and not (assignment.is_completed or assignment.is_rejected):
+        executor_due &= ~(1 << own_due)
+    busy = executor.accepted | executor_due | owner.accepted | owner.due
+
+    free = ~busy & ((1 << days) - 1)
+    dates = []
+    while free and len(dates) < limit:
+        lowest = free & -free
+        dates.append(today + timedelta(days=lowest.bit_length() - 1))
+        free ^= lowest
+    return dates
+
+
+def _participant_ids(assignment_id):
+    return Assignment.objects.filter(pk=assignment_id).values_list('assigned_to_id', 'wish__user_id').first() or ()
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def assignment_changed(sender, instance, **kwargs):
+    user_ids = [instance.assigned_to_id]
+    transaction.on_commit(lambda: invalidate_calendars(user_ids))
+
+
+@receiver(post_save, sender=Negotiation)
+@receiver(post_delete, sender=Negotiation)
+def negotiation_changed(sender, instance, **kwargs):
+    # Pending proposals don't occupy a date; anything else may have been accepted
+    if instance.status == Negotiation.STATUS_PENDING:
+        return
+    user_ids = _participant_ids(instance.assignment_id)
+    if user_ids:
+        transaction.on_commit(lambda: invalidate_calendars(user_ids))
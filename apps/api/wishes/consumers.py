@@ -0,0 +1,50 @@
+"""
+WebSocket consumers.
+"""
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+import asyncio
+import time
+
+from .events import user_group
+
+
+class UserEventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes the authenticated user's match, assignment, negotiation and
+    execution events (see wishes.events). The socket is closed when the
+    access token it was opened with expires; clients reconnect with a new one.
+
+    Messages sent: {"id": <event id>, "type": "<event>", "data": {...}}.
+    Delivery is at least once, so clients should ignore ids they have seen.
+    Bursts arrive as "<event>.batch" messages, and "resync" asks the client
+    to reload over REST after events were dropped.
+    A {"type": "ping"} message is answered with {"type": "pong"}.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group_name = user_group(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        expires_at = self.scope.get('token_expires_at')
+        if expires_at:
+            self.expiry = asyncio.get_running_loop().call_later(
+                max(expires_at - time.time(), 0), lambda: asyncio.ensure_future(self.close(code=4401))
+            )
+
+    async def disconnect(self, code):
+        expiry = getattr(self, 'expiry', None)
+        if expiry is not None:
+            expiry.cancel()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def user_event(self, message):
+        await self.send_json({'id': message['id'], 'type': message['event'], 'data': message['data']})
@@ -0,0 +1,133 @@
+"""
+Active-wish counters per (user, category).
+
+WishCategoryCount holds how many active wishes each user has in each
+category, so create_period and the categories endpoint learn which
+combinations have anything to offer without reading the wishes table.
+Creating, deleting or (de)activating a wish, or moving it to another
+category, adjusts the affected rows with UPDATE ... SET active_count =
+active_count ± 1 in the same transaction, so concurrent changes never
+lose an increment. Writes that skip signals (bulk_create, QuerySet.update,
+seed_scale_data) are followed by refresh_wish_counts or rebuild_wish_counts.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Wish, WishCategoryCount
+
+# Fields whose changes move a wish between counters
+COUNTED_FIELDS = frozenset({'user', 'user_id', 'category', 'category_id', 'is_active'})
+
+
+def categories_with_wishes(user_id):
+    """Ids of the categories in which user_id has active wishes."""
+    return set(WishCategoryCount.objects.filter(
+        user_id=user_id, active_count__gt=0
+    ).values_list('category_id', flat=True))
+
+
+def adjust_count(user_id, category_id, delta):
+    counts = WishCategoryCount.objects.filter(user_id=user_id, category_id=category_id)
+    if delta < 0:
+        # A counter that drifted to zero stays there until the next rebuild
+        counts.filter(active_count__gte=-delta).update(active_count=F('active_count') + delta)
+    elif not counts.update(active_count=F('active_count') + delta):
+        # First wish of the combination; a racing insert makes this a no-op
+        WishCategoryCount.objects.bulk_create(
+            [WishCategoryCount(user_id=user_id, category_id=category_id)], ignore_conflicts=True
+        )
+        counts.update(active_count=F('active_count') + delta)
+
+
+def _active_counts(wish_model, user_ids=None):
+    """((user id, category id), count) of active wishes."""
+    wishes = wish_model.objects.filter(is_active=True)
+    if user_ids is not None:
+        wishes = wishes.filter(user_id__in=user_ids)
+    rows = wishes.values('user_id', 'category_id').annotate(active=Count('id')).order_by()
+    for row in rows.iterator(chunk_size=2000):
+        yield (row['user_id'], row['category_id']), row['active']
+
+
+def refresh_wish_counts(user_ids, batch_size=500):
+    """Recompute the counters of user_ids."""
+    user_ids = sorted(set(user_ids))
+    with transaction.atomic():
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            WishCategoryCount.objects.filter(user_id__in=batch).delete()
+            WishCategoryCount.objects.bulk_create([
+                WishCategoryCount(user_id=user_id, category_id=category_id, active_count=active)
+                for (user_id, category_id), active in _active_counts(Wish, batch)
+            ])
+
+
+def rebuild_wish_counts(wish_model=Wish, count_model=WishCategoryCount, batch_size=1000):
+    """
+    Recompute every counter from scratch; returns the number of rows.
+    Takes the models as arguments so migrations can pass historical ones.
+    """
+    rows = 0
+    with transaction.atomic():
+        count_model.objects.all().delete()
+        batch = []
+        for (user_id, category_id), active in _active_counts(wish_model):
+            batch.append(count_model(user_id=user_id, category_id=category_id, active_count=active))
+            if len(batch) >= batch_size:
+                count_model.objects.bulk_create(batch)
+                rows += len(batch)
+                batch = []
+        count_model.objects.bulk_create(batch)
+        rows += len(batch)
+    return rows
+
+
+def _counted(user_id, category_id, is_active):
+    """The counter a wish in this state belongs to, if any."""
+    return (user_id, category_id) if is_active else None
+
+
+def _touches_counts(update_fields):
+    return update_fields is None or bool(COUNTED_FIELDS & set(update_fields))
+
+
+def _loaded_state(instance):
+    """(user id, category id, is_active) as last read, or None if unknown."""
+    loaded = getattr(instance, '_loaded_counted', None)
+    return None if loaded is None or None in loaded else loaded
+
+
+@receiver(pre_save, sender=Wish)
+def wish_saving(sender, instance, update_fields=None, **kwargs):
+    # Wishes not loaded through the ORM (or with counted fields deferred)
+    # read their stored state before it is overwritten
+    if instance.pk is None or not _touches_counts(update_fields) or _loaded_state(instance):
+        return
+    instance._loaded_counted = Wish.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'category_id', 'is_active'
+    ).first() or (None, None, False)
+
+
+@receiver(post_save, sender=Wish)
+def wish_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or not _touches_counts(update_fields):
+        return
+    before = None if created else _counted(*instance._loaded_counted)
+    after = _counted(instance.user_id, instance.category_id, instance.is_active)
+    instance._loaded_counted = (instance.user_id, instance.category_id, instance.is_active)
+    if before != after:
+        if before:
+            adjust_count(*before, -1)
+        if after:
+            adjust_count(*after, 1)
+
+
+@receiver(post_delete, sender=Wish)
+def wish_deleted(sender, instance, **kwargs):
+    # Collector.delete() runs receivers inside its transaction
+    state = _loaded_state(instance) or (instance.user_id, instance.category_id, instance.is_active)
+    counted = _counted(*state)
+    if counted:
+        adjust_count(*counted, -1)
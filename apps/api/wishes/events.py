@@ -0,0 +1,152 @@
+"""
+Live events pushed to users over WebSockets.
+
+Model changes are turned into small JSON events, one OutboxEvent row per
+recipient, written in the same transaction as the change (see
+EventSourceMixin). The dispatch_events command drains the outbox to the
+per-user channel groups joined by wishes.consumers.UserEventsConsumer, so
+requests never wait on the channel layer and rolled back changes never
+produce events.
+
+Bulk jobs such as period rollovers run inside coalesce(), which turns the
+events they cause into one "<type>.batch" event per user and type.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .models import Match, Assignment, Negotiation, Execution, OutboxEvent
+
+
+def user_group(user_id):
+    """Channel group of all connections of one user."""
+    return f'user_{user_id}'
+
+
+def event_message(event):
+    """Channel layer message for an OutboxEvent."""
+    return {'type': 'user.event', 'id': event.pk, 'event': event.event_type, 'data': event.data}
+
+
+def batch_message(events, max_items):
+    """Channel layer message summarising several events of the same type."""
+    return {
+        'type': 'user.event', 'id': events[-1].pk, 'event': f'{events[0].event_type}.batch',
+        'data': {'count': len(events), 'items': [event.data for event in events[:max_items]]},
+    }
+
+
+def coalesced_messages(events, max_items=20):
+    """Messages for events in order, merging runs of the same event type."""
+    messages, run = [], []
+    for event in events:
+        if run and run[-1].event_type != event.event_type:
+            messages.append(event_message(run[0]) if len(run) == 1 else batch_message(run, max_items))
+            run = []
+        run.append(event)
+    if run:
+        messages.append(event_message(run[0]) if len(run) == 1 else batch_message(run, max_items))
+    return messages
+
+
+# Events buffered by the innermost coalesce() block: {(user_id, type): [data]}
+_coalesced = ContextVar('coalesced_events', default=None)
+
+
+@contextmanager
+def coalesce(max_items=20):
+    """
+    Buffer events published inside the block and queue one summary per user
+    and event type when it ends, e.g. assignment.created.batch with
+    {'count': 4, 'items': [...]}. Only events whose transaction committed are
+    counted. The summaries are written after the block, so a job that dies
+    midway leaves its committed changes without events; clients pick them up
+    on their next REST load.
+    """
+    buffer = {}
+    token = _coalesced.set(buffer)
+    try:
+        yield
+    finally:
+        _coalesced.reset(token)
+        if buffer:
+            OutboxEvent.objects.bulk_create(
+                OutboxEvent(user_id=user_id, event_type=f'{event_type}.batch',
+                            data={'count': len(items), 'items': items[:max_items]})
+                for (user_id, event_type), items in buffer.items()
+            )
+
+
+def _buffer(buffer, user_ids, event_type, data):
+    for user_id in user_ids:
+        buffer.setdefault((user_id, event_type), []).append(data)
+
+
+def publish(user_ids, event_type, data):
+    """Queue an event for the given users in the current transaction."""
+    buffer = _coalesced.get()
+    if buffer is not None:
+        user_ids = list(dict.fromkeys(user_ids))
+        transaction.on_commit(lambda: _buffer(buffer, user_ids, event_type, data))
+        return
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(user_id=user_id, event_type=event_type, data=data)
+        for user_id in dict.fromkeys(user_ids)
+    )
+
+
+def _status_changed(instance, created):
+    """Whether instance was created or its status changed since it was loaded."""
+    previous = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    return created or previous != instance.status
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, created, **kwargs):
+    if not _status_changed(instance, created):
+        return
+    publish(
+        [instance.user1_id, instance.user2_id],
+        'match.created' if created else 'match.status_changed',
+        {'id': instance.pk, 'user1': instance.user1_id, 'user2': instance.user2_id,
+         'mode': instance.mode, 'status': instance.status},
+    )
+
+
+@receiver(post_save, sender=Assignment)
+def assignment_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    publish(
+        [instance.assigned_to_id, instance.wish.user_id],
+        'assignment.created',
+        {'id': instance.pk, 'wish': instance.wish_id, 'assigned_to': instance.assigned_to_id,
+         'period': instance.period_id, 'due_date': str(instance.due_date)},
+    )
+
+
+@receiver(post_save, sender=Negotiation)
+def negotiation_saved(sender, instance, created, **kwargs):
+    if not _status_changed(instance, created):
+        return
+    assignment = instance.assignment
+    publish(
+        [assignment.assigned_to_id, assignment.wish.user_id],
+        'negotiation.created' if created else 'negotiation.status_changed',
+        {'id': instance.pk, 'assignment': assignment.pk, 'proposed_by': instance.proposed_by_id,
+         'proposed_date': str(instance.proposed_date), 'status': instance.status},
+    )
+
+
+@receiver(post_save, sender=Execution)
+def execution_saved(sender, instance, created, **kwargs):
+    assignment = instance.assignment
+    publish(
+        [assignment.assigned_to_id, assignment.wish.user_id],
+        'execution.created' if created else 'execution.updated',
+        {'id': instance.pk, 'assignment': assignment.pk, 'rating': instance.rating,
+         'completed_date': str(instance.completed_date)},
+    )
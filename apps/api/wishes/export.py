@@ -0,0 +1,134 @@
+"""
+Personal data export as NDJSON.
+
+Each line is {"type": ..., "data": {...}} for the profile, wishes, matches,
+assignments, negotiations and executions of one user (archived ones
+included), or of every user for admin exports. Rows are read with
+values().iterator(chunk_size=EXPORT_CHUNK_SIZE), which uses server-side
+cursors on PostgreSQL, and encoded as they arrive, so memory stays flat
+however much a user has. zipped() compresses the stream on the fly.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from itertools import islice
+import zipfile
+
+from users.models import User
+from .models import (
+    Wish, Match, Assignment, Negotiation, Execution,
+    ArchivedAssignment, ArchivedNegotiation, ArchivedExecution,
+)
+
+PROFILE_FIELDS = (
+    'id', 'email', 'nickname', 'date_of_birth', 'full_name', 'bio', 'photo', 'show_full_name',
+    'show_bio', 'show_photo', 'is_active', 'is_public_mode_active', 'date_joined', 'last_login',
+)
+# Flush the stream once this many bytes are buffered
+CHUNK_BYTES = 64 * 1024
+
+
+def export_querysets(user=None):
+    """(record type, queryset of dicts) pairs for user, or for everyone if user is None."""
+    users = User.objects.all()
+    wishes = Wish.objects.all()
+    matches = Match.objects.all()
+    assignments = Assignment.objects.all()
+    negotiations = Negotiation.objects.all()
+    executions = Execution.objects.all()
+    archived = ArchivedAssignment.objects.all()
+    archived_negotiations = ArchivedNegotiation.objects.all()
+    archived_executions = ArchivedExecution.objects.all()
+    if user is not None:
+        # Archived rows keep plain ids, so the user's wishes are matched by id
+        wish_ids = Wish.objects.filter(user=user).values('id')
+        users = users.filter(pk=user.pk)
+        wishes = wishes.filter(user=user)
+        matches = matches.filter(Q(user1=user) | Q(user2=user))
+        assignments = assignments.filter(Q(assigned_to=user) | Q(wish__user=user))
+        negotiations = negotiations.filter(Q(assignment__assigned_to=user) | Q(assignment__wish__user=user))
+        executions = executions.filter(Q(assignment__assigned_to=user) | Q(assignment__wish__user=user))
+        archived = archived.filter(Q(assigned_to_id=user.pk) | Q(wish_id__in=wish_ids))
+        archived_negotiations = archived_negotiations.filter(
+            Q(assignment__assigned_to_id=user.pk) | Q(assignment__wish_id__in=wish_ids)
+        )
+        archived_executions = archived_executions.filter(
+            Q(assignment__assigned_to_id=user.pk) | Q(assignment__wish_id__in=wish_ids)
+        )
+    return [
+        ('profile', users.values(*PROFILE_FIELDS)),
+        ('wish', wishes.values()),
+        ('match', matches.values()),
+        ('assignment', assignments.values()),
+        ('negotiation', negotiations.values()),
+        ('execution', executions.values()),
+        ('archived_assignment', archived.values()),
+        ('archived_negotiation', archived_negotiations.values()),
+        ('archived_execution', archived_executions.values()),
+    ]
+
+
+def export_lines(user=None, chunk_size=None):
+    """Yield the export as NDJSON bytes, in chunks of about CHUNK_BYTES."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    buffer, size = [], 0
+    for record_type, queryset in export_querysets(user):
+        for row in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+            line = (encoder.encode({'type': record_type, 'data': row}) + '\n').encode()
+            buffer.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+class _ZipSink:
+    """Write-only stream collecting what ZipFile writes until drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zipped(chunks, name):
+    """Yield a zip archive holding chunks as the file name, compressed on the fly."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(name, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
+
+
+async def aiter_chunks(chunks, batch=16):
+    """
+    Async iterator over a sync one, pulling batch items per thread hop.
+    StreamingHttpResponse would otherwise read a sync iterator whole before
+    sending it under ASGI.
+    """
+    iterator = iter(chunks)
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch)))
+    while True:
+        items = await next_batch()
+        if not items:
+            return
+        for item in items:
+            yield item
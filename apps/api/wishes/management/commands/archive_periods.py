@@ -0,0 +1,62 @@
+"""
+Management command that archives assignments of long-closed periods.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+import time
+
+from wishes.archive import archivable_assignments, archive_batch, delete_empty_periods
+
+
+class Command(BaseCommand):
+    help = 'Move assignments, negotiations and executions of periods closed for N months to archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=settings.ARCHIVE_AFTER_MONTHS,
+            help=f'Archive periods that ended more than this many months ago (default: {settings.ARCHIVE_AFTER_MONTHS})'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Assignments moved per transaction (default: 500)')
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.2,
+            help='Seconds to sleep between batches, leaving room for other writers (default: 0.2)'
+        )
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months must be at least 1')
+        cutoff = timezone.now().date() - relativedelta(months=options['months'])
+
+        if options['dry_run']:
+            count = archivable_assignments(cutoff).count()
+            self.stdout.write(f'{count} assignments of periods ended before {cutoff} would be archived')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'\n=== Archiving periods ended before {cutoff} ==='))
+        started = time.perf_counter()
+        totals = {'assignments': 0, 'negotiations': 0, 'executions': 0}
+        batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            batches += 1
+            for label, count in moved.items():
+                totals[label] += count
+            self.stdout.write(f"  batch {batches}: {moved['assignments']} assignments")
+            time.sleep(options['pause'])
+
+        periods = delete_empty_periods(cutoff)
+        elapsed = time.perf_counter() - started
+        for label, count in totals.items():
+            self.stdout.write(f'  {label}: {count}')
+        self.stdout.write(f'  empty periods deleted: {periods}')
+        self.stdout.write(self.style.SUCCESS(f'\n=== Archived {totals["assignments"]} assignments in {elapsed:.1f}s ===\n'))
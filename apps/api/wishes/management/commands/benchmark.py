@@ -0,0 +1,248 @@
+"""
+Management command to benchmark the API hot paths.
+It builds a throwaway test database, seeds it with seed_scale_data and times
+each case, reporting latency percentiles, queries per request and peak memory.
+Results can be written as JSON and compared against a previous run.
+"""
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.test import APIClient
+from io import StringIO
+import django
+import itertools
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+from wishes.models import Assignment, Negotiation, Execution
+from users.models import User
+
+
+PASSWORD = 'benchmark-pass'
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting statements.
+    CaptureQueriesContext can't be used around requests because
+    request_started resets the connection's query log.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark API endpoints and the period rollover on a seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300,
+                            help='Users in the seeded dataset (default: 300)')
+        parser.add_argument('--seed', type=int, default=42, help='Dataset seed (default: 42)')
+        parser.add_argument('--iterations', type=int, default=30,
+                            help='Timed iterations per endpoint case (default: 30)')
+        parser.add_argument('--period-iterations', type=int, default=3,
+                            help='Timed iterations for create_period cases (default: 3)')
+        parser.add_argument('--only', action='append', default=[],
+                            help='Run only cases whose name contains this text (repeatable)')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', help='Compare against a previous JSON result file')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f'Seeding {options["users"]} users (seed {options["seed"]})...')
+            call_command(
+                'seed_scale_data', users=options['users'], seed=options['seed'],
+                password=PASSWORD, prefix='bench', stdout=StringIO(),
+            )
+            results = self._run_cases(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+        self._print_report(results, baseline)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def _cases(self, options):
+        """Return (name, callable, iterations) for every benchmark case."""
+        client = APIClient(raise_request_exception=False)
+        user = User.objects.annotate(
+            total=Count('assigned_wishes')
+        ).order_by('-total', 'pk').first()
+        response = client.post('/api/token/', {'email': user.email, 'password': PASSWORD}, format='json')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+        assignment = Assignment.objects.filter(assigned_to=user).order_by('pk').first()
+        negotiation = Negotiation.objects.filter(assignment__assigned_to=user).order_by('pk').first()
+        execution = Execution.objects.filter(assignment__assigned_to=user).order_by('pk').first()
+
+        def get(path):
+            return lambda: client.get(path).status_code
+
+        def rollover():
+            with transaction.atomic():
+                call_command('create_period', stdout=StringIO())
+                transaction.set_rollback(True)
+            return 200
+
+        def dry_run():
+            call_command('create_period', dry_run=True, stdout=StringIO())
+            return 200
+
+        emails = (f'bench-register-{n}@example.com' for n in itertools.count())
+
+        def register():
+            email = next(emails)
+            return APIClient(raise_request_exception=False).post('/api/users/', {
+                'email': email,
+                'nickname': email.split('@')[0],
+                'password': PASSWORD,
+                'password_confirm': PASSWORD,
+                'date_of_birth': '1990-01-01',
+            }, format='json').status_code
+
+        def login():
+            return APIClient(raise_request_exception=False).post(
+                '/api/token/', {'email': user.email, 'password': PASSWORD}, format='json'
+            ).status_code
+
+        iterations = options['iterations']
+        period_iterations = options['period_iterations']
+        cases = [
+            ('create_period.serial', rollover, period_iterations),
+            ('create_period.dry_run', dry_run, period_iterations),
+            ('rankings.most_completed', get('/api/rankings/most_completed/'), iterations),
+            ('rankings.best_rated', get('/api/rankings/best_rated/'), iterations),
+            ('rankings.fastest_completion', get('/api/rankings/fastest_completion/'), iterations),
+            ('assignments.list', get('/api/assignments/'), iterations),
+            ('negotiations.list', get('/api/negotiations/'), iterations),
+            ('executions.list', get('/api/executions/'), iterations),
+            ('auth.register', register, iterations),
+            ('auth.login', login, iterations),
+        ]
+        for name, obj, path in (
+            ('assignments.detail', assignment, '/api/assignments/{}/'),
+            ('negotiations.detail', negotiation, '/api/negotiations/{}/'),
+            ('executions.detail', execution, '/api/executions/{}/'),
+        ):
+            if obj is not None:
+                cases.append((name, get(path.format(obj.pk)), iterations))
+        return cases
+
+    def _run_cases(self, options):
+        results = {}
+        for name, func, iterations in self._cases(options):
+            if options['only'] and not any(text in name for text in options['only']):
+                continue
+            self.stdout.write(f'  {name}...')
+            results[name] = self._measure(func, iterations)
+        return results
+
+    def _measure(self, func, iterations):
+        """
+        Run func once to record queries and peak memory, then time it.
+        The instrumented pass is kept apart because tracing skews timings.
+        """
+        queries = QueryCounter()
+        tracemalloc.start()
+        with connection.execute_wrapper(queries):
+            status = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings = []
+        errors = 0 if status < 400 else 1
+        for _ in range(iterations):
+            started = time.perf_counter()
+            status = func()
+            timings.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                errors += 1
+
+        timings.sort()
+        return {
+            'iterations': iterations,
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3) if timings else 0.0,
+            'max_ms': round(timings[-1], 3) if timings else 0.0,
+            'queries': queries.count,
+            'peak_memory_kib': round(peak / 1024, 1),
+            'errors': errors,
+        }
+
+    def _print_report(self, results, baseline):
+        previous = (baseline or {}).get('results', {})
+        self.stdout.write(
+            f'\n{"case":<30} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"peak KiB":>10} {"errors":>7}'
+        )
+        for name, result in results.items():
+            line = (
+                f'{name:<30} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                f'{result["queries"]:>8} {result["peak_memory_kib"]:>10.1f} {result["errors"]:>7}'
+            )
+            old = previous.get(name)
+            if old and old.get('p50_ms'):
+                change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+                line += f'  p50 {change:+.1f}% vs {old["p50_ms"]:.2f}'
+                if result['queries'] != old.get('queries'):
+                    line += f', queries {old.get("queries")} -> {result["queries"]}'
+            self.stdout.write(line)
+        self.stdout.write('')
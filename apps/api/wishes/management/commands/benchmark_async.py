@@ -0,0 +1,88 @@
+"""
+Management command comparing the DRF endpoints with their async versions
+under /api/async/ (users/me, assignment and negotiation lists, rankings).
+The same read-only mix is run twice against a running ASGI server with
+loadtest's virtual users, first on the sync views and then on the async
+ones, and throughput and latency are printed side by side.
+
+Users are expected to exist already, for example from seed_scale_data.
+"""
+from django.core.management.base import BaseCommand
+import json
+import time
+
+from .loadtest import build_report, run_virtual_users
+
+
+READ_MIX = {
+    'users.me': 4,
+    'assignments.list': 3,
+    'negotiations.list': 3,
+    'rankings.most_completed': 1,
+    'rankings.best_rated': 1,
+    'rankings.fastest_completion': 1,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent throughput of the sync and async hot read endpoints on a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='ASGI server to test (default: http://127.0.0.1:8000)')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Number of concurrent virtual users (default: 50)')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds per run (default: 30)')
+        parser.add_argument('--pause', type=float, default=2,
+                            help='Seconds to wait between the two runs (default: 2)')
+        parser.add_argument('--prefix', default='scale',
+                            help='seed_scale_data prefix of the accounts to log in as (default: scale)')
+        parser.add_argument('--accounts', type=int, default=100,
+                            help='Distinct accounts to spread virtual users over (default: 100)')
+        parser.add_argument('--password', default='scale-data-pass',
+                            help='Password of the seeded accounts')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Per-request timeout in seconds (default: 30)')
+        parser.add_argument('--output', help='Write both reports as JSON to this file')
+
+    def handle(self, *args, **options):
+        options.update(think_ms=0, refresh_interval=options['duration'] + 60)
+        reports = {}
+        for mode in ('sync', 'async'):
+            self.stdout.write(self.style.SUCCESS(
+                f'\n=== {mode}: {options["concurrency"]} users for {options["duration"]:.0f}s '
+                f'against {options["base_url"]} ==='
+            ))
+            reports[mode] = build_report(*run_virtual_users(dict(options, async_reads=mode == 'async'), READ_MIX))
+            self.stdout.write(
+                f'  {reports[mode]["requests"]} requests, {reports[mode]["throughput_rps"]} req/s, '
+                f'error rate {reports[mode]["error_rate"]:.2%}'
+            )
+            if mode == 'sync':
+                time.sleep(options['pause'])
+
+        self._print_comparison(reports['sync'], reports['async'])
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(reports, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def _print_comparison(self, sync, async_):
+        self.stdout.write(
+            f'\n{"action":<30} {"sync rps":>9} {"async rps":>10} {"sync p50":>9} {"async p50":>10} '
+            f'{"sync p95":>9} {"async p95":>10}'
+        )
+        rows = [(name, sync['actions'].get(name), async_['actions'].get(name)) for name in READ_MIX]
+        rows.append(('total', sync, async_))
+        for name, before, after in rows:
+            if before is None or after is None:
+                continue
+            self.stdout.write(
+                f'{name:<30} {before["throughput_rps"]:>9.1f} {after["throughput_rps"]:>10.1f} '
+                f'{before["p50_ms"]:>9.1f} {after["p50_ms"]:>10.1f} '
+                f'{before["p95_ms"]:>9.1f} {after["p95_ms"]:>10.1f}'
+            )
+        if sync['throughput_rps']:
+            change = async_['throughput_rps'] / sync['throughput_rps'] - 1
+            self.stdout.write(self.style.SUCCESS(f'\n=== Async throughput {change:+.1%} vs sync ===\n'))
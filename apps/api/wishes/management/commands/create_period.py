@@ -5,11 +5,17 @@ This should be run automatically (e.g., via cron) at the start of each period.
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db.models import Q
+from contextlib import nullcontext
 from datetime import datetime, timedelta
+import os
 import random
 
 from wishes.models import Category, Wish, Match, Period, Assignment
+from wishes.eligibility import categories_with_wishes
+from wishes.events import coalesce
 from users.models import User
+from fantasy_life.metrics import REGISTRY, CREATE_PERIOD_PHASE_SECONDS
+from fantasy_life import profiling
 
 
 class Command(BaseCommand):
@@ -27,8 +33,37 @@ class Command(BaseCommand):
             action='store_true',
             help='Preview assignments without saving'
         )
+        parser.add_argument(
+            '--metrics-file',
+            help='Write phase durations in Prometheus text format to this file'
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Profile the run (call tree and SQL) into PROFILING_DIR'
+        )
 
     def handle(self, *args, **options):
+        if options['profile']:
+            profile = profiling.capture('create_period', days=options['days'], dry_run=options['dry_run'])
+        else:
+            profile = nullcontext()
+
+        # One assignment.created.batch event per user instead of one per assignment
+        with profile as session, CREATE_PERIOD_PHASE_SECONDS.time('total'), coalesce():
+            self._create_period(options)
+
+        if session is not None:
+            self.stdout.write(self.style.SUCCESS(f'Profile written to {session.path}'))
+
+        if options['metrics_file']:
+            # Write then rename so a textfile collector never reads a partial file.
+            tmp_path = f"{options['metrics_file']}.tmp"
+            with open(tmp_path, 'w') as handle:
+                handle.write(REGISTRY.render([CREATE_PERIOD_PHASE_SECONDS]))
+            os.replace(tmp_path, options['metrics_file'])
+
+    def _create_period(self, options):
         days = options['days']
         dry_run = options['dry_run']
         
@@ -44,81 +79,84 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be saved'))
         
         # Create global period for public matches
-        if not dry_run:
-            global_period = Period.objects.create(
-                match=None,
-                start_date=period_start,
-                end_date=period_end,
-                is_active=True
-            )
-            self.stdout.write(self.style.SUCCESS(f'Created global period: {global_period}'))
-        else:
-            global_period = None
-            self.stdout.write('Would create global period')
-        
-        # Process private matches
-        private_matches = Match.objects.filter(
-            mode=Match.MODE_PRIVATE,
-            status=Match.STATUS_ACCEPTED
-        ).select_related('user1', 'user2')
-        
-        self.stdout.write(f'\nProcessing {private_matches.count()} private matches...')
-        
-        for match in private_matches:
-            # Create period for this match
-            match_days = match.private_period_days or days
-            match_period_end = period_start + timedelta(days=match_days)
-            
+        with CREATE_PERIOD_PHASE_SECONDS.time('global_period'):
             if not dry_run:
-                match_period = Period.objects.create(
-                    match=match,
+                global_period = Period.objects.create(
+                    match=None,
                     start_date=period_start,
-                    end_date=match_period_end,
+                    end_date=period_end,
                     is_active=True
                 )
+                self.stdout.write(self.style.SUCCESS(f'Created global period: {global_period}'))
             else:
-                match_period = None
+                global_period = None
+                self.stdout.write('Would create global period')
+
+        # Process private matches
+        with CREATE_PERIOD_PHASE_SECONDS.time('private_matches'):
+            private_matches = Match.objects.filter(
+                mode=Match.MODE_PRIVATE,
+                status=Match.STATUS_ACCEPTED
+            ).select_related('user1', 'user2')
+
+            self.stdout.write(f'\nProcessing {private_matches.count()} private matches...')
+
+            for match in private_matches:
+                # Create period for this match
+                match_days = match.private_period_days or days
+                match_period_end = period_start + timedelta(days=match_days)
             
-            # Assign wishes for user1
-            assignments_created = self._assign_wishes_for_match(
-                match, match.user1, match.user2, match_period, match_period_end, dry_run
-            )
+                if not dry_run:
+                    match_period = Period.objects.create(
+                        match=match,
+                        start_date=period_start,
+                        end_date=match_period_end,
+                        is_active=True
+                    )
+                else:
+                    match_period = None
             
-            # Assign wishes for user2
-            assignments_created += self._assign_wishes_for_match(
-                match, match.user2, match.user1, match_period, match_period_end, dry_run
-            )
+                # Assign wishes for user1
+                assignments_created = self._assign_wishes_for_match(
+                    match, match.user1, match.user2, match_period, match_period_end, dry_run
+                )
+
+                # Assign wishes for user2
+                assignments_created += self._assign_wishes_for_match(
+                    match, match.user2, match.user1, match_period, match_period_end, dry_run
+                )
             
-            self.stdout.write(f'  {match}: {assignments_created} assignments')
+                self.stdout.write(f'  {match}: {assignments_created} assignments')
         
         # Process public matches
-        public_users = User.objects.filter(
-            is_active=True,
-            is_public_mode_active=True
-        )
+        with CREATE_PERIOD_PHASE_SECONDS.time('public_matches'):
+            public_users = User.objects.filter(
+                is_active=True,
+                is_public_mode_active=True
+            )
         
-        self.stdout.write(f'\nProcessing {public_users.count()} users in public mode...')
+            self.stdout.write(f'\nProcessing {public_users.count()} users in public mode...')
         
-        for user in public_users:
-            # Find accepted public matches for this user
-            public_matches = Match.objects.filter(
-                Q(user1=user) | Q(user2=user),
-                mode=Match.MODE_PUBLIC,
-                status=Match.STATUS_ACCEPTED
-            )
+            for user in public_users:
+                # Find accepted public matches for this user
+                public_matches = Match.objects.filter(
+                    Q(user1=user) | Q(user2=user),
+                    mode=Match.MODE_PUBLIC,
+                    status=Match.STATUS_ACCEPTED
+                )
             
-            assignments_created = 0
-            for match in public_matches:
-                # Determine the other user in the match
-                other_user = match.user2 if match.user1 == user else match.user1
+                assignments_created = 0
+                for match in public_matches:
+                    # Determine the other user in the match
+                    other_user = match.user2 if match.user1 == user else match.user1
                 
-                # Assign wishes
-                assignments_created += self._assign_wishes_for_match(
-                    None, user, other_user, global_period, period_end, dry_run
-                )
+                    # Assign wishes
+                    assignments_created += self._assign_wishes_for_match(
+                        None, user, other_user, global_period, period_end, dry_run
+                    )
             
-            if assignments_created > 0:
-                self.stdout.write(f'  {user.nickname}: {assignments_created} assignments')
+                if assignments_created > 0:
+                    self.stdout.write(f'  {user.nickname}: {assignments_created} assignments')
         
         self.stdout.write(self.style.SUCCESS('\n=== Period creation complete ===\n'))
 
@@ -128,6 +166,11 @@ class Command(BaseCommand):
         Returns number of assignments created.
         """
         assignments_created = 0
+
+        # Only categories the owner has active wishes in (wishes.eligibility)
+        eligible = self._categories_with_wishes(wish_owner.id)
+        if not eligible:
+            return assignments_created
         
         # Get categories (either from match or all active categories)
         if match and match.mode == Match.MODE_PRIVATE:
@@ -137,6 +180,7 @@ class Command(BaseCommand):
             # Filter adult categories for minors
             if not executor.is_adult:
                 categories = categories.filter(is_adult=False)
+        categories = categories.filter(id__in=eligible)
         
         for category in categories:
             # Get active wishes from this category
@@ -172,3 +216,10 @@ class Command(BaseCommand):
                     assignments_created += 1
         
         return assignments_created
+
+    def _categories_with_wishes(self, user_id):
+        """Owners come in runs (all public matches of a user), so remember the last one."""
+        if getattr(self, '_eligible_owner', None) != user_id:
+            self._eligible_owner = user_id
+            self._eligible = categories_with_wishes(user_id)
+        return self._eligible
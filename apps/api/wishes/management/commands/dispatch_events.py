@@ -0,0 +1,166 @@
+"""
+Management command that drains the event outbox to the channel layer.
+
+Events are delivered at least once: rows are deleted only after the channel
+layer accepted them, so a crash in between sends them again (clients dedupe
+by event id). Each user's events are sent in id order, and a failed send
+holds back that user's later events until it succeeds. To scale out, run one
+process per shard with --shards N --shard 0..N-1. Users are split by id, so
+per-user ordering still holds.
+
+Sends are rate limited per user: at most one message per --rate-limit
+seconds. Events arriving in between are buffered and coalesced: consecutive
+events of the same type become one "<type>.batch" message. A user with more
+than --max-backlog buffered events gets a single "resync" event instead,
+telling the client to reload over REST. Fetching pauses while
+--max-buffered events are waiting. This is a fixed rate limit, not
+backpressure: clients don't acknowledge messages, so a slow client is only
+held back by the channel layer's capacity.
+"""
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import F
+from django.db.models.functions import Mod
+import asyncio
+import time
+
+from wishes.events import coalesced_messages, user_group
+from wishes.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = 'Push outbox events to connected users through the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Events fetched per query (default: 500)')
+        parser.add_argument('--interval', type=float, default=0.2,
+                            help='Seconds to wait when there is nothing to send (default: 0.2)')
+        parser.add_argument('--rate-limit', type=float, default=1.0,
+                            help='Minimum seconds between messages to one user (default: 1)')
+        parser.add_argument('--max-items', type=int, default=20,
+                            help='Event payloads included in a batch message (default: 20)')
+        parser.add_argument('--max-backlog', type=int, default=200,
+                            help='Buffered events per user before they are replaced by a resync event (default: 200)')
+        parser.add_argument('--max-buffered', type=int, default=50000,
+                            help='Events held in memory before fetching pauses (default: 50000)')
+        parser.add_argument('--rescan', type=float, default=5.0,
+                            help='Seconds between full rescans for rows committed out of id order (default: 5)')
+        parser.add_argument('--max-backoff', type=float, default=30,
+                            help='Longest wait after failed sends, in seconds (default: 30)')
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help='Users sent to in parallel (default: 100)')
+        parser.add_argument('--shards', type=int, default=1, help='Total number of dispatcher processes')
+        parser.add_argument('--shard', type=int, default=0, help='Shard handled by this process (0-based)')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox is empty')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shard'] < options['shards']:
+            raise CommandError('--shard must be between 0 and --shards - 1')
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            raise CommandError('No channel layer configured')
+        try:
+            asyncio.run(self._run(channel_layer, options))
+        except KeyboardInterrupt:
+            pass
+
+    async def _run(self, channel_layer, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        backoff = options['interval']
+        pending = {}  # user id -> buffered events in id order
+        buffered_ids = set()
+        next_send = {}  # user id -> monotonic time of the next allowed message
+        cursor = 0
+        rescan_at = time.monotonic() + options['rescan']
+        delivered_total = 0
+        reported_at = time.monotonic()
+
+        while True:
+            now = time.monotonic()
+            if now >= rescan_at:
+                # Ids are allocated before commit, so a row with a lower id
+                # than the cursor can appear later; delivered rows are gone,
+                # so rescanning from the start only returns pending ones.
+                cursor = 0
+                rescan_at = now + options['rescan']
+
+            fetched = []
+            if len(buffered_ids) < options['max_buffered']:
+                fetched = await sync_to_async(self._fetch)(cursor, options)
+                for event in fetched:
+                    cursor = event.pk
+                    if event.pk not in buffered_ids:
+                        buffered_ids.add(event.pk)
+                        pending.setdefault(event.user_id, []).append(event)
+
+            now = time.monotonic()
+            due = [user_id for user_id in pending if next_send.get(user_id, 0) <= now]
+            if not due:
+                if options['once'] and not fetched and not pending:
+                    break
+                if len(fetched) < options['batch_size']:
+                    waits = [next_send[user_id] - now for user_id in pending]
+                    await asyncio.sleep(max(min(waits + [options['interval']]), 0.01))
+                continue
+
+            results = await asyncio.gather(*(
+                self._deliver(channel_layer, semaphore, pending[user_id], options) for user_id in due
+            ))
+            delivered, failed = [], []
+            for user_id, (sent, ok) in zip(due, results):
+                if ok:
+                    delivered.extend(event.pk for event in pending.pop(user_id))
+                    next_send[user_id] = now + options['rate_limit']
+                else:
+                    failed.append(pending[user_id][0].pk)
+            await sync_to_async(self._acknowledge)(delivered, failed)
+            buffered_ids.difference_update(delivered)
+            delivered_total += len(delivered)
+            for user_id in [user_id for user_id, at in next_send.items() if at <= now and user_id not in pending]:
+                del next_send[user_id]
+
+            if failed:
+                self.stderr.write(f'{len(failed)} users could not be reached, retrying in {backoff:.1f}s')
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, options['max_backoff'])
+            else:
+                backoff = options['interval']
+
+            if time.monotonic() - reported_at >= 60:
+                self.stdout.write(f'Delivered {delivered_total} events ({len(buffered_ids)} buffered)')
+                reported_at = time.monotonic()
+
+        self.stdout.write(self.style.SUCCESS(f'Delivered {delivered_total} events'))
+
+    async def _deliver(self, channel_layer, semaphore, events, options):
+        """Send one user's buffered events; return (messages sent, success)."""
+        if len(events) > options['max_backlog']:
+            messages = [{
+                'type': 'user.event', 'id': events[-1].pk, 'event': 'resync',
+                'data': {'reason': 'backlog', 'skipped': len(events)},
+            }]
+        else:
+            messages = coalesced_messages(events, options['max_items'])
+        group = user_group(events[0].user_id)
+        async with semaphore:
+            for sent, message in enumerate(messages):
+                try:
+                    await channel_layer.group_send(group, message)
+                except Exception:
+                    return sent, False
+        return len(messages), True
+
+    def _fetch(self, cursor, options):
+        close_old_connections()
+        events = OutboxEvent.objects.filter(id__gt=cursor)
+        if options['shards'] > 1:
+            events = events.alias(shard=Mod('user_id', options['shards'])).filter(shard=options['shard'])
+        return list(events.order_by('id')[:options['batch_size']])
+
+    def _acknowledge(self, delivered, failed):
+        if delivered:
+            OutboxEvent.objects.filter(id__in=delivered).delete()
+        if failed:
+            OutboxEvent.objects.filter(id__in=failed).update(attempts=F('attempts') + 1)
@@ -0,0 +1,51 @@
+"""
+Management command that exports personal data as NDJSON (see wishes.export).
+Either one user's data, as served by /api/export/, or every user's for
+bulk admin exports. Rows are streamed to the output as they are read.
+"""
+from django.core.management.base import BaseCommand, CommandError
+import sys
+import time
+
+from users.models import User
+from wishes.export import export_lines, zipped
+
+
+class Command(BaseCommand):
+    help = 'Stream the data of one user, or of all users, as NDJSON (optionally zipped)'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Email or id of the user to export')
+        target.add_argument('--all', action='store_true', help='Export every user')
+        parser.add_argument('--output', default='-', help='File to write (default: stdout)')
+        parser.add_argument('--zip', action='store_true', help='Write a zip archive instead of plain NDJSON')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip (default: EXPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            lookup = {'pk': options['user']} if options['user'].isdigit() else {'email': options['user']}
+            try:
+                user = User.objects.get(**lookup)
+            except User.DoesNotExist:
+                raise CommandError(f'No user {options["user"]}')
+
+        chunks = export_lines(user, options['chunk_size'])
+        if options['zip']:
+            chunks = zipped(chunks, 'export.ndjson')
+
+        started = time.perf_counter()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {written / 1024 / 1024:.1f} MiB to {options["output"]} in {time.perf_counter() - started:.1f}s'
+            ))
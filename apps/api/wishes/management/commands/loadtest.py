@@ -0,0 +1,407 @@
+"""
+Management command to load test a running API server.
+Each virtual user logs in through /api/token/, keeps its tokens fresh through
+/api/token/refresh/ and runs a weighted mix of requests until the deadline.
+Only the standard library is used, so nothing but the server is required.
+
+Users are expected to exist already, for example from seed_scale_data.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from collections import Counter
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+import http.client
+import json
+import random
+import threading
+import time
+
+from .benchmark import percentile
+
+
+DEFAULT_MIX = {
+    'wishes.list': 15,
+    'wishes.create': 5,
+    'wishes.update': 4,
+    'wishes.delete': 3,
+    'matches.list': 10,
+    'matches.accept': 3,
+    'matches.reject': 1,
+    'assignments.list': 12,
+    'negotiations.list': 10,
+    'negotiations.propose': 6,
+    'rankings.most_completed': 6,
+    'rankings.best_rated': 6,
+    'rankings.fastest_completion': 4,
+    'users.me': 15,
+}
+
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def parse_mix(value):
+    """Parse "name=weight,name=weight" into a mix dict."""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise CommandError(f'Unknown action in --mix: {name}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class ActionStats:
+    """Latencies and outcomes for one action, owned by a single thread."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.exceptions = 0
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.exceptions += other.exceptions
+
+
+class VirtualUser(threading.Thread):
+    """One simulated client with its own keep-alive connection."""
+
+    def __init__(self, base_url, email, password, mix, deadline, options):
+        super().__init__(daemon=True)
+        parts = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.email = email
+        self.password = password
+        self.actions = list(mix)
+        self.weights = list(mix.values())
+        self.deadline = deadline
+        self.think = options['think_ms'] / 1000
+        self.refresh_interval = options['refresh_interval']
+        self.timeout = options['timeout']
+        # Hot reads go to the async views of fantasy_life.async_api with --async-reads
+        self.reads = '/api/async' if options.get('async_reads') else '/api'
+        self.rng = random.Random(email)
+        self.stats = {}
+        self.connection = None
+        self.access = None
+        self.refresh = None
+        self.refreshed_at = 0
+        self.wish_ids = []
+        self.categories = []
+        self.assignments = []
+        self.matches = []
+
+    def request(self, name, method, path, body=None, authenticated=True):
+        """Send one request and record it under name; returns (status, data)."""
+        stats = self.stats.setdefault(name, ActionStats())
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if authenticated and self.access:
+            headers['Authorization'] = f'Bearer {self.access}'
+        payload = json.dumps(body) if body is not None else None
+
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = self.connection_class(self.netloc, timeout=self.timeout)
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            stats.latencies.append((time.perf_counter() - started) * 1000)
+            stats.exceptions += 1
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            return None, None
+        stats.latencies.append((time.perf_counter() - started) * 1000)
+        stats.statuses[response.status] += 1
+
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        return response.status, data
+
+    def login(self):
+        status, data = self.request('auth.login', 'POST', '/api/token/', {
+            'email': self.email, 'password': self.password,
+        }, authenticated=False)
+        if status != 200:
+            return False
+        self.access, self.refresh = data['access'], data['refresh']
+        self.refreshed_at = time.monotonic()
+        return True
+
+    def refresh_tokens(self):
+        status, data = self.request(
+            'auth.refresh', 'POST', '/api/token/refresh/', {'refresh': self.refresh}, authenticated=False
+        )
+        if status != 200:
+            return self.login()
+        self.access = data['access']
+        self.refresh = data.get('refresh', self.refresh)
+        self.refreshed_at = time.monotonic()
+        return True
+
+    def results(self, data):
+        if isinstance(data, dict):
+            return data.get('results', [])
+        return data or []
+
+    def run(self):
+        if not self.login():
+            return
+        _, data = self.request('categories.list', 'GET', '/api/categories/')
+        self.categories = [category['id'] for category in self.results(data)]
+        _, data = self.request('assignments.list', 'GET', f'{self.reads}/assignments/')
+        self.assignments = [assignment['id'] for assignment in self.results(data)]
+
+        while time.monotonic() < self.deadline:
+            if time.monotonic() - self.refreshed_at > self.refresh_interval:
+                if not self.refresh_tokens():
+                    return
+            action = self.rng.choices(self.actions, self.weights)[0]
+            status = getattr(self, 'do_' + action.replace('.', '_'))(action)
+            if status == 401 and not self.refresh_tokens():
+                return
+            if self.think:
+                time.sleep(self.rng.uniform(0, 2 * self.think))
+
+    def do_wishes_list(self, name):
+        status, data = self.request(name, 'GET', '/api/wishes/')
+        if status == 200:
+            self.wish_ids = [wish['id'] for wish in self.results(data)]
+        return status
+
+    def do_wishes_create(self, name):
+        if not self.categories:
+            return self.do_wishes_list('wishes.list')
+        status, data = self.request(name, 'POST', '/api/wishes/', {
+            'category': self.rng.choice(self.categories),
+            'title': f'Load test wish {self.rng.randint(1, 10 ** 6)}',
+            'description': 'Created by loadtest',
+        })
+        if status == 201:
+            self.wish_ids.append(data['id'])
+        return status
+
+    def do_wishes_update(self, name):
+        if not self.wish_ids:
+            return self.do_wishes_list('wishes.list')
+        wish_id = self.rng.choice(self.wish_ids)
+        status, _ = self.request(name, 'PATCH', f'/api/wishes/{wish_id}/', {
+            'description': f'Updated by loadtest {self.rng.random():.6f}',
+        })
+        return status
+
+    def do_wishes_delete(self, name):
+        if not self.wish_ids:
+            return self.do_wishes_list('wishes.list')
+        wish_id = self.wish_ids.pop(self.rng.randrange(len(self.wish_ids)))
+        status, _ = self.request(name, 'DELETE', f'/api/wishes/{wish_id}/')
+        return status
+
+    def do_matches_list(self, name):
+        status, data = self.request(name, 'GET', '/api/matches/')
+        if status == 200:
+            self.matches = [
+                match['id'] for match in self.results(data) if match['status'] == 'pending'
+            ]
+        return status
+
+    def do_matches_accept(self, name):
+        if not self.matches:
+            return self.do_matches_list('matches.list')
+        status, _ = self.request(name, 'POST', f'/api/matches/{self.matches.pop()}/accept/')
+        return status
+
+    def do_matches_reject(self, name):
+        if not self.matches:
+            return self.do_matches_list('matches.list')
+        status, _ = self.request(name, 'POST', f'/api/matches/{self.matches.pop()}/reject/')
+        return status
+
+    def do_assignments_list(self, name):
+        status, _ = self.request(name, 'GET', f'{self.reads}/assignments/')
+        return status
+
+    def do_negotiations_list(self, name):
+        status, _ = self.request(name, 'GET', f'{self.reads}/negotiations/')
+        return status
+
+    def do_negotiations_propose(self, name):
+        if not self.assignments:
+            return self.do_negotiations_list('negotiations.list')
+        proposed = date.today() + timedelta(days=self.rng.randint(1, 30))
+        status, _ = self.request(name, 'POST', '/api/negotiations/', {
+            'assignment': self.rng.choice(self.assignments),
+            'proposed_date': proposed.isoformat(),
+            'message': 'Proposed by loadtest',
+        })
+        return status
+
+    def do_rankings_most_completed(self, name):
+        return self.request(name, 'GET', f'{self.reads}/rankings/most_completed/')[0]
+
+    def do_rankings_best_rated(self, name):
+        return self.request(name, 'GET', f'{self.reads}/rankings/best_rated/')[0]
+
+    def do_rankings_fastest_completion(self, name):
+        return self.request(name, 'GET', f'{self.reads}/rankings/fastest_completion/')[0]
+
+    def do_users_me(self, name):
+        return self.request(name, 'GET', f'{self.reads}/users/me/')[0]
+
+
+def run_virtual_users(options, mix):
+    """Run options['concurrency'] virtual users until the deadline; returns (stats, elapsed)."""
+    started = time.monotonic()
+    deadline = started + options['duration']
+    users = [
+        VirtualUser(
+            options['base_url'],
+            f'{options["prefix"]}-{index % options["accounts"]}@example.com',
+            options['password'],
+            mix,
+            deadline,
+            options,
+        )
+        for index in range(options['concurrency'])
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+
+    stats = {}
+    for user in users:
+        for name, action_stats in user.stats.items():
+            stats.setdefault(name, ActionStats()).merge(action_stats)
+    return stats, elapsed
+
+
+def build_report(stats, elapsed):
+    """Summarize merged ActionStats into a JSON-serializable report."""
+    actions = {}
+    all_latencies = []
+    totals = Counter()
+    for name in sorted(stats):
+        action = stats[name]
+        latencies = sorted(action.latencies)
+        all_latencies.extend(latencies)
+        server_errors = sum(count for code, count in action.statuses.items() if code >= 500)
+        client_errors = sum(count for code, count in action.statuses.items() if 400 <= code < 500)
+        totals.update(
+            requests=len(latencies), server_errors=server_errors,
+            client_errors=client_errors, exceptions=action.exceptions,
+        )
+        actions[name] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'client_errors': client_errors,
+            'server_errors': server_errors,
+            'exceptions': action.exceptions,
+            'statuses': {str(code): count for code, count in sorted(action.statuses.items())},
+        }
+
+    all_latencies.sort()
+    histogram = {}
+    lower = 0
+    index = 0
+    for bound in HISTOGRAM_BUCKETS_MS + (float('inf'),):
+        count = 0
+        while index < len(all_latencies) and all_latencies[index] <= bound:
+            count += 1
+            index += 1
+        label = f'{lower}-{bound}' if bound != float('inf') else f'>{lower}'
+        histogram[label] = count
+        lower = bound
+
+    requests = totals['requests']
+    failures = totals['server_errors'] + totals['exceptions']
+    return {
+        'duration_s': round(elapsed, 2),
+        'requests': requests,
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'error_rate': round(failures / requests, 4) if requests else 0.0,
+        'client_error_rate': round(totals['client_errors'] / requests, 4) if requests else 0.0,
+        'p50_ms': round(percentile(all_latencies, 0.50), 2),
+        'p95_ms': round(percentile(all_latencies, 0.95), 2),
+        'p99_ms': round(percentile(all_latencies, 0.99), 2),
+        'histogram_ms': histogram,
+        'actions': actions,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Run a concurrent load test with a realistic traffic mix against a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='Server to test (default: http://127.0.0.1:8000)')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Number of concurrent virtual users (default: 20)')
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Test duration in seconds (default: 60)')
+        parser.add_argument('--prefix', default='scale',
+                            help='seed_scale_data prefix of the accounts to log in as (default: scale)')
+        parser.add_argument('--accounts', type=int, default=100,
+                            help='Distinct accounts to spread virtual users over (default: 100)')
+        parser.add_argument('--password', default='scale-data-pass',
+                            help='Password of the seeded accounts')
+        parser.add_argument('--mix', type=parse_mix, default=None,
+                            help='Weighted action mix, e.g. "users.me=5,wishes.list=2"')
+        parser.add_argument('--think-ms', type=float, default=0,
+                            help='Mean think time between requests per user (default: 0)')
+        parser.add_argument('--refresh-interval', type=float, default=30,
+                            help='Seconds between token refreshes per user (default: 30)')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Per-request timeout in seconds (default: 30)')
+        parser.add_argument('--async-reads', action='store_true',
+                            help='Send users.me, assignments, negotiations and rankings to /api/async/')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        mix = options['mix'] or DEFAULT_MIX
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Load testing {options["base_url"]} with {options["concurrency"]} users '
+            f'for {options["duration"]:.0f}s ==='
+        ))
+        report = build_report(*run_virtual_users(options, mix))
+        self._print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f'\n{"action":<30} {"reqs":>7} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"4xx":>6} {"5xx":>6} {"exc":>5}'
+        )
+        for name, action in report['actions'].items():
+            self.stdout.write(
+                f'{name:<30} {action["requests"]:>7} {action["throughput_rps"]:>8.1f} '
+                f'{action["p50_ms"]:>8.1f} {action["p95_ms"]:>8.1f} {action["p99_ms"]:>8.1f} '
+                f'{action["client_errors"]:>6} {action["server_errors"]:>6} {action["exceptions"]:>5}'
+            )
+
+        self.stdout.write('\nLatency histogram (ms):')
+        peak = max(report['histogram_ms'].values()) or 1
+        for label, count in report['histogram_ms'].items():
+            self.stdout.write(f'  {label:>12} {count:>8} {"#" * round(40 * count / peak)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== {report["requests"]} requests in {report["duration_s"]}s: '
+            f'{report["throughput_rps"]} req/s, p50 {report["p50_ms"]} ms, p95 {report["p95_ms"]} ms, '
+            f'error rate {report["error_rate"]:.2%} (4xx {report["client_error_rate"]:.2%}) ===\n'
+        ))
@@ -0,0 +1,18 @@
+"""
+Management command that recomputes every ranking rollup.
+"""
+from django.core.management.base import BaseCommand
+import time
+
+from wishes.rankings import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = 'Recompute ranking rollups from live and archived assignments'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ranked = rebuild_rankings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rankings of {ranked} users in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,434 @@
+"""
+Management command to generate a production-sized dataset.
+Rows are written in batches and every random choice comes from a seeded
+generator, so the same arguments always produce the same data.
+
+Users, matches and periods go through bulk_create. Wishes, assignments,
+negotiations and executions make up almost all rows, so they are inserted
+as pre-built tuples with pre-allocated ids, which skips bulk_create's
+per-value field preparation.
+"""
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+import random
+import time
+
+from wishes.models import Category, Wish, Match, Period, Assignment, Negotiation, Execution
+from wishes.eligibility import rebuild_wish_counts
+from wishes.rankings import rebuild_rankings
+from users.models import User
+
+
+WORDS = (
+    'cena', 'playa', 'viaje', 'masaje', 'concierto', 'picnic', 'museo', 'baile',
+    'desayuno', 'paseo', 'carta', 'película', 'montaña', 'juego', 'regalo', 'sorpresa',
+    'noche', 'domingo', 'lluvia', 'jardín', 'receta', 'canción', 'libro', 'estrellas',
+)
+
+# Ages are kept at least ten days away from the 18th birthday so that
+# is_adult stays stable for the lifetime of the dataset.
+MINOR_AGE_DAYS = (13 * 365, 18 * 365 - 10)
+ADULT_AGE_DAYS = (18 * 365 + 10, 70 * 365)
+
+PUBLIC_STATUS_WEIGHTS = (
+    (Match.STATUS_ACCEPTED, 70),
+    (Match.STATUS_PENDING, 20),
+    (Match.STATUS_REJECTED, 7),
+    (Match.STATUS_BLOCKED, 3),
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large deterministic dataset for performance work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+        parser.add_argument('--minor-ratio', type=float, default=0.15,
+                            help='Fraction of users under 18 (default: 0.15)')
+        parser.add_argument('--public-ratio', type=float, default=0.5,
+                            help='Fraction of users with public mode active (default: 0.5)')
+        parser.add_argument('--private-ratio', type=float, default=0.4,
+                            help='Fraction of users paired in private matches (default: 0.4)')
+        parser.add_argument('--wishes-per-category', type=int, default=3,
+                            help='Average active wishes per user and category (default: 3)')
+        parser.add_argument('--public-matches', type=int, default=3,
+                            help='Public matches requested per public-mode user (default: 3)')
+        parser.add_argument('--periods', type=int, default=6,
+                            help='Number of historical periods (default: 6)')
+        parser.add_argument('--period-days', type=int, default=30,
+                            help='Length of each historical period in days (default: 30)')
+        parser.add_argument('--completion-rate', type=float, default=0.6,
+                            help='Fraction of assignments completed with an execution (default: 0.6)')
+        parser.add_argument('--negotiation-rate', type=float, default=0.5,
+                            help='Fraction of assignments with negotiations (default: 0.5)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per insert batch (default: 5000)')
+        parser.add_argument('--prefix', default='scale',
+                            help='Prefix for generated emails and nicknames (default: scale)')
+        parser.add_argument('--password', default='scale-data-pass',
+                            help='Password shared by all generated users')
+        parser.add_argument('--anchor-date', type=date.fromisoformat, default=None,
+                            help='Date treated as "today" (default: current date)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = options['anchor_date'] or timezone.now().date()
+        self.counts = {}
+        self.next_ids = {}
+        self.now = connection.ops.adapt_datetimefield_value(timezone.now())
+        prefix = options['prefix']
+
+        if User.objects.filter(nickname__startswith=f'{prefix}-').exists():
+            raise CommandError(
+                f'Users with prefix "{prefix}" already exist; use another --prefix or a fresh database'
+            )
+
+        if not Category.objects.filter(is_active=True).exists():
+            call_command('seed_categories', stdout=self.stdout)
+        categories = list(Category.objects.filter(is_active=True).order_by('id'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== Generating scale data (seed {options["seed"]}) ==='
+        ))
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            users = self._create_users(options, prefix)
+            wishes = self._create_wishes(users, categories, options['wishes_per_category'])
+            private_matches, public_matches = self._create_matches(users, categories, options)
+            for index in range(1, options['periods'] + 1):
+                self._create_period(
+                    index, users, categories, wishes, private_matches, public_matches, options
+                )
+            self._reset_sequences()
+            # Wishes and executions were inserted without signals
+            rebuild_rankings()
+            rebuild_wish_counts()
+
+        elapsed = time.perf_counter() - started
+        total = sum(self.counts.values())
+        for label, count in self.counts.items():
+            self.stdout.write(f'  {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n=== {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9) * 60:,.0f} rows/min) ===\n'
+        ))
+
+    def _bulk_create(self, model, objs):
+        """Insert objs in batches and keep a per-table row count."""
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        label = model._meta.db_table
+        self.counts[label] = self.counts.get(label, 0) + len(created)
+        return created
+
+    def _insert(self, model, columns, rows):
+        """
+        Insert tuples of database-ready values, ids included.
+        Ids are handed out by _allocate_ids, so nothing is read back.
+        """
+        if not rows:
+            return
+        fields = [model._meta.get_field(name) for name in columns]
+        table = connection.ops.quote_name(model._meta.db_table)
+        column_sql = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        size = min(self.batch_size, connection.ops.bulk_batch_size(fields, rows))
+        with connection.cursor() as cursor:
+            for offset in range(0, len(rows), size):
+                chunk = rows[offset:offset + size]
+                cursor.execute(
+                    f'INSERT INTO {table} ({column_sql}) VALUES {", ".join([placeholder] * len(chunk))}',
+                    [value for row in chunk for value in row],
+                )
+        label = model._meta.db_table
+        self.counts[label] = self.counts.get(label, 0) + len(rows)
+
+    def _allocate_ids(self, model, count):
+        """Reserve count consecutive primary keys for model."""
+        if model not in self.next_ids:
+            self.next_ids[model] = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        first = self.next_ids[model]
+        self.next_ids[model] = first + count
+        return range(first, first + count)
+
+    def _reset_sequences(self):
+        """Move database sequences past the ids inserted by _insert."""
+        statements = connection.ops.sequence_reset_sql(no_style(), list(self.next_ids))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _create_users(self, options, prefix):
+        """
+        Create users with a mix of minors and adults.
+        Returns a list of (id, is_adult, is_public_mode_active) tuples.
+        """
+        rng = self.rng
+        encoded_password = make_password(options['password'])
+        joined_before = datetime.combine(self.today, dt_time(), tzinfo=dt_timezone.utc)
+        users = []
+        batch = []
+        flags = []
+
+        for number in range(options['users']):
+            is_adult = rng.random() >= options['minor_ratio']
+            age_days = rng.randint(*(ADULT_AGE_DAYS if is_adult else MINOR_AGE_DAYS))
+            is_public = rng.random() < options['public_ratio']
+            nickname = f'{prefix}-{number}'
+            batch.append(User(
+                email=f'{prefix}-{number}@example.com',
+                nickname=nickname,
+                # bulk_create skips User.save()
+                nickname_search=nickname.casefold(),
+                password=encoded_password,
+                date_of_birth=self.today - timedelta(days=age_days),
+                is_public_mode_active=is_public,
+                date_joined=joined_before - timedelta(seconds=rng.randint(0, 730 * 86400)),
+            ))
+            flags.append((is_adult, is_public))
+            if len(batch) >= self.batch_size:
+                users.extend(self._flush_users(batch, flags))
+                batch, flags = [], []
+
+        if batch:
+            users.extend(self._flush_users(batch, flags))
+        return users
+
+    def _flush_users(self, batch, flags):
+        created = self._bulk_create(User, batch)
+        return [(user.pk, is_adult, is_public) for user, (is_adult, is_public) in zip(created, flags)]
+
+    def _create_wishes(self, users, categories, per_category):
+        """
+        Create active wishes for every user and allowed category.
+        Returns {owner_id: {category_id: [wish ids]}}.
+        """
+        rng = self.rng
+        wishes = {}
+        batch = []
+
+        for user_id, is_adult, _ in users:
+            for category in categories:
+                if category.is_adult and not is_adult:
+                    continue
+                for _ in range(rng.randint(0, per_category * 2)):
+                    words = rng.sample(WORDS, 4)
+                    batch.append((user_id, category.pk, ' '.join(words[:2]).capitalize(), ' '.join(words)))
+            if len(batch) >= self.batch_size:
+                self._flush_wishes(batch, wishes)
+                batch = []
+
+        if batch:
+            self._flush_wishes(batch, wishes)
+        return wishes
+
+    def _flush_wishes(self, batch, wishes):
+        rows = []
+        for wish_id, (user_id, category_id, title, description) in zip(
+            self._allocate_ids(Wish, len(batch)), batch
+        ):
+            rows.append((wish_id, user_id, category_id, title, description, True, self.now, self.now))
+            wishes.setdefault(user_id, {}).setdefault(category_id, []).append(wish_id)
+        self._insert(
+            Wish,
+            ('id', 'user', 'category', 'title', 'description', 'is_active', 'created_at', 'updated_at'),
+            rows,
+        )
+
+    def _create_matches(self, users, categories, options):
+        """
+        Pair users into private couples and a public network.
+        Returns the accepted private and public matches as plain tuples.
+        """
+        rng = self.rng
+        adult = {user_id: is_adult for user_id, is_adult, _ in users}
+        pairs = set()
+        matches = []
+        private_settings = []
+
+        shuffled = [user_id for user_id, _, _ in users]
+        rng.shuffle(shuffled)
+        couples = int(len(shuffled) * options['private_ratio']) // 2
+        for index in range(couples):
+            user1, user2 = sorted(shuffled[2 * index:2 * index + 2])
+            pairs.add((user1, user2))
+            allowed = [c.pk for c in categories if not c.is_adult or (adult[user1] and adult[user2])]
+            chosen = rng.sample(allowed, rng.randint(1, len(allowed)))
+            matches.append(Match(
+                user1_id=user1,
+                user2_id=user2,
+                mode=Match.MODE_PRIVATE,
+                status=Match.STATUS_ACCEPTED if rng.random() < 0.9 else Match.STATUS_PENDING,
+                private_period_days=rng.choice((None, 14, 30)),
+            ))
+            private_settings.append(sorted(chosen))
+
+        public_users = [user_id for user_id, _, is_public in users if is_public]
+        statuses = [status for status, _ in PUBLIC_STATUS_WEIGHTS]
+        weights = [weight for _, weight in PUBLIC_STATUS_WEIGHTS]
+        if len(public_users) > 1:
+            for user_id in public_users:
+                for _ in range(options['public_matches']):
+                    other = rng.choice(public_users)
+                    pair = tuple(sorted((user_id, other)))
+                    if other == user_id or pair in pairs:
+                        continue
+                    pairs.add(pair)
+                    matches.append(Match(
+                        user1_id=pair[0],
+                        user2_id=pair[1],
+                        mode=Match.MODE_PUBLIC,
+                        status=rng.choices(statuses, weights)[0],
+                    ))
+
+        created = self._bulk_create(Match, matches)
+
+        through = Match.private_categories.through
+        links = []
+        private_matches = []
+        public_matches = []
+        for match, category_ids in zip(created, private_settings):
+            links.extend(through(match_id=match.pk, category_id=c) for c in category_ids)
+            if match.status == Match.STATUS_ACCEPTED:
+                private_matches.append(
+                    (match.pk, match.user1_id, match.user2_id, match.private_period_days, category_ids)
+                )
+        for match in created[len(private_settings):]:
+            if match.status == Match.STATUS_ACCEPTED:
+                public_matches.append((match.user1_id, match.user2_id))
+        self._bulk_create(through, links)
+
+        return private_matches, public_matches
+
+    def _create_period(self, index, users, categories, wishes, private_matches, public_matches, options):
+        """Create one historical period with its assignments, negotiations and executions."""
+        rng = self.rng
+        days = options['period_days']
+        start = self.today - timedelta(days=index * days)
+        end = start + timedelta(days=days)
+        adult = {user_id: is_adult for user_id, is_adult, _ in users}
+        by_id = {category.pk: category for category in categories}
+
+        global_period, = self._bulk_create(Period, [
+            Period(match=None, start_date=start, end_date=end, is_active=False)
+        ])
+        match_periods = self._bulk_create(Period, [
+            Period(
+                match_id=match_id,
+                start_date=start,
+                end_date=start + timedelta(days=period_days or days),
+                is_active=False,
+            )
+            for match_id, _, _, period_days, _ in private_matches
+        ])
+
+        # assigned_at is auto_now_add on the model; the raw insert lets it be backdated.
+        assigned_at = connection.ops.adapt_datetimefield_value(
+            datetime.combine(start, dt_time(9), tzinfo=dt_timezone.utc)
+        )
+        pending = []
+
+        def assign(owner, executor, period_id, due_date, category_ids, is_public):
+            owner_wishes = wishes.get(owner, {})
+            for category_id in category_ids:
+                category = by_id[category_id]
+                if category.is_adult and not adult[executor]:
+                    continue
+                candidates = owner_wishes.get(category_id)
+                if not candidates:
+                    continue
+                count = min(len(candidates), category.max_wishes_per_period)
+                for wish_id in rng.sample(candidates, count):
+                    is_rejected = is_public and rng.random() < 0.05
+                    is_completed = not is_rejected and rng.random() < options['completion_rate']
+                    pending.append((
+                        owner, executor, period_id, wish_id, due_date, is_completed, is_rejected
+                    ))
+            if len(pending) >= self.batch_size:
+                self._flush_assignments(pending, start, assigned_at, options)
+                pending.clear()
+
+        for period, (_, user1, user2, _, category_ids) in zip(match_periods, private_matches):
+            assign(user1, user2, period.pk, period.end_date, category_ids, False)
+            assign(user2, user1, period.pk, period.end_date, category_ids, False)
+
+        all_category_ids = list(by_id)
+        for user1, user2 in public_matches:
+            assign(user1, user2, global_period.pk, end, all_category_ids, True)
+            assign(user2, user1, global_period.pk, end, all_category_ids, True)
+
+        if pending:
+            self._flush_assignments(pending, start, assigned_at, options)
+
+        self.stdout.write(f'  Period {start} to {end}: done')
+
+    def _flush_assignments(self, pending, start, assigned_at, options):
+        """Insert a batch of assignments, then their negotiations and executions."""
+        rng = self.rng
+        date_value = connection.ops.adapt_datefield_value
+        assignments = []
+        negotiations = []
+        executions = []
+
+        for assignment_id, row in zip(self._allocate_ids(Assignment, len(pending)), pending):
+            owner, executor, period_id, wish_id, due_date, is_completed, is_rejected = row
+            assignments.append((
+                assignment_id, period_id, wish_id, executor, assigned_at,
+                date_value(due_date), is_completed, is_rejected,
+            ))
+            window = max((due_date - start).days, 1)
+            if rng.random() < options['negotiation_rate']:
+                rounds = rng.randint(1, 3)
+                for round_number in range(rounds):
+                    if round_number < rounds - 1:
+                        negotiation_status = Negotiation.STATUS_REJECTED
+                    elif is_completed:
+                        negotiation_status = Negotiation.STATUS_ACCEPTED
+                    else:
+                        negotiation_status = rng.choice((Negotiation.STATUS_PENDING, Negotiation.STATUS_REJECTED))
+                    negotiations.append((
+                        assignment_id,
+                        executor if round_number % 2 == 0 else owner,
+                        date_value(start + timedelta(days=rng.randint(0, window))),
+                        negotiation_status,
+                    ))
+            if is_completed:
+                executions.append((
+                    assignment_id,
+                    date_value(start + timedelta(days=rng.randint(0, window))),
+                    rng.choices((1, 2, 3, 4, 5), (2, 5, 15, 38, 40))[0],
+                ))
+
+        self._insert(
+            Assignment,
+            ('id', 'period', 'wish', 'assigned_to', 'assigned_at', 'due_date', 'is_completed', 'is_rejected'),
+            assignments,
+        )
+        self._insert(
+            Negotiation,
+            ('id', 'assignment', 'proposed_by', 'proposed_date', 'proposed_time', 'message',
+             'status', 'response_message', 'created_at', 'updated_at'),
+            [
+                (negotiation_id, assignment_id, proposed_by, proposed_date, None, '',
+                 negotiation_status, '', self.now, self.now)
+                for negotiation_id, (assignment_id, proposed_by, proposed_date, negotiation_status)
+                in zip(self._allocate_ids(Negotiation, len(negotiations)), negotiations)
+            ],
+        )
+        self._insert(
+            Execution,
+            ('id', 'assignment', 'completed_date', 'completed_time', 'rating',
+             'comment_by_creator', 'comment_by_executor', 'created_at'),
+            [
+                (execution_id, assignment_id, completed_date, None, rating, '', '', self.now)
+                for execution_id, (assignment_id, completed_date, rating)
+                in zip(self._allocate_ids(Execution, len(executions)), executions)
+            ],
+        )
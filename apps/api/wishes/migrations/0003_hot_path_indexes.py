@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-19 03:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+from fantasy_life.indexes import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wishes', '0002_outbox_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('is_completed', False), ('is_rejected', False)), fields=['assigned_to', 'due_date'], name='assignments_open_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='match',
+            index=models.Index(condition=models.Q(('status', 'accepted')), fields=['mode', 'user1', 'user2'], name='matches_accepted_mode_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='negotiation',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['assignment', 'proposed_date'], name='negotiations_pending_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='wish',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'category'], name='wishes_active_user_cat_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.1.15 on 2026-10-19 04:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_rankings(apps, schema_editor):
+    from wishes.rankings import rebuild_rankings
+
+    rebuild_rankings(
+        apps.get_model('wishes', 'Assignment'),
+        apps.get_model('wishes', 'ArchivedAssignment'),
+        apps.get_model('wishes', 'RankingRollup'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishes', '0003_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAssignment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('period_id', models.BigIntegerField()),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('wish_id', models.BigIntegerField()),
+                ('assigned_to_id', models.BigIntegerField(db_index=True)),
+                ('assigned_at', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('is_completed', models.BooleanField()),
+                ('is_rejected', models.BooleanField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'archived_assignments',
+                'ordering': ['-assigned_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedExecution',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('completed_date', models.DateField()),
+                ('completed_time', models.TimeField(blank=True, null=True)),
+                ('rating', models.IntegerField()),
+                ('comment_by_creator', models.TextField(blank=True)),
+                ('comment_by_executor', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('assignment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='execution', to='wishes.archivedassignment')),
+            ],
+            options={
+                'db_table': 'archived_executions',
+                'ordering': ['-completed_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedNegotiation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('proposed_by_id', models.BigIntegerField()),
+                ('proposed_date', models.DateField()),
+                ('proposed_time', models.TimeField(blank=True, null=True)),
+                ('message', models.TextField(blank=True)),
+                ('status', models.CharField(max_length=10)),
+                ('response_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='negotiations', to='wishes.archivedassignment')),
+            ],
+            options={
+                'db_table': 'archived_negotiations',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RankingRollup',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking_rollup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('completion_days_sum', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ranking_rollups',
+                'indexes': [models.Index(fields=['completed_count'], name='ranking_rol_complet_695a68_idx')],
+            },
+        ),
+        migrations.RunPython(populate_rankings, migrations.RunPython.noop),
+    ]
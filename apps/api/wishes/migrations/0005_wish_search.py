@@ -0,0 +1,46 @@
+from django.db import migrations
+
+from fantasy_life.fts import create_fts5_table, drop_fts5_table
+
+
+WISHES_SEARCH_COLUMNS = {
+    'title': '{row}.title',
+    'description': '{row}.description',
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from wishes.search import search_vector
+
+        # Built from the same expression the search queries use, so they match it
+        Wish = apps.get_model('wishes', 'Wish')
+        schema_editor.add_index(Wish, GinIndex(search_vector(), name='wishes_search_idx'), concurrently=True)
+    elif vendor == 'sqlite':
+        create_fts5_table(
+            schema_editor, 'wishes_search', 'wishes', WISHES_SEARCH_COLUMNS,
+            watched=('title', 'description'), tokenize='unicode61 remove_diacritics 2',
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS wishes_search_idx')
+    elif vendor == 'sqlite':
+        drop_fts5_table(schema_editor, 'wishes_search')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wishes', '0004_archive_and_ranking_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
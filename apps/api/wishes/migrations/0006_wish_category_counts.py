@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-19 04:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_counts(apps, schema_editor):
+    from wishes.eligibility import rebuild_wish_counts
+
+    rebuild_wish_counts(apps.get_model('wishes', 'Wish'), apps.get_model('wishes', 'WishCategoryCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishes', '0005_wish_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WishCategoryCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wish_counts', to='wishes.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wish_category_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'wish_category_counts',
+                'unique_together': {('user', 'category')},
+            },
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
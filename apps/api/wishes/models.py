@@ -1,9 +1,22 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 
+class EventSourceMixin:
+    """
+    Saves inside a transaction, so rows written by post_save receivers (the
+    outbox rows of wishes.events, the counters of wishes.eligibility) commit
+    or roll back together with the change itself.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
 class Category(models.Model):
     """Global wish categories with their own rules."""
     name = models.CharField(max_length=100, unique=True)
@@ -36,7 +49,7 @@ class Category(models.Model):
         return f"{self.name} {'(18+)' if self.is_adult else ''}"
 
 
-class Wish(models.Model):
+class Wish(EventSourceMixin, models.Model):
     """User wishes that can be assigned to matched users."""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -63,13 +76,29 @@ class Wish(models.Model):
         indexes = [
             models.Index(fields=['user', 'is_active']),
             models.Index(fields=['category', 'is_active']),
+            # create_period: a user's active wishes per category
+            models.Index(fields=['user', 'category'], condition=models.Q(is_active=True),
+                         name='wishes_active_user_cat_idx'),
         ]
+        # Full-text search (wishes.search) uses wishes_search_idx on PostgreSQL
+        # and the wishes_search FTS5 table on SQLite, both created by migration
+        # 0005. Migrations that remake this table on SQLite drop its triggers
+        # and must call create_fts5_table again.
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to move the wish between counters (wishes.eligibility)
+        instance._loaded_counted = (
+            instance.__dict__.get('user_id'), instance.__dict__.get('category_id'), instance.__dict__.get('is_active')
+        )
+        return instance
 
     def __str__(self):
         return f"{self.title} ({self.user.nickname})"
 
 
-class Match(models.Model):
+class Match(EventSourceMixin, models.Model):
     """Connections between users for wish exchange."""
     MODE_PRIVATE = 'private'
     MODE_PUBLIC = 'public'
@@ -127,8 +156,18 @@ class Match(models.Model):
         indexes = [
             models.Index(fields=['user1', 'status']),
             models.Index(fields=['user2', 'status']),
+            # create_period: accepted matches by mode; user columns make counts index-only
+            models.Index(fields=['mode', 'user1', 'user2'], condition=models.Q(status='accepted'),
+                         name='matches_accepted_mode_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to detect status changes (wishes.events)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def __str__(self):
         return f"{self.user1.nickname} ↔ {self.user2.nickname} ({self.get_mode_display()})"
 
@@ -167,7 +206,7 @@ class Period(models.Model):
         return f"Period {self.start_date} to {self.end_date}{match_str}"
 
 
-class Assignment(models.Model):
+class Assignment(EventSourceMixin, models.Model):
     """Random wish assignments during a period."""
     period = models.ForeignKey(
         Period,
@@ -202,13 +241,16 @@ class Assignment(models.Model):
             models.Index(fields=['assigned_to', 'is_completed']),
             models.Index(fields=['period', 'is_completed']),
             models.Index(fields=['wish']),
+            # Open assignments of a user by due date
+            models.Index(fields=['assigned_to', 'due_date'], condition=models.Q(is_completed=False, is_rejected=False),
+                         name='assignments_open_idx'),
         ]
 
     def __str__(self):
         return f"{self.wish.title} → {self.assigned_to.nickname}"
 
 
-class Negotiation(models.Model):
+class Negotiation(EventSourceMixin, models.Model):
     """Date/time negotiation for wish fulfillment."""
     STATUS_PENDING = 'pending'
     STATUS_ACCEPTED = 'accepted'
@@ -246,13 +288,23 @@ class Negotiation(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['assignment', 'status']),
+            # Pending proposals of an assignment by date
+            models.Index(fields=['assignment', 'proposed_date'], condition=models.Q(status='pending'),
+                         name='negotiations_pending_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to detect status changes (wishes.events)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def __str__(self):
         return f"Negotiation for {self.assignment} on {self.proposed_date}"
 
 
-class Execution(models.Model):
+class Execution(EventSourceMixin, models.Model):
     """Completed wishes with ratings and comments."""
     assignment = models.OneToOneField(
         Assignment,
@@ -287,7 +339,148 @@ class Execution(models.Model):
         return f"Execution of {self.assignment} - {self.rating}★"
 
     def save(self, *args, **kwargs):
-        # Mark assignment as completed
-        self.assignment.is_completed = True
-        self.assignment.save()
-        super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            # Mark assignment as completed
+            self.assignment.is_completed = True
+            self.assignment.save()
+            super().save(*args, **kwargs)
+
+
+class OutboxEvent(models.Model):
+    """
+    Event waiting to be pushed to a user, written in the same transaction as
+    the change it describes and deleted once dispatch_events delivered it.
+    """
+    user_id = models.BigIntegerField(help_text="Recipient; not a foreign key so events outlive deletions")
+    event_type = models.CharField(max_length=50)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'outbox_events'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.event_type} → user {self.user_id}"
+
+
+class ArchivedAssignment(models.Model):
+    """
+    Assignment of a period closed long ago, moved here by archive_periods.
+    Keeps the original id; references are plain ids so archived rows never
+    block deleting what they pointed to.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    period_id = models.BigIntegerField()
+    period_start = models.DateField()
+    period_end = models.DateField()
+    wish_id = models.BigIntegerField()
+    assigned_to_id = models.BigIntegerField(db_index=True)
+    assigned_at = models.DateTimeField()
+    due_date = models.DateField()
+    is_completed = models.BooleanField()
+    is_rejected = models.BooleanField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'archived_assignments'
+        ordering = ['-assigned_at']
+
+    def __str__(self):
+        return f"Archived assignment {self.pk} (period {self.period_start} to {self.period_end})"
+
+
+class ArchivedNegotiation(models.Model):
+    """Negotiation of an ArchivedAssignment."""
+    id = models.BigIntegerField(primary_key=True)
+    assignment = models.ForeignKey(
+        ArchivedAssignment,
+        on_delete=models.CASCADE,
+        related_name='negotiations'
+    )
+    proposed_by_id = models.BigIntegerField()
+    proposed_date = models.DateField()
+    proposed_time = models.TimeField(null=True, blank=True)
+    message = models.TextField(blank=True)
+    status = models.CharField(max_length=10)
+    response_message = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'archived_negotiations'
+        ordering = ['-created_at']
+
+
+class ArchivedExecution(models.Model):
+    """Execution of an ArchivedAssignment."""
+    id = models.BigIntegerField(primary_key=True)
+    assignment = models.OneToOneField(
+        ArchivedAssignment,
+        on_delete=models.CASCADE,
+        related_name='execution'
+    )
+    completed_date = models.DateField()
+    completed_time = models.TimeField(null=True, blank=True)
+    rating = models.IntegerField()
+    comment_by_creator = models.TextField(blank=True)
+    comment_by_executor = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'archived_executions'
+        ordering = ['-completed_date']
+
+
+class RankingRollup(models.Model):
+    """
+    Per-user ranking totals over live and archived assignments, kept
+    current by wishes.rankings so rankings never aggregate the history.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking_rollup'
+    )
+    completed_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    completion_days_sum = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ranking_rollups'
+        indexes = [
+            models.Index(fields=['completed_count']),
+        ]
+
+    def __str__(self):
+        return f"Rankings of user {self.user_id}"
+
+
+class WishCategoryCount(models.Model):
+    """
+    Active wishes per user and category, kept current by wishes.eligibility
+    so create_period can skip combinations with nothing to assign.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='wish_category_counts'
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='wish_counts'
+    )
+    active_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'wish_category_counts'
+        unique_together = [['user', 'category']]
+
+    def __str__(self):
+        return f"{self.active_count} active wishes of user {self.user_id} in category {self.category_id}"
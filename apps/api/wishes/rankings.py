@@ -0,0 +1,109 @@
+"""
+Ranking rollups.
+
+RankingRollup holds each user's completed count, rating sum and count, and
+total completion days, over both live and archived assignments. Saving or
+deleting an Execution recomputes its executor's row once the transaction
+commits; archive_periods only moves rows between tables, so totals stay
+the same. Writes that skip signals (bulk_create, seed_scale_data) are
+followed by rebuild_rankings.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .models import Assignment, ArchivedAssignment, Execution, RankingRollup
+
+ROLLUP_FIELDS = ('completed_count', 'rating_sum', 'rating_count', 'completion_days_sum')
+
+_suspended = ContextVar('rankings_suspended', default=False)
+
+
+def _completed_rows(assignment_model, archived_model, user_ids=None):
+    """(user id, rating, assigned_at, completed_date) of completed assignments."""
+    live = assignment_model.objects.filter(is_completed=True)
+    archived = archived_model.objects.filter(is_completed=True)
+    if user_ids is not None:
+        live = live.filter(assigned_to_id__in=user_ids)
+        archived = archived.filter(assigned_to_id__in=user_ids)
+    fields = ('assigned_to_id', 'execution__rating', 'assigned_at', 'execution__completed_date')
+    yield from live.values_list(*fields).order_by().iterator(chunk_size=2000)
+    yield from archived.values_list(*fields).order_by().iterator(chunk_size=2000)
+
+
+def compute_totals(rows):
+    """{user id: {field: total}} from _completed_rows."""
+    totals = {}
+    for user_id, rating, assigned_at, completed_date in rows:
+        user_totals = totals.setdefault(user_id, dict.fromkeys(ROLLUP_FIELDS, 0))
+        user_totals['completed_count'] += 1
+        if rating is not None:
+            user_totals['rating_sum'] += rating
+            user_totals['rating_count'] += 1
+            user_totals['completion_days_sum'] += (completed_date - timezone.localdate(assigned_at)).days
+    return totals
+
+
+def _rollups(rollup_model, user_ids, totals):
+    return [rollup_model(user_id=user_id, **totals.get(user_id, dict.fromkeys(ROLLUP_FIELDS, 0))) for user_id in user_ids]
+
+
+def _existing_user_ids(rollup_model, user_ids):
+    user_model = rollup_model._meta.get_field('user').related_model
+    return list(user_model.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+
+def refresh_rankings(user_ids):
+    """Recompute the rollups of user_ids."""
+    user_ids = _existing_user_ids(RankingRollup, set(user_ids))
+    if user_ids:
+        totals = compute_totals(_completed_rows(Assignment, ArchivedAssignment, user_ids))
+        RankingRollup.objects.bulk_create(
+            _rollups(RankingRollup, user_ids, totals),
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[*ROLLUP_FIELDS, 'updated_at'],
+        )
+
+
+def rebuild_rankings(assignment_model=Assignment, archived_model=ArchivedAssignment,
+                     rollup_model=RankingRollup, batch_size=1000):
+    """
+    Recompute every rollup from scratch; returns the number of users ranked.
+    Takes the models as arguments so migrations can pass historical ones.
+    """
+    totals = compute_totals(_completed_rows(assignment_model, archived_model))
+    # Archived rows may belong to users deleted since
+    ranked = list(totals)
+    user_ids = []
+    for start in range(0, len(ranked), batch_size):
+        user_ids += _existing_user_ids(rollup_model, ranked[start:start + batch_size])
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        rollup_model.objects.bulk_create(_rollups(rollup_model, user_ids, totals), batch_size=batch_size)
+    return len(user_ids)
+
+
+@contextmanager
+def refresh_suspended():
+    """Skip rollup refreshes for changes that don't alter totals (archiving)."""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+@receiver(post_save, sender=Execution)
+@receiver(post_delete, sender=Execution)
+def execution_changed(sender, instance, **kwargs):
+    if _suspended.get():
+        return
+    try:
+        user_id = instance.assignment.assigned_to_id
+    except Assignment.DoesNotExist:
+        return
+    transaction.on_commit(lambda: refresh_rankings([user_id]))
@@ -0,0 +1,86 @@
+"""
+Full-text search over wish titles and descriptions.
+
+PostgreSQL matches a tsvector of title (weight A) and description (weight
+B) through the wishes_search_idx GIN expression index and ranks with
+ts_rank. SQLite matches the wishes_search FTS5 table, which triggers keep
+in sync with the wishes table (see migration 0005), and ranks with bm25
+weighting title matches like weight A over B. SQLite ranks outside the
+ORM, so it serves only the MAX_RANKED_RESULTS best matches.
+Every word of the query must match the start of a word, so "pic park"
+finds "Picnic in the park".
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+import re
+
+# 'simple' skips stemming and stop words, so any language is searchable;
+# wishes_search_idx is built for this configuration
+SEARCH_CONFIG = 'simple'
+# Ranked results served on SQLite, where ranking happens outside the ORM
+MAX_RANKED_RESULTS = 1000
+# bm25 weights of the wishes_search columns (title, description)
+FTS5_WEIGHTS = (10.0, 1.0)
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_vector():
+    """The expression indexed by wishes_search_idx on PostgreSQL."""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def _search_query(terms):
+    # Terms are word characters only, so they can't break out of the quotes
+    return SearchQuery(' & '.join(f"'{term}':*" for term in terms), search_type='raw', config=SEARCH_CONFIG)
+
+
+def _fts5_query(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def filter_wishes(queryset, text):
+    """Wishes of queryset matching text, in the queryset's order."""
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.alias(search=search_vector()).filter(search=_search_query(terms))
+    return queryset.filter(id__in=RawSQL(
+        'SELECT rowid FROM wishes_search WHERE wishes_search MATCH %s', (_fts5_query(terms),)
+    ))
+
+
+def search_wishes(queryset, text):
+    """Wishes of queryset matching text, most relevant first."""
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'postgresql':
+        vector = search_vector()
+        query = _search_query(terms)
+        return queryset.alias(search=vector).filter(search=query).annotate(
+            rank=SearchRank(vector, query)
+        ).order_by('-rank', '-created_at')
+
+    scope, params = queryset.order_by().values('id').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM wishes_search WHERE wishes_search MATCH %s AND rowid IN ({scope}) '
+            f'ORDER BY bm25(wishes_search, {", ".join(map(str, FTS5_WEIGHTS))}), rowid DESC LIMIT %s',
+            (_fts5_query(terms), *params, MAX_RANKED_RESULTS),
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return queryset.none()
+    return queryset.filter(id__in=ids).order_by(Case(
+        *[When(id=wish_id, then=Value(position)) for position, wish_id in enumerate(ids)],
+        output_field=IntegerField(),
+    ))
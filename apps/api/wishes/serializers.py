@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from .models import Category, Wish, Match, Period, Assignment, Negotiation, Execution
-from users.serializers import UserSerializer
+from users.serializers import UserSerializer, PublicUserSerializer
+from fantasy_life.metrics import TimedSerializerMixin
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Category model."""
     
     class Meta:
@@ -13,7 +14,7 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
-class WishSerializer(serializers.ModelSerializer):
+class WishSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Wish model."""
     user = UserSerializer(read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -29,7 +30,7 @@ class WishSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class MatchSerializer(serializers.ModelSerializer):
+class MatchSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Match model."""
     user1 = UserSerializer(read_only=True)
     user2 = UserSerializer(read_only=True)
@@ -44,7 +45,7 @@ class MatchSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'user1', 'created_at', 'updated_at')
 
 
-class PeriodSerializer(serializers.ModelSerializer):
+class PeriodSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Period model."""
     
     class Meta:
@@ -53,7 +54,7 @@ class PeriodSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
-class AssignmentSerializer(serializers.ModelSerializer):
+class AssignmentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Assignment model."""
     wish = WishSerializer(read_only=True)
     assigned_to = UserSerializer(read_only=True)
@@ -67,7 +68,7 @@ class AssignmentSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'wish', 'assigned_to', 'assigned_at', 'due_date')
 
 
-class NegotiationSerializer(serializers.ModelSerializer):
+class NegotiationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Negotiation model."""
     proposed_by = UserSerializer(read_only=True)
     assignment_wish_title = serializers.CharField(source='assignment.wish.title', read_only=True)
@@ -85,7 +86,7 @@ class NegotiationSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ExecutionSerializer(serializers.ModelSerializer):
+class ExecutionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Execution model."""
     assignment = AssignmentSerializer(read_only=True)
     assignment_id = serializers.IntegerField(write_only=True)
@@ -103,9 +104,9 @@ class ExecutionSerializer(serializers.ModelSerializer):
         return value
 
 
-class RankingSerializer(serializers.Serializer):
-    """Serializer for user rankings."""
-    user = UserSerializer(read_only=True)
-    total_completed = serializers.IntegerField(read_only=True)
+class RankingSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Serializer for user rankings (RankingRollup rows)."""
+    user = PublicUserSerializer(read_only=True)
+    total_completed = serializers.IntegerField(source='completed_count', read_only=True)
     average_rating = serializers.FloatField(read_only=True)
     average_completion_days = serializers.FloatField(read_only=True)
\ No newline at end of file
@@ -1,3 +1,1223 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Q
+from django.db.transaction import TransactionManagementError
+from django.db.utils import ConnectionHandler, load_backend
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import zipfile
 
-# Create your tests here.
+from fantasy_life import db_routers, metrics, profiling
+from fantasy_life.asgi import application
+from fantasy_life.sqlite_concurrent import read_transaction
+from users.models import User
+from users.serializers import SnapshotTokenObtainPairSerializer
+from .archive import archive_batch, delete_empty_periods
+from .availability import free_dates
+from .eligibility import categories_with_wishes, rebuild_wish_counts
+from .events import publish, user_group
+from .export import export_lines
+from .management.commands.dispatch_events import Command as DispatchEventsCommand
+from .models import (
+    Category, Wish, Match, Period, Assignment, Negotiation, Execution, OutboxEvent, WishCategoryCount,
+    ArchivedAssignment, ArchivedNegotiation, ArchivedExecution, RankingRollup,
+)
+from .rankings import rebuild_rankings
+from .search import filter_wishes, search_wishes
+from .transitions import apply_transition
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_routers.ReplicaRouter()
+
+    def test_reads_use_primary_unless_flagged(self):
+        self.assertIsNone(self.router.db_for_read(Wish))
+
+    def test_flagged_reads_use_replica(self):
+        token = db_routers._replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Wish), 'replica1')
+        finally:
+            db_routers._replica_reads.reset(token)
+
+    def test_reads_after_write_in_request_use_primary(self):
+        state_token = db_routers._request_state.set({'wrote': False})
+        reads_token = db_routers._replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_write(Wish), 'default')
+            self.assertEqual(self.router.db_for_read(Wish), 'default')
+        finally:
+            db_routers._replica_reads.reset(reads_token)
+            db_routers._request_state.reset(state_token)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_are_not_routed(self):
+        token = db_routers._replica_reads.set(True)
+        try:
+            self.assertIsNone(self.router.db_for_read(Wish))
+        finally:
+            db_routers._replica_reads.reset(token)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_pool_counters_add_what_pools_counted_since_the_last_scrape(self):
+        registry = metrics.Registry()
+        counter = metrics.Counter('pool_wait_seconds_total', 'Test.', ('database',), registry=registry)
+        metrics._pool_counter(counter, 'requests_wait_ms', scale=1000, registry=registry)
+        # The last value comes from a pool opened again
+        for wait_ms, total in ((1500, '1.5'), (2000, '2.0'), (2000, '2.0'), (500, '2.5')):
+            with mock.patch.object(metrics, 'pool_stats', return_value={'default': {'requests_wait_ms': wait_ms}}):
+                self.assertIn(f'pool_wait_seconds_total{{database="default"}} {total}\n', registry.render())
+        for metric in (metrics.DB_POOL_WAIT_SECONDS, metrics.DB_POOL_ERRORS):
+            self.assertIn(f'# TYPE {metric.name} counter', metrics.REGISTRY.render([metric]))
+
+    def test_shards_of_every_thread_are_merged(self):
+        registry = metrics.Registry()
+        counter = metrics.Counter('jobs_total', 'Jobs.', ('queue',), registry=registry)
+        histogram = metrics.Histogram('job_seconds', 'Job time.', ('queue',), buckets=(0.5, 1.0), registry=registry)
+
+        def work():
+            for _ in range(100):
+                counter.inc('a "quoted"\nqueue')
+                counter.inc('b', amount=2)
+                histogram.observe(0.25, 'b')
+                histogram.observe(2, 'b')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(counter._shards), 4)
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP jobs_total Jobs.',
+            '# TYPE jobs_total counter',
+            'jobs_total{queue="a \\"quoted\\"\\nqueue"} 400',
+            'jobs_total{queue="b"} 800',
+            '# HELP job_seconds Job time.',
+            '# TYPE job_seconds histogram',
+            'job_seconds_bucket{queue="b",le="0.5"} 400',
+            'job_seconds_bucket{queue="b",le="1.0"} 400',
+            'job_seconds_bucket{queue="b",le="+Inf"} 800',
+            'job_seconds_sum{queue="b"} 900.0',
+            'job_seconds_count{queue="b"} 800',
+        ]) + '\n')
+
+
+class MetricsEndpointTests(TestCase):
+    def test_scrape_serves_prometheus_text(self):
+        self.client.get('/api/categories/')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('# TYPE http_request_db_queries_total counter', lines)
+        self.assertTrue(any(
+            line.startswith('http_request_duration_seconds_count{view="CategoryViewSet",action="list",method="GET"')
+            for line in lines
+        ))
+        for line in lines:
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                float(value.replace('+Inf', 'inf'))
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_other_addresses_get_404(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_MAX_FILES=50)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+        self.staff = User.objects.create_user('staff@example.com', nickname='staff', is_staff=True)
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+
+    def token(self, user):
+        return str(SnapshotTokenObtainPairSerializer.get_token(user).access_token)
+
+    def get(self, user=None, path='/api/users/me/', **headers):
+        if user is not None:
+            headers['Authorization'] = f'Bearer {self.token(user)}'
+        if path.startswith('/api/async/'):
+            return async_to_sync(AsyncClient().get)(path, headers=headers)
+        return APIClient().get(path, headers=headers)
+
+    def captures(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.prof'))
+
+    def read_capture(self, name):
+        with open(os.path.join(self.directory, f'{name}.json')) as handle:
+            return json.load(handle)
+
+    def test_staff_requests_with_the_header_are_profiled(self):
+        response = self.get(self.staff, **{'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.captures(), [f'{response["X-Profile-Id"]}.prof'])
+        report = self.read_capture(response['X-Profile-Id'])
+        self.assertEqual(report['label'], 'GET /api/users/me/')
+        self.assertEqual(report['metadata'], {
+            'method': 'GET', 'path': '/api/users/me/', 'requested': True, 'status': 200, 'user_id': self.staff.pk,
+        })
+
+    def test_async_views_are_profiled(self):
+        response = self.get(self.staff, path='/api/async/users/me/', **{'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.captures(), [f'{response["X-Profile-Id"]}.prof'])
+
+    def test_header_needs_a_staff_user(self):
+        for user in (None, self.alice):
+            response = self.get(user, **{'X-Profile': '1'})
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertNotIn('X-Profile-Id', self.get(**{'X-Profile': '1', 'Authorization': 'Bearer garbage'}))
+        self.assertEqual(self.captures(), [])
+
+    def test_disabled_profiling_ignores_the_header(self):
+        with override_settings(PROFILING_ENABLED=False, PROFILING_SAMPLE_RATE=1):
+            response = self.get(self.staff, **{'X-Profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.captures(), [])
+
+    def test_sampled_requests_are_profiled_without_the_header(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0.5), mock.patch('fantasy_life.profiling.random.random') as draw:
+            draw.return_value = 0.7
+            self.get(self.alice)
+            self.assertEqual(self.captures(), [])
+            draw.return_value = 0.3
+            response = self.get(self.alice)
+        self.assertNotIn('X-Profile-Id', response)
+        name, = self.captures()
+        report = self.read_capture(name.removesuffix('.prof'))
+        self.assertEqual((report['metadata']['requested'], report['metadata']['user_id']), (False, self.alice.pk))
+
+    def test_sql_statements_are_recorded(self):
+        with self.settings(PROFILING_MAX_QUERIES=1):
+            # Prefix and substring searches: two queries
+            response = self.get(self.staff, path='/api/users/search/?q=ali', **{'X-Profile': '1'})
+        sql = self.read_capture(response['X-Profile-Id'])['sql']
+        self.assertGreaterEqual(sql['count'], 2)
+        self.assertEqual(len(sql['statements']), 1)
+        statement, = sql['statements']
+        self.assertEqual(statement['database'], 'default')
+        self.assertIn('SELECT', statement['sql'])
+
+    def test_only_the_newest_captures_are_kept(self):
+        for index in range(3):
+            with profiling.capture(f'capture {index}') as session:
+                pass
+            os.utime(session.path, (index, index))
+        profiling.prune(self.directory, 2)
+        labels = [self.read_capture(name.removesuffix('.prof'))['label'] for name in self.captures()]
+        self.assertCountEqual(labels, ['capture 1', 'capture 2'])
+        # The .json reports go with their .prof files
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+        with self.settings(PROFILING_MAX_FILES=1), profiling.capture('capture 3') as session:
+            pass
+        self.assertEqual(self.captures(), [f'{session.name}.prof'])
+
+    def test_create_period_can_profile_its_run(self):
+        output = StringIO()
+        call_command('create_period', profile=True, dry_run=True, stdout=output)
+        name, = self.captures()
+        self.assertIn(f'Profile written to {os.path.join(self.directory, name)}', output.getvalue())
+        report = self.read_capture(name.removesuffix('.prof'))
+        self.assertEqual(report['label'], 'create_period')
+        self.assertTrue(report['metadata']['dry_run'])
+        self.assertGreater(report['sql']['count'], 0)
+        self.assertIn('cumulative', report['summary'])
+
+
+@skipUnless('replica1' in settings.DATABASES, 'set DB_REPLICAS to test against a second database')
+class ReplicaRoutingTests(TestCase):
+    """
+    Runs against two separate test databases with no replication between
+    them, so rows written to the primary are missing on the replica:
+        DB_REPLICAS=/tmp/replica.sqlite3 python manage.py test wishes
+    """
+    # The runner checks aliases even for skipped classes
+    databases = {'default', 'replica1'} if 'replica1' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader@example.com', nickname='reader')
+        self.category = Category.objects.create(name='Plan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def category_names(self):
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        return [category['name'] for category in response.data['results']]
+
+    def test_list_views_read_from_replica(self):
+        self.assertEqual(self.category_names(), [])
+
+    def test_writes_pin_user_to_primary(self):
+        response = self.client.post('/api/wishes/', {
+            'category': self.category.pk, 'title': 'Picnic', 'description': 'In the park',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Wish.objects.using('replica1').exists())
+        self.assertTrue(db_routers.is_pinned(self.user.pk))
+        self.assertEqual(self.category_names(), ['Plan'])
+
+    def test_pin_expires(self):
+        db_routers.pin_to_primary(self.user.pk)
+        self.assertEqual(self.category_names(), ['Plan'])
+        cache.delete(db_routers.pin_cache_key(self.user.pk))
+        self.assertEqual(self.category_names(), [])
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    """Database settings built from environment variables."""
+
+    def load_settings(self, **environ):
+        spec = importlib.util.spec_from_file_location('settings_under_test', settings.BASE_DIR / 'fantasy_life' / 'settings.py')
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, environ):
+            for name in ('DB_ENGINE', 'DB_NAME', 'DB_REPLICAS', 'SQLITE_CONCURRENT', 'DB_POOL'):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            spec.loader.exec_module(module)
+        return module
+
+    def test_sqlite_replicas_are_other_files(self):
+        for concurrent in ('False', 'True'):
+            with self.subTest(concurrent=concurrent):
+                loaded = self.load_settings(
+                    DB_NAME='/tmp/primary.sqlite3', DB_REPLICAS='/tmp/replica.sqlite3', SQLITE_CONCURRENT=concurrent,
+                )
+                replica = loaded.DATABASES['replica1']
+                self.assertEqual((replica['NAME'], replica['HOST']), ('/tmp/replica.sqlite3', ''))
+                self.assertEqual(replica['ENGINE'], loaded.DATABASES['default']['ENGINE'])
+                self.assertEqual(loaded.DATABASE_REPLICAS, ['replica1'])
+
+    def test_postgresql_replicas_are_other_hosts(self):
+        loaded = self.load_settings(
+            DB_ENGINE='django.db.backends.postgresql', DB_NAME='fantasy', DB_REPLICAS='db2:5433,db3',
+            SQLITE_CONCURRENT='True',
+        )
+        self.assertFalse(loaded.SQLITE_CONCURRENT)
+        self.assertEqual(
+            [(loaded.DATABASES[alias]['NAME'], loaded.DATABASES[alias]['HOST'], loaded.DATABASES[alias]['PORT'])
+             for alias in loaded.DATABASE_REPLICAS],
+            [('fantasy', 'db2', '5433'), ('fantasy', 'db3', '')],
+        )
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """Parallel read-then-write transactions against a real database file."""
+    writers = 8
+    transactions = 40
+    concurrent_options = {
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': 'PRAGMA journal_mode=WAL;PRAGMA busy_timeout=5000;'
+                        'PRAGMA synchronous=NORMAL;PRAGMA mmap_size=268435456',
+    }
+
+    def open_connection(self, engine, path, options):
+        database = {'ENGINE': engine, 'NAME': path, 'OPTIONS': options}
+        handler = ConnectionHandler({'default': database})
+        return load_backend(engine).DatabaseWrapper(handler.settings['default'], 'stress')
+
+    def create_database(self, engine, options):
+        """Path of a new database file with a counter row at 0."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'stress.sqlite3')
+        setup = self.open_connection(engine, path, options)
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO counter VALUES (1, 0)')
+        setup.close()
+        return path
+
+    def stress(self, engine, options):
+        """Run the writers; return (lock errors, committed transactions)."""
+        path = self.create_database(engine, options)
+
+        errors = []
+        start = threading.Barrier(self.writers)
+
+        def write():
+            connection = self.open_connection(engine, path, options)
+            start.wait()
+            for _ in range(self.transactions):
+                # What transaction.atomic() does: begin, read, then write
+                try:
+                    connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT value FROM counter WHERE id = 1')
+                        value = cursor.fetchone()[0]
+                        cursor.execute('UPDATE counter SET value = %s WHERE id = 1', [value + 1])
+                    connection.commit()
+                except OperationalError as exc:
+                    errors.append(exc)
+                    connection.rollback()
+                finally:
+                    connection.set_autocommit(True)
+            connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        check = self.open_connection(engine, path, options)
+        with check.cursor() as cursor:
+            cursor.execute('SELECT value FROM counter WHERE id = 1')
+            committed = cursor.fetchone()[0]
+        check.close()
+        return errors, committed
+
+    def test_concurrent_mode_has_no_lock_errors(self):
+        errors, committed = self.stress('fantasy_life.sqlite_concurrent', self.concurrent_options)
+        self.assertEqual(errors, [])
+        self.assertEqual(committed, self.writers * self.transactions)
+
+    def test_default_mode_commits_consistently(self):
+        # Plain SQLite fails some of these transactions with "database is
+        # locked"; whatever it commits must still add up.
+        errors, committed = self.stress('django.db.backends.sqlite3', {})
+        self.assertTrue(errors)
+        self.assertTrue(all('locked' in str(error) for error in errors))
+        self.assertEqual(committed + len(errors), self.writers * self.transactions)
+
+    @override_settings(SQLITE_WRITE_QUEUE_TIMEOUT=0.1)
+    def test_read_transactions_run_alongside_writers(self):
+        engine = 'fantasy_life.sqlite_concurrent'
+        path = self.create_database(engine, self.concurrent_options)
+        writer = self.open_connection(engine, path, self.concurrent_options)
+        reader = self.open_connection(engine, path, self.concurrent_options)
+        connections['stress'] = reader
+        self.addCleanup(connections.__delitem__, 'stress')
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+
+        # The writer holds the queue until it commits
+        writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with writer.cursor() as cursor:
+            cursor.execute('UPDATE counter SET value = 1 WHERE id = 1')
+        with read_transaction(using='stress'):
+            with reader.cursor() as cursor:
+                cursor.execute('SELECT value FROM counter WHERE id = 1')
+                self.assertEqual(cursor.fetchone(), (0,))
+                with self.assertRaises(TransactionManagementError):
+                    cursor.execute('UPDATE counter SET value = 2 WHERE id = 1')
+        # A plain atomic block waits for the queue
+        with self.assertRaises(OperationalError):
+            with transaction.atomic(using='stress'):
+                pass
+        writer.commit()
+        writer.set_autocommit(True)
+        with transaction.atomic(using='stress'), reader.cursor() as cursor:
+            cursor.execute('UPDATE counter SET value = value + 1 WHERE id = 1')
+            cursor.execute('SELECT value FROM counter WHERE id = 1')
+            self.assertEqual(cursor.fetchone(), (2,))
+
+
+class QueryPlanTests(TestCase):
+    """
+    Hot queries must be served by the partial indexes of migration 0003. The
+    tables are filled with mostly closed rows and analyzed first, so the
+    planner picks an index on its statistics rather than on empty tables. On
+    PostgreSQL sequential scans are also disabled while explaining.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([
+            User(email=f'user{n}@example.com', nickname=f'user{n}', nickname_search=f'user{n}') for n in range(40)
+        ])
+        categories = Category.objects.bulk_create([Category(name=f'Category {n}') for n in range(4)])
+        # One active wish in ten
+        wishes = Wish.objects.bulk_create([
+            Wish(user=user, category=category, title='Wish', description='', is_active=n == 0)
+            for user in users for category in categories for n in range(10)
+        ])
+        # One accepted match in seven
+        Match.objects.bulk_create([
+            Match(user1=user1, user2=user2, mode=Match.MODE_PUBLIC if (i + j) % 2 else Match.MODE_PRIVATE,
+                  status=Match.STATUS_ACCEPTED if (i + j) % 7 == 0 else Match.STATUS_REJECTED)
+            for i, user1 in enumerate(users) for j, user2 in enumerate(users) if i < j
+        ])
+        period = Period.objects.create(start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+        # One open assignment and one pending negotiation in twenty
+        assignments = Assignment.objects.bulk_create([
+            Assignment(period=period, wish=wish, assigned_to=users[n % len(users)],
+                       due_date=period.start_date + timedelta(days=n % 30), is_completed=n % 20 != 0)
+            for n, wish in enumerate(wishes)
+        ])
+        Negotiation.objects.bulk_create([
+            Negotiation(assignment=assignment, proposed_by=assignment.assigned_to, proposed_date=assignment.due_date,
+                        status=Negotiation.STATUS_PENDING if n % 20 == 0 else Negotiation.STATUS_REJECTED)
+            for n, assignment in enumerate(assignments) for _ in range(2)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index, ordered=False):
+        plan = self.explain(queryset)
+        self.assertIn(index, plan, plan)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+            if ordered:
+                self.assertNotIn('Sort', plan, plan)
+        else:
+            # "SCAN table" reads every row; "SEARCH table USING INDEX" does not
+            scans = [line for line in plan.splitlines() if ' SCAN ' in f' {line.split(maxsplit=3)[-1]}']
+            self.assertEqual(scans, [], plan)
+            if ordered:
+                self.assertNotIn('TEMP B-TREE', plan, plan)
+
+    def test_active_wishes_by_user_and_category(self):
+        self.assertUsesIndex(Wish.objects.filter(user=1, category=1, is_active=True), 'wishes_active_user_cat_idx')
+
+    def test_accepted_private_matches(self):
+        self.assertUsesIndex(
+            Match.objects.filter(mode=Match.MODE_PRIVATE, status=Match.STATUS_ACCEPTED), 'matches_accepted_mode_idx'
+        )
+
+    def test_accepted_public_matches_of_user(self):
+        # The user2 branch of the OR may use the (user2, status) index instead
+        self.assertUsesIndex(Match.objects.filter(
+            Q(user1=1) | Q(user2=1), mode=Match.MODE_PUBLIC, status=Match.STATUS_ACCEPTED,
+        ), 'matches_accepted_mode_idx')
+
+    def test_open_assignments_of_user(self):
+        self.assertUsesIndex(
+            Assignment.objects.filter(assigned_to=1, is_completed=False, is_rejected=False).order_by('due_date'),
+            'assignments_open_idx', ordered=True,
+        )
+
+    def test_pending_negotiations_of_assignment(self):
+        self.assertUsesIndex(
+            Negotiation.objects.filter(assignment=1, status=Negotiation.STATUS_PENDING).order_by('proposed_date'),
+            'negotiations_pending_idx', ordered=True,
+        )
+
+
+class TransitionTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        self.match = Match.objects.create(user1=self.alice, user2=self.bob)
+
+    def status_events(self):
+        return OutboxEvent.objects.filter(event_type='match.status_changed').count()
+
+    def test_only_one_of_racing_transitions_wins(self):
+        first = Match.objects.get(pk=self.match.pk)
+        second = Match.objects.get(pk=self.match.pk)
+        self.assertTrue(apply_transition(first, 'accept'))
+        self.assertFalse(apply_transition(second, 'reject'))
+        self.assertEqual(first.status, Match.STATUS_ACCEPTED)
+        self.assertEqual(second.status, Match.STATUS_PENDING)
+        self.assertEqual(Match.objects.get(pk=self.match.pk).status, Match.STATUS_ACCEPTED)
+        # One event per participant, from the winner only
+        self.assertEqual(self.status_events(), 2)
+
+    def test_updates_only_changed_columns_in_one_statement(self):
+        match = Match.objects.get(pk=self.match.pk)
+        with CaptureQueriesContext(connection) as queries:
+            apply_transition(match, 'block')
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status"', updates[0])
+        self.assertNotIn('"mode"', updates[0])
+
+    def test_api_answers_losers_with_400(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.post(f'/api/matches/{self.match.pk}/accept/').status_code, 200)
+        self.assertEqual(client.post(f'/api/matches/{self.match.pk}/reject/').status_code, 400)
+        self.assertEqual(client.post(f'/api/matches/{self.match.pk}/block/').status_code, 200)
+        self.assertEqual(client.post(f'/api/matches/{self.match.pk}/block/').status_code, 200)
+        self.assertEqual(Match.objects.get(pk=self.match.pk).status, Match.STATUS_BLOCKED)
+
+
+class WishCountTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.travel = Category.objects.create(name='Travel')
+        self.food = Category.objects.create(name='Food')
+
+    def counts(self):
+        return dict(WishCategoryCount.objects.filter(active_count__gt=0).values_list('category__name', 'active_count'))
+
+    def wish(self, category, **fields):
+        return Wish.objects.create(user=self.alice, category=category, title='Wish', description='', **fields)
+
+    def test_create_toggle_move_and_delete(self):
+        first = self.wish(self.travel)
+        self.wish(self.travel)
+        self.wish(self.food, is_active=False)
+        self.assertEqual(self.counts(), {'Travel': 2})
+
+        first.is_active = False
+        first.save(update_fields=['is_active'])
+        self.assertEqual(self.counts(), {'Travel': 1})
+
+        # A wish that was not loaded through the ORM reads its stored state
+        moved = Wish(
+            pk=first.pk, user=self.alice, category=self.food, title='Wish', description='', created_at=first.created_at
+        )
+        moved.save()
+        self.assertEqual(self.counts(), {'Travel': 1, 'Food': 1})
+
+        Wish.objects.get(pk=first.pk).delete()
+        self.assertEqual(self.counts(), {'Travel': 1})
+        self.assertEqual(categories_with_wishes(self.alice.pk), {self.travel.pk})
+
+    def test_rebuild_matches_signals(self):
+        self.wish(self.travel)
+        self.wish(self.food)
+        Wish.objects.filter(category=self.food).update(is_active=False)
+        self.assertEqual(self.counts(), {'Travel': 1, 'Food': 1})
+        self.assertEqual(rebuild_wish_counts(), 1)
+        self.assertEqual(self.counts(), {'Travel': 1})
+
+    def test_categories_endpoint_skips_empty_categories(self):
+        self.wish(self.food)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get('/api/categories/', {'with_wishes': 'true'})
+        self.assertEqual([category['name'] for category in response.data['results']], ['Food'])
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin@example.com', 'admin-pass', nickname='admin')
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        self.client.force_login(self.admin)
+        self.category = Category.objects.create(name='Travel')
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        match = Match.objects.create(user1=self.alice, user2=self.bob, mode=Match.MODE_PRIVATE)
+        period = match.periods.create(start_date='2026-01-01', end_date='2026-01-31')
+        for index in range(5):
+            wish = Wish.objects.create(user=self.alice, category=self.category, title=f'Wish {index}', description='')
+            Assignment.objects.create(period=period, wish=wish, assigned_to=self.bob, due_date='2026-01-31')
+        for path in ('/admin/wishes/assignment/', '/admin/wishes/period/', '/admin/wishes/wish/'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(path).status_code, 200)
+            self.assertLessEqual(len(queries), 6, path)
+
+    def test_bulk_deactivate_is_one_update_and_refreshes_counts(self):
+        wishes = [Wish.objects.create(user=self.alice, category=self.category, title='Wish', description='') for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/wishes/wish/', {
+                'action': 'deactivate', '_selected_action': [wish.pk for wish in wishes[:2]], 'index': 0,
+            })
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "wishes"')]), 1)
+        self.assertEqual(WishCategoryCount.objects.get(user=self.alice, category=self.category).active_count, 1)
+
+    def test_user_search_matches_whole_emails_and_nicknames(self):
+        User.objects.filter(pk=self.bob.pk).update(full_name='Alice Bobson')
+        for term, expected in (('alice', [self.alice]), (' alice@example.com ', [self.alice]), ('ali', []),
+                               ('Alice Bobson', [])):
+            response = self.client.get('/admin/users/user/', {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list), expected, term)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        match = Match.objects.create(user1=self.alice, user2=self.bob, status=Match.STATUS_ACCEPTED)
+        self.period = match.periods.create(start_date=self.today, end_date=self.today + timedelta(days=30))
+        self.category = Category.objects.create(name='Travel')
+        self.assignment = self.assign(self.alice, self.bob, days=5)
+
+    def assign(self, owner, executor, days):
+        wish = Wish.objects.create(user=owner, category=self.category, title='Wish', description='')
+        return Assignment.objects.create(
+            period=self.period, wish=wish, assigned_to=executor, due_date=self.today + timedelta(days=days)
+        )
+
+    def days(self, *offsets):
+        return [self.today + timedelta(days=offset) for offset in offsets]
+
+    def test_own_due_date_is_not_a_commitment(self):
+        self.assertEqual(free_dates(self.assignment, 10, self.today), self.days(0, 1, 2, 3, 4, 5))
+        # Another assignment due the same day does occupy it
+        self.assign(self.alice, self.bob, days=5)
+        self.assign(self.bob, self.alice, days=2)
+        cache.clear()
+        self.assertEqual(free_dates(self.assignment, 10, self.today), self.days(0, 1, 3, 4))
+
+    def test_limit_is_clamped(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        url = f'/api/assignments/{self.assignment.pk}/free_dates/'
+        self.assertEqual(len(client.get(url, {'limit': 0}).data['dates']), 1)
+        self.assertEqual(len(client.get(url, {'limit': 3}).data['dates']), 3)
+        self.assertEqual(client.get(url, {'limit': 'x'}).status_code, 400)
+        self.assignment.due_date = self.today + timedelta(days=60)
+        self.assignment.save()
+        self.assertEqual(len(client.get(url, {'limit': 100}).data['dates']), 31)
+
+    @override_settings(AVAILABILITY_HORIZON_DAYS=3)
+    def test_dates_stop_at_the_horizon(self):
+        self.assertEqual(free_dates(self.assignment, 10, self.today), self.days(0, 1, 2))
+
+    def test_accepted_negotiation_invalidates_calendars(self):
+        self.assertIn(self.today + timedelta(days=1), free_dates(self.assignment, 10, self.today))
+        negotiation = Negotiation.objects.create(
+            assignment=self.assignment, proposed_by=self.bob, proposed_date=self.today + timedelta(days=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(apply_transition(negotiation, 'accept'))
+        self.assertEqual(free_dates(self.assignment, 10, self.today), self.days(0, 2, 3, 4, 5))
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_calendars_are_read_from_the_primary(self):
+        # replica1 isn't configured, so a routed read would fail
+        with db_routers.replica_reads():
+            self.assertEqual(len(free_dates(self.assignment, 10, self.today)), 6)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        self.category = Category.objects.create(name='Travel')
+        match = Match.objects.create(user1=self.alice, user2=self.bob, status=Match.STATUS_ACCEPTED)
+        self.old = match.periods.create(start_date=date(2020, 1, 1), end_date=date(2020, 1, 31))
+        self.current = match.periods.create(start_date=self.today, end_date=self.today + timedelta(days=30))
+        with self.captureOnCommitCallbacks(execute=True):
+            for period, executor, rating in ((self.old, self.bob, 5), (self.old, self.alice, 2),
+                                             (self.old, self.bob, None), (self.current, self.alice, 4)):
+                assignment = self.assign(period, executor, completed=rating is not None)
+                Negotiation.objects.create(assignment=assignment, proposed_by=executor, proposed_date=period.end_date)
+                if rating is not None:
+                    Execution.objects.create(assignment=assignment, completed_date=period.end_date, rating=rating)
+
+    def assign(self, period, executor, completed=False):
+        owner = self.alice if executor == self.bob else self.bob
+        wish = Wish.objects.create(user=owner, category=self.category, title='Wish', description='')
+        return Assignment.objects.create(
+            period=period, wish=wish, assigned_to=executor, due_date=period.end_date, is_completed=completed
+        )
+
+    def rankings(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        return {
+            name: client.get(f'/api/rankings/{name}/').json()
+            for name in ('most_completed', 'best_rated', 'fastest_completion')
+        }
+
+    def test_archive_batch_moves_rows_and_periods_are_deleted(self):
+        cutoff = date(2021, 1, 1)
+        old_ids = set(Assignment.objects.filter(period=self.old).values_list('id', flat=True))
+        self.assertEqual(archive_batch(cutoff, 2), {'assignments': 2, 'negotiations': 2, 'executions': 2})
+        self.assertEqual(archive_batch(cutoff, 2), {'assignments': 1, 'negotiations': 1, 'executions': 0})
+        self.assertEqual(archive_batch(cutoff, 2), {})
+
+        self.assertEqual(set(ArchivedAssignment.objects.values_list('id', flat=True)), old_ids)
+        self.assertEqual(ArchivedNegotiation.objects.count(), 3)
+        self.assertEqual(ArchivedExecution.objects.count(), 2)
+        self.assertFalse(Assignment.objects.filter(id__in=old_ids).exists())
+        self.assertFalse(Negotiation.objects.filter(assignment_id__in=old_ids).exists())
+        self.assertFalse(Execution.objects.filter(assignment_id__in=old_ids).exists())
+        archived = ArchivedAssignment.objects.get(execution__rating=5)
+        self.assertEqual((archived.period_start, archived.period_end), (self.old.start_date, self.old.end_date))
+
+        self.assertEqual(delete_empty_periods(cutoff), 1)
+        self.assertEqual(list(Period.objects.values_list('id', flat=True)), [self.current.id])
+
+    def test_rankings_are_unchanged_by_archiving(self):
+        before = self.rankings()
+        self.assertEqual([row['total_completed'] for row in before['most_completed']], [2, 1])
+        with self.captureOnCommitCallbacks(execute=True):
+            while archive_batch(date(2021, 1, 1), 1):
+                pass
+            delete_empty_periods(date(2021, 1, 1))
+        self.assertEqual(self.rankings(), before)
+        rebuild_rankings()
+        self.assertEqual(self.rankings(), before)
+
+    def test_execution_changes_refresh_rollup_on_commit(self):
+        assignment = self.assign(self.current, self.bob, completed=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            execution = Execution.objects.create(assignment=assignment, completed_date=self.today, rating=1)
+        rollup = RankingRollup.objects.get(user=self.bob)
+        self.assertEqual((rollup.rating_sum, rollup.rating_count), (5, 1))
+        for callback in callbacks:
+            callback()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.completed_count, rollup.rating_sum, rollup.rating_count), (2, 6, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execution.delete()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.completed_count, rollup.rating_sum, rollup.rating_count), (2, 5, 1))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        self.category = Category.objects.create(name='Travel')
+
+    def wish(self, title, description='', user=None):
+        return Wish.objects.create(user=user or self.alice, category=self.category, title=title, description=description)
+
+    def found(self, text, queryset=None):
+        return list(search_wishes(queryset or Wish.objects.all(), text))
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        wish = self.wish('Picnic in the park')
+        self.assertEqual(self.found('picnic'), [wish])
+        wish.title = 'Museum visit'
+        wish.save()
+        self.assertEqual(self.found('picnic'), [])
+        self.assertEqual(self.found('museum'), [wish])
+        # Changes that skip signals are indexed too
+        Wish.objects.filter(pk=wish.pk).update(description='Bring a camera')
+        self.assertEqual(list(filter_wishes(Wish.objects.all(), 'camera')), [wish])
+        wish.delete()
+        self.assertEqual(self.found('museum'), [])
+
+    def test_every_word_matches_a_word_prefix(self):
+        picnic = self.wish('Picnic in the park')
+        self.wish('Park run')
+        cafe = self.wish('Café in Paris')
+        self.assertEqual(self.found('pic park'), [picnic])
+        self.assertEqual(self.found('PARK PIC'), [picnic])
+        self.assertEqual(self.found('icnic'), [])
+        self.assertEqual(self.found('cafe'), [cafe])
+        self.assertEqual(self.found('!!'), [])
+
+    def test_title_matches_rank_first(self):
+        described = self.wish('Trip', 'Lake, lake, lake')
+        titled = self.wish('Lake trip with friends over the long weekend')
+        older, newer = self.wish('Lake'), self.wish('Lake')
+        self.assertEqual(self.found('lake'), [newer, older, titled, described])
+
+    def test_results_are_scoped_to_the_queryset(self):
+        own = self.wish('Picnic', user=self.alice)
+        self.wish('Picnic', user=self.bob)
+        self.assertEqual(self.found('picnic', Wish.objects.filter(user=self.alice)), [own])
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get('/api/wishes/', {'search': 'picnic'})
+        self.assertEqual([row['id'] for row in response.data['results']], [own.id])
+
+    def test_admin_searches_the_index_and_nicknames(self):
+        admin = User.objects.create_superuser('admin@example.com', 'admin-pass', nickname='admin')
+        self.client.force_login(admin)
+        picnic = self.wish('Picnic in the park')
+        museum = self.wish('Museum', user=self.bob)
+        for term, expected in (('pic', [picnic]), ('bob', [museum]), ('bo', [])):
+            with self.subTest(term=term):
+                response = self.client.get('/admin/wishes/wish/', {'q': term})
+                self.assertEqual(list(response.context['cl'].result_list), expected)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        self.carol = User.objects.create_user('carol@example.com', nickname='carol')
+        self.category = Category.objects.create(name='Travel')
+        ours = Match.objects.create(user1=self.alice, user2=self.bob, status=Match.STATUS_ACCEPTED)
+        theirs = Match.objects.create(user1=self.bob, user2=self.carol, status=Match.STATUS_ACCEPTED)
+        old = ours.periods.create(start_date=date(2020, 1, 1), end_date=date(2020, 1, 31))
+        archived = self.assign(old, self.alice, self.bob)
+        Negotiation.objects.create(assignment=archived, proposed_by=self.bob, proposed_date=old.end_date)
+        Execution.objects.create(assignment=archived, completed_date=old.end_date, rating=5)
+        current = self.assign(ours.periods.create(start_date=date(2026, 1, 1), end_date=date(2026, 1, 31)),
+                              self.bob, self.alice)
+        Negotiation.objects.create(assignment=current, proposed_by=self.alice, proposed_date=date(2026, 1, 31))
+        other = self.assign(theirs.periods.create(start_date=date(2026, 1, 1), end_date=date(2026, 1, 31)),
+                            self.carol, self.bob)
+        Execution.objects.create(assignment=other, completed_date=date(2026, 1, 31), rating=4)
+        while archive_batch(date(2021, 1, 1), 10):
+            pass
+
+    def assign(self, period, owner, executor):
+        wish = Wish.objects.create(user=owner, category=self.category, title='Wish', description='')
+        return Assignment.objects.create(period=period, wish=wish, assigned_to=executor, due_date=period.end_date)
+
+    def records(self, data):
+        return [json.loads(line) for line in data.decode().splitlines()]
+
+    def types(self, records):
+        counts = {}
+        for record in records:
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+        return counts
+
+    def test_user_export_holds_only_their_rows(self):
+        records = self.records(b''.join(export_lines(self.alice, chunk_size=1)))
+        self.assertEqual(self.types(records), {
+            'profile': 1, 'wish': 1, 'match': 1, 'assignment': 1, 'negotiation': 1,
+            'archived_assignment': 1, 'archived_negotiation': 1, 'archived_execution': 1,
+        })
+        by_type = {record['type']: record['data'] for record in records}
+        self.assertEqual(by_type['profile']['email'], 'alice@example.com')
+        self.assertNotIn('password', by_type['profile'])
+        self.assertEqual({record['data']['user_id'] for record in records if record['type'] == 'wish'}, {self.alice.pk})
+        self.assertEqual(by_type['assignment']['assigned_to_id'], self.alice.pk)
+        self.assertEqual(by_type['archived_assignment']['assigned_to_id'], self.bob.pk)
+
+    def test_endpoint_streams_ndjson_or_zip(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get('/api/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        plain = b''.join(response.streaming_content)
+        self.assertEqual(plain, b''.join(export_lines(self.alice)))
+
+        response = client.get('/api/export/', {'archive': 'zip'})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            [name] = archive.namelist()
+            self.assertTrue(name.endswith('.ndjson'))
+            self.assertEqual(archive.read(name), plain)
+
+    def test_command_exports_one_or_every_user(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'export')
+        for user in ('bob@example.com', str(self.bob.pk)):
+            call_command('export_user_data', user=user, output=path, stdout=StringIO())
+            with open(path, 'rb') as output:
+                self.assertEqual(output.read(), b''.join(export_lines(self.bob)))
+
+        call_command('export_user_data', '--all', '--zip', output=path, stdout=StringIO())
+        with zipfile.ZipFile(path) as archive:
+            records = self.records(archive.read('export.ndjson'))
+        self.assertEqual(self.types(records), {
+            'profile': 3, 'wish': 3, 'match': 2, 'assignment': 2, 'negotiation': 1, 'execution': 1,
+            'archived_assignment': 1, 'archived_negotiation': 1, 'archived_execution': 1,
+        })
+        with self.assertRaises(CommandError):
+            call_command('export_user_data', user='nobody@example.com', output=path, stdout=StringIO())
+
+
+class AsyncViewTests(TestCase):
+    """The views under /api/async/ answer exactly like their DRF counterparts."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice@example.com', 'alice-pass', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+        category = Category.objects.create(name='Travel')
+        match = Match.objects.create(user1=self.alice, user2=self.bob, status=Match.STATUS_ACCEPTED)
+        period = match.periods.create(start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(30):
+                owner, executor = (self.alice, self.bob) if number % 2 else (self.bob, self.alice)
+                wish = Wish.objects.create(user=owner, category=category, title=f'Wish {number}', description='')
+                assignment = Assignment.objects.create(
+                    period=period, wish=wish, assigned_to=executor, due_date=period.end_date,
+                    is_completed=number < 5,
+                )
+                if number < 5:
+                    Execution.objects.create(assignment=assignment, completed_date=period.end_date, rating=number)
+                else:
+                    Negotiation.objects.create(
+                        assignment=assignment, proposed_by=executor, proposed_date=period.end_date
+                    )
+        response = APIClient().post('/api/token/', {'email': 'alice@example.com', 'password': 'alice-pass'})
+        self.access = response.data['access']
+
+    def get(self, path, token=None, **params):
+        """(DRF response, async response) for GET /api/<path> and /api/async/<path>."""
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        drf = APIClient().get(f'/api/{path}', params, headers=headers)
+        asynchronous = async_to_sync(AsyncClient().get)(f'/api/async/{path}', params, headers=headers)
+        return drf, asynchronous
+
+    def assertSameResponse(self, path, token=None, **params):
+        drf, asynchronous = self.get(path, token, **params)
+        self.assertEqual(asynchronous.status_code, drf.status_code)
+        self.assertEqual(asynchronous.get('WWW-Authenticate'), drf.get('WWW-Authenticate'))
+        # Pagination links differ only in the /api/async/ prefix
+        self.assertEqual(
+            json.loads(asynchronous.content.decode().replace('/api/async/', '/api/')), drf.json()
+        )
+        return drf
+
+    def test_paginated_lists_match(self):
+        for path in ('assignments/', 'negotiations/'):
+            with self.subTest(path=path):
+                first = self.assertSameResponse(path, self.access)
+                self.assertIsNotNone(first.data['next'])
+                last = self.assertSameResponse(path, self.access, page=2)
+                self.assertIsNone(last.data['next'])
+                self.assertEqual(len(first.data['results']) + len(last.data['results']), first.data['count'])
+                for page in (3, 0, 'x'):
+                    self.assertEqual(self.assertSameResponse(path, self.access, page=page).status_code, 404)
+
+    def test_rankings_match(self):
+        for name in ('most_completed', 'best_rated', 'fastest_completion'):
+            with self.subTest(name=name):
+                self.assertTrue(self.assertSameResponse(f'rankings/{name}/', self.access).data)
+        _, asynchronous = self.get('rankings/unknown/', self.access)
+        self.assertEqual((asynchronous.status_code, asynchronous.json()), (404, {'detail': 'Not found.'}))
+
+    def test_unauthenticated_requests_match(self):
+        expired = AccessToken(self.access)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        for path in ('users/me/', 'assignments/', 'negotiations/', 'rankings/best_rated/'):
+            for token in (None, 'garbage', str(expired)):
+                with self.subTest(path=path, token=token and token[:8]):
+                    self.assertEqual(self.assertSameResponse(path, token).status_code, 401)
+
+    def test_me_matches_the_stored_row(self):
+        # Changes that leave the token valid show up in both views
+        User.objects.filter(pk=self.alice.pk).update(nickname='alice2', bio='Hi')
+        response = self.assertSameResponse('users/me/', self.access)
+        self.assertEqual((response.data['nickname'], response.data['bio']), ('alice2', 'Hi'))
+
+
+def dispatcher_options(*args):
+    """dispatch_events options as parsed from the command line."""
+    parser = DispatchEventsCommand().create_parser('manage.py', 'dispatch_events')
+    return vars(parser.parse_args(['--once', '--interval', '0.01', *args]))
+
+
+async def dispatch_events(*args, channel_layer=None):
+    """Run dispatch_events --once on the running event loop."""
+    await DispatchEventsCommand(stdout=StringIO(), stderr=StringIO())._run(
+        channel_layer or get_channel_layer(), dispatcher_options(*args)
+    )
+
+
+class RecordingChannelLayer:
+    """
+    Channel layer keeping what it is sent, with whether the event's outbox
+    row still existed at the time. The first failures sends raise.
+    """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('channel layer unavailable')
+        queued = await database_sync_to_async(OutboxEvent.objects.filter(pk=message['id']).exists)()
+        self.sent.append((group, message, queued))
+
+    def messages(self, user_id):
+        return [message for group, message, queued in self.sent if group == user_group(user_id)]
+
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class EventsConsumerTests(TransactionTestCase):
+    """
+    The WebSocket stack of fantasy_life.asgi driven with asgiref's
+    communicator (channels.testing needs daphne), on the in-memory layer.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+
+    def token(self, user, lifetime=None):
+        token = SnapshotTokenObtainPairSerializer.get_token(user).access_token
+        if lifetime is not None:
+            token.set_exp(lifetime=lifetime)
+        return str(token)
+
+    def communicator(self, token=None):
+        return ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': '/ws/events/',
+            'query_string': f'token={token}'.encode() if token else b'',
+            'headers': [(b'host', b'testserver'), (b'origin', b'http://testserver')],
+            'subprotocols': [],
+        })
+
+    async def connect(self, token=None):
+        communicator = self.communicator(token)
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(timeout=5)
+
+    async def receive_event(self, communicator):
+        message = await communicator.receive_output(timeout=5)
+        self.assertEqual(message['type'], 'websocket.send')
+        return json.loads(message['text'])
+
+    async def test_match_events_reach_both_users(self):
+        await get_channel_layer().flush()
+        sockets = []
+        for user in (self.alice, self.bob):
+            communicator, accepted = await self.connect(self.token(user))
+            self.assertEqual(accepted['type'], 'websocket.accept')
+            sockets.append(communicator)
+
+        match = await database_sync_to_async(Match.objects.create)(user1=self.alice, user2=self.bob)
+        await database_sync_to_async(apply_transition)(match, 'accept')
+        await dispatch_events('--rate-limit', '0')
+
+        for communicator in sockets:
+            created = await self.receive_event(communicator)
+            changed = await self.receive_event(communicator)
+            self.assertEqual((created['type'], created['data']['id']), ('match.created', match.pk))
+            self.assertEqual((changed['type'], changed['data']['status']), ('match.status_changed', 'accepted'))
+            self.assertLess(created['id'], changed['id'])
+            await communicator.send_input({'type': 'websocket.receive', 'text': '{"type": "ping"}'})
+            self.assertEqual(await self.receive_event(communicator), {'type': 'pong'})
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+        self.assertFalse(await database_sync_to_async(OutboxEvent.objects.exists)())
+
+    async def test_anonymous_and_expired_tokens_are_refused(self):
+        for token in (None, 'not-a-token', self.token(self.alice, lifetime=-timedelta(seconds=1))):
+            communicator, message = await self.connect(token)
+            self.assertEqual(message, {'type': 'websocket.close', 'code': 4401})
+            await communicator.wait()
+
+    async def test_revoked_token_is_refused(self):
+        token = self.token(self.alice)
+        self.alice.is_active = False
+        await database_sync_to_async(self.alice.save)()
+        await cache.aclear()
+        communicator, message = await self.connect(token)
+        self.assertEqual(message['code'], 4401)
+        await communicator.wait()
+
+
+class OutboxTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+
+    def test_rolled_back_changes_leave_no_events(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            match = Match.objects.create(user1=self.alice, user2=self.bob)
+            self.assertEqual(OutboxEvent.objects.filter(data__id=match.pk).count(), 2)
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        match = Match.objects.create(user1=self.alice, user2=self.bob)
+        OutboxEvent.objects.all().delete()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            apply_transition(match, 'accept')
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    async def test_rows_are_deleted_only_after_the_layer_accepted_them(self):
+        match = await database_sync_to_async(Match.objects.create)(user1=self.alice, user2=self.bob)
+        await database_sync_to_async(apply_transition)(match, 'accept')
+        ids = await database_sync_to_async(lambda: list(OutboxEvent.objects.values_list('id', flat=True)))()
+
+        layer = RecordingChannelLayer(failures=1)
+        await dispatch_events('--rate-limit', '0', channel_layer=layer)
+        self.assertEqual(layer.failures, 0)
+        self.assertEqual(sorted(message['id'] for group, message, queued in layer.sent), ids)
+        self.assertTrue(all(queued for group, message, queued in layer.sent))
+        self.assertFalse(await database_sync_to_async(OutboxEvent.objects.exists)())
+        # The failed user's events were held back and then sent in order
+        for user in (self.alice, self.bob):
+            self.assertEqual(
+                [message['event'] for message in layer.messages(user.pk)], ['match.created', 'match.status_changed']
+            )
+
+    async def test_shards_split_users_and_keep_their_order(self):
+        users = [self.alice, self.bob]
+        for index in range(6):
+            await database_sync_to_async(publish)(
+                [user.pk for user in users], 'tick' if index % 2 else 'tock', {'index': index}
+            )
+        layers = [RecordingChannelLayer(), RecordingChannelLayer()]
+        for shard, layer in enumerate(layers):
+            await dispatch_events('--rate-limit', '0', '--shards', '2', '--shard', str(shard), channel_layer=layer)
+        for user in users:
+            shard_layer, other_layer = layers[user.pk % 2], layers[1 - user.pk % 2]
+            self.assertEqual(other_layer.messages(user.pk), [])
+            self.assertEqual([message['data']['index'] for message in shard_layer.messages(user.pk)], list(range(6)))
+            ids = [message['id'] for message in shard_layer.messages(user.pk)]
+            self.assertEqual(ids, sorted(ids))
+        self.assertFalse(await database_sync_to_async(OutboxEvent.objects.exists)())
+
+
+class CoalescingTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@example.com', nickname='alice')
+        self.bob = User.objects.create_user('bob@example.com', nickname='bob')
+
+    async def test_create_period_sends_one_batch_per_user(self):
+        def prepare():
+            category = Category.objects.create(name='Travel', max_wishes_per_period=3)
+            match = Match.objects.create(
+                user1=self.alice, user2=self.bob, mode=Match.MODE_PRIVATE, status=Match.STATUS_ACCEPTED
+            )
+            match.private_categories.add(category)
+            for user in (self.alice, self.bob):
+                for index in range(3):
+                    Wish.objects.create(user=user, category=category, title=f'Wish {index}', description='')
+            OutboxEvent.objects.all().delete()
+            call_command('create_period', stdout=StringIO())
+            # coalesce() wrote one row per user, not one per assignment
+            return sorted(OutboxEvent.objects.values_list('user_id', 'event_type'))
+
+        self.assertEqual(await database_sync_to_async(prepare)(), [
+            (self.alice.pk, 'assignment.created.batch'), (self.bob.pk, 'assignment.created.batch'),
+        ])
+        layer = RecordingChannelLayer()
+        await dispatch_events(channel_layer=layer)
+        for user in (self.alice, self.bob):
+            messages = layer.messages(user.pk)
+            self.assertEqual([message['event'] for message in messages], ['assignment.created.batch'])
+            # Three wishes assigned to the user and three of theirs assigned to the other
+            self.assertEqual(messages[0]['data']['count'], 6)
+
+    async def test_users_over_max_backlog_get_one_resync(self):
+        for index in range(5):
+            await database_sync_to_async(publish)([self.alice.pk], 'tick', {'index': index})
+        await database_sync_to_async(publish)([self.bob.pk], 'tick', {'index': 0})
+        layer = RecordingChannelLayer()
+        await dispatch_events('--max-backlog', '3', channel_layer=layer)
+        resync = layer.messages(self.alice.pk)
+        self.assertEqual([(message['event'], message['data']) for message in resync],
+                         [('resync', {'reason': 'backlog', 'skipped': 5})])
+        self.assertEqual([message['event'] for message in layer.messages(self.bob.pk)], ['tick'])
+        self.assertFalse(await database_sync_to_async(OutboxEvent.objects.exists)())
@@ -0,0 +1,58 @@
+"""
+Compare-and-set status transitions for matches and negotiations.
+
+Each transition is one conditional UPDATE of the changed columns,
+    UPDATE ... SET status = <target>, updated_at = ... WHERE id = ... AND status IN (<sources>)
+so when requests race on the same row exactly one of them changes it, and
+the others learn they lost from the row count instead of overwriting it.
+QuerySet.update() sends no post_save, so the winner sends it itself and
+wishes.events and wishes.availability react as they do to save().
+"""
+from django.db import router, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from collections import namedtuple
+
+from .models import Match, Negotiation
+
+Transition = namedtuple('Transition', ('sources', 'target'))
+
+TRANSITIONS = {
+    Match: {
+        'accept': Transition((Match.STATUS_PENDING,), Match.STATUS_ACCEPTED),
+        'reject': Transition((Match.STATUS_PENDING,), Match.STATUS_REJECTED),
+        'block': Transition((Match.STATUS_PENDING, Match.STATUS_ACCEPTED, Match.STATUS_REJECTED), Match.STATUS_BLOCKED),
+    },
+    Negotiation: {
+        'accept': Transition((Negotiation.STATUS_PENDING,), Negotiation.STATUS_ACCEPTED),
+        'reject': Transition((Negotiation.STATUS_PENDING,), Negotiation.STATUS_REJECTED),
+    },
+}
+
+
+def apply_transition(instance, name, **changes):
+    """
+    Run transition name on instance's row, also setting changes, if the row
+    is still in one of its source states. Returns whether this call made the
+    change; instance is only updated when it did.
+    """
+    model = type(instance)
+    transition = TRANSITIONS[model][name]
+    values = dict(changes, status=transition.target, updated_at=timezone.now())
+    using = router.db_for_write(model, instance=instance)
+    with transaction.atomic(using=using, savepoint=False):
+        won = model._base_manager.using(using).filter(
+            pk=instance.pk, status__in=transition.sources
+        ).update(**values)
+        if not won:
+            return False
+        for field, value in values.items():
+            setattr(instance, field, value)
+        # The row was in a source state, so the status did change even if
+        # instance was loaded before another transition
+        instance._loaded_status = None
+        post_save.send(
+            sender=model, instance=instance, created=False, update_fields=frozenset(values),
+            raw=False, using=using,
+        )
+    return True
@@ -1,24 +1,70 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q, Count, Avg, F, ExpressionWrapper, fields as django_fields
+from django.db.models import Q, F, fields as django_fields
+from django.db.models.functions import Cast, NullIf
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from datetime import timedelta
 import random
 
-from .models import Category, Wish, Match, Period, Assignment, Negotiation, Execution
+from .models import Category, Wish, Match, Period, Assignment, Negotiation, Execution, RankingRollup
 from .serializers import (
     CategorySerializer, WishSerializer, MatchSerializer,
     PeriodSerializer, AssignmentSerializer, NegotiationSerializer,
     ExecutionSerializer, RankingSerializer
 )
 from .permissions import IsOwnerOrReadOnly, IsMatchParticipant
+from .availability import free_dates
+from .export import aiter_chunks, export_lines, zipped
+from .search import search_wishes
+from .transitions import apply_transition
+from fantasy_life.db_routers import ReplicaReadMixin
 
 User = get_user_model()
 
+# Ranking name: (filter, ordering) over ranking_queryset()
+RANKINGS = {
+    'most_completed': (Q(completed_count__gt=0), ('-completed_count', 'user_id')),
+    'best_rated': (Q(rating_count__gt=0), ('-average_rating', 'user_id')),
+    'fastest_completion': (Q(rating_count__gt=0), ('average_completion_days', 'user_id')),
+}
+
+
+def user_assignments(user):
+    """Assignments to user or of user's wishes, with what the serializer reads."""
+    return Assignment.objects.filter(
+        Q(assigned_to=user) | Q(wish__user=user)
+    ).select_related(
+        'wish', 'wish__user', 'wish__category', 'assigned_to', 'period'
+    )
+
+
+def user_negotiations(user):
+    """Negotiations of user's assignments, with what the serializer reads."""
+    return Negotiation.objects.filter(
+        Q(assignment__assigned_to=user) | Q(assignment__wish__user=user)
+    ).select_related(
+        'assignment', 'assignment__wish', 'assignment__assigned_to', 'proposed_by'
+    )
+
+
+def ranking_queryset(name=None):
+    """Ranking rollups with their averages; the top 100 of a RANKINGS entry if name is given."""
+    rating_count = NullIf(F('rating_count'), 0)
+    queryset = RankingRollup.objects.select_related('user').annotate(
+        average_rating=Cast('rating_sum', django_fields.FloatField()) / rating_count,
+        average_completion_days=Cast('completion_days_sum', django_fields.FloatField()) / rating_count,
+    )
+    if name is None:
+        return queryset
+    condition, ordering = RANKINGS[name]
+    return queryset.filter(condition).order_by(*ordering)[:100]
+
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     Categories are read-only for users.
     Filtered by age restrictions.
@@ -33,6 +79,10 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         # Filter adult content for minors
         if not user.is_adult:
             queryset = queryset.filter(is_adult=False)
+
+        # ?with_wishes=true keeps the categories the user has active wishes in
+        if self.request.query_params.get('with_wishes') == 'true':
+            queryset = queryset.filter(wish_counts__user=user, wish_counts__active_count__gt=0)
         
         return queryset
 
@@ -47,7 +97,12 @@ class WishViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return Wish.objects.filter(user=user).select_related('category', 'user')
+        queryset = Wish.objects.filter(user=user).select_related('category', 'user')
+        # ?search= matches words of title and description, most relevant first
+        search = self.request.query_params.get('search', '').strip()
+        if search and self.action == 'list':
+            queryset = search_wishes(queryset, search)
+        return queryset
 
     def perform_create(self, serializer):
         category = serializer.validated_data['category']
@@ -76,46 +131,32 @@ class MatchViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         """Accept a pending match."""
-        match = self.get_object()
-        
-        if match.status != Match.STATUS_PENDING:
+        if not apply_transition(self.get_object(), 'accept'):
             return Response(
                 {'error': 'Match is not pending'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        match.status = Match.STATUS_ACCEPTED
-        match.save()
-        
         return Response({'status': 'Match accepted'})
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """Reject a pending match."""
-        match = self.get_object()
-        
-        if match.status != Match.STATUS_PENDING:
+        if not apply_transition(self.get_object(), 'reject'):
             return Response(
                 {'error': 'Match is not pending'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        match.status = Match.STATUS_REJECTED
-        match.save()
-        
         return Response({'status': 'Match rejected'})
 
     @action(detail=True, methods=['post'])
     def block(self, request, pk=None):
         """Block a user."""
-        match = self.get_object()
-        match.status = Match.STATUS_BLOCKED
-        match.save()
-        
+        # Losing to another block leaves the match blocked all the same
+        apply_transition(self.get_object(), 'block')
         return Response({'status': 'User blocked'})
 
 
-class AssignmentViewSet(viewsets.ReadOnlyModelViewSet):
+class AssignmentViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     View assignments.
     Users can see wishes assigned to them or wishes they created that were assigned.
@@ -124,12 +165,24 @@ class AssignmentViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        return Assignment.objects.filter(
-            Q(assigned_to=user) | Q(wish__user=user)
-        ).select_related(
-            'wish', 'wish__user', 'wish__category', 'assigned_to', 'period'
-        )
+        return user_assignments(self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def free_dates(self, request, pk=None):
+        """
+        Suggest dates to negotiate: the next ?limit= (at most 31, default 5)
+        dates up to the due date free for both the executor and the wish owner.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 5)), 1), 31)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        assignment = self.get_object()
+        return Response({
+            'assignment': assignment.id,
+            'due_date': assignment.due_date,
+            'dates': free_dates(assignment, limit),
+        })
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
@@ -166,47 +219,32 @@ class NegotiationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        return Negotiation.objects.filter(
-            Q(assignment__assigned_to=user) | Q(assignment__wish__user=user)
-        ).select_related(
-            'assignment', 'assignment__wish', 'assignment__assigned_to', 'proposed_by'
-        )
+        return user_negotiations(self.request.user)
 
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         """Accept a negotiation proposal."""
-        negotiation = self.get_object()
-        
-        if negotiation.status != Negotiation.STATUS_PENDING:
+        accepted = apply_transition(
+            self.get_object(), 'accept', response_message=request.data.get('response_message', '')
+        )
+        if not accepted:
             return Response(
                 {'error': 'Negotiation is not pending'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        response_message = request.data.get('response_message', '')
-        negotiation.status = Negotiation.STATUS_ACCEPTED
-        negotiation.response_message = response_message
-        negotiation.save()
-        
         return Response({'status': 'Negotiation accepted'})
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """Reject a negotiation proposal."""
-        negotiation = self.get_object()
-        
-        if negotiation.status != Negotiation.STATUS_PENDING:
+        rejected = apply_transition(
+            self.get_object(), 'reject', response_message=request.data.get('response_message', '')
+        )
+        if not rejected:
             return Response(
                 {'error': 'Negotiation is not pending'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        response_message = request.data.get('response_message', '')
-        negotiation.status = Negotiation.STATUS_REJECTED
-        negotiation.response_message = response_message
-        negotiation.save()
-        
         return Response({'status': 'Negotiation rejected'})
 
 
@@ -226,56 +264,52 @@ class ExecutionViewSet(viewsets.ModelViewSet):
         )
 
 
-class RankingsViewSet(viewsets.ViewSet):
+class RankingsViewSet(ReplicaReadMixin, viewsets.ViewSet):
     """
     View global rankings.
+    Read from per-user rollups (wishes.rankings) that include archived periods.
     """
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return ranking_queryset()
+
     @action(detail=False, methods=['get'])
     def most_completed(self, request):
         """Users with most completed wishes."""
-        rankings = User.objects.annotate(
-            total_completed=Count(
-                'assigned_wishes',
-                filter=Q(assigned_wishes__is_completed=True)
-            )
-        ).filter(
-            total_completed__gt=0
-        ).order_by('-total_completed')[:100]
-        
-        serializer = RankingSerializer(rankings, many=True)
+        serializer = RankingSerializer(ranking_queryset('most_completed'), many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def best_rated(self, request):
         """Users with best average rating."""
-        rankings = User.objects.annotate(
-            average_rating=Avg(
-                'assigned_wishes__execution__rating',
-                filter=Q(assigned_wishes__is_completed=True)
-            )
-        ).filter(
-            average_rating__isnull=False
-        ).order_by('-average_rating')[:100]
-        
-        serializer = RankingSerializer(rankings, many=True)
+        serializer = RankingSerializer(ranking_queryset('best_rated'), many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def fastest_completion(self, request):
         """Users with fastest average completion time."""
-        rankings = User.objects.annotate(
-            average_completion_days=Avg(
-                ExpressionWrapper(
-                    F('assigned_wishes__execution__completed_date') - F('assigned_wishes__assigned_at'),
-                    output_field=django_fields.DurationField()
-                ),
-                filter=Q(assigned_wishes__is_completed=True)
-            )
-        ).filter(
-            average_completion_days__isnull=False
-        ).order_by('average_completion_days')[:100]
-        
-        serializer = RankingSerializer(rankings, many=True)
+        serializer = RankingSerializer(ranking_queryset('fastest_completion'), many=True)
         return Response(serializer.data)
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Download everything stored about the current user as NDJSON, streamed
+    as it is read (see wishes.export). ?archive=zip compresses it on the fly.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        chunks = export_lines(request.user)
+        filename = f'fantasy-life-export-{timezone.localdate().isoformat()}'
+        if request.query_params.get('archive') == 'zip':
+            chunks = zipped(chunks, f'{filename}.ndjson')
+            content_type, filename = 'application/zip', f'{filename}.zip'
+        else:
+            content_type, filename = 'application/x-ndjson', f'{filename}.ndjson'
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
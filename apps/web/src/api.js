@@ -21,6 +21,28 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// Refresh tokens are single-use, so concurrent 401s share one refresh call
+let refreshPromise = null;
+
+const refreshTokens = (refreshToken) => {
+  if (!refreshPromise) {
+    refreshPromise = axios
+      .post(`${API_BASE_URL}/api/token/refresh/`, { refresh: refreshToken })
+      .then((response) => {
+        const { access, refresh } = response.data;
+        localStorage.setItem('access_token', access);
+        if (refresh) {
+          localStorage.setItem('refresh_token', refresh);
+        }
+        return access;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Handle token refresh on 401
 api.interceptors.response.use(
   (response) => response,
@@ -33,12 +55,7 @@ api.interceptors.response.use(
       const refreshToken = localStorage.getItem('refresh_token');
       if (refreshToken) {
         try {
-          const response = await axios.post(`${API_BASE_URL}/api/token/refresh/`, {
-            refresh: refreshToken,
-          });
-          
-          const { access } = response.data;
-          localStorage.setItem('access_token', access);
+          const access = await refreshTokens(refreshToken);
           originalRequest.headers.Authorization = `Bearer ${access}`;
           
           return api(originalRequest);
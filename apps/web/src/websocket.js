@@ -6,6 +6,7 @@ class WebSocketManager {
     this.shouldReconnect = true;
   }
 
+  // url may be a function, called again on every reconnect (e.g. to pick up a fresh token)
   connect(url) {
     if (this.ws?.readyState === WebSocket.OPEN) {
       console.log('WebSocket already connected');
@@ -13,7 +14,7 @@ class WebSocketManager {
     }
 
     try {
-      this.ws = new WebSocket(url);
+      this.ws = new WebSocket(typeof url === 'function' ? url() : url);
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -44,6 +45,12 @@ class WebSocketManager {
     }
   }
 
+  // Live match, assignment, negotiation and execution events for the logged-in user
+  connectEvents(apiBaseUrl) {
+    const wsBaseUrl = apiBaseUrl.replace(/^http/, 'ws');
+    this.connect(() => `${wsBaseUrl}/ws/events/?token=${localStorage.getItem('access_token')}`);
+  }
+
   send(data) {
     if (this.ws?.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify(data));